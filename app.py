@@ -7,76 +7,346 @@ Module: app.py
 
 Description:
 This module serves as the entry point for the QuizBoutiqueBot application.
+
+Usage:
+    python app.py
+    python app.py --config /path/to/configs --startup-profile
 """
 
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler
+import time
+
+# Start of the start-up profile, before the imports below
+_started = time.perf_counter()
+
+from telegram import Update
+from telegram.request import HTTPXRequest
+from telegram.ext import (
+    Application, CommandHandler, CallbackQueryHandler, PollAnswerHandler, TypeHandler
+)
 from utils.initializer import Loader
 from modules.telegram.handlers import BotHandler
-from utils.database import BotDatabase
+from modules.telegram.polls import PollSessionIndex
+from modules.telegram.throttling import FloodGuard, AdmissionControlProcessor
+from modules.telegram.sessions import SessionSweeper
+from modules.telegram.persistence import SessionPersistence
+from modules.telegram.quizzes import resume_quiz_timers
+from modules.telegram.cluster import run_cluster, serve_worker
+from modules.telegram.lifecycle import serve_polling
+from utils.database import open_database, tuning_pragmas
+from utils.maintenance import DatabaseMaintenance
+from utils.backup import backup_from_config
+from utils.metrics import BotMetrics, InstrumentedRequest, MetricsServer, instrument_database
+from utils.tracing import TracedRequest, trace_database, tracer_from_config
+from utils.logger import EventLogger
+from utils.loop_monitor import loop_monitor_from_config
+from utils.profiler import profiler_from_config
+from utils.recorder import recorder_from_config
+from utils.tasks import TaskSupervisor
+from utils.question_store import QuestionStoreManager
+from utils.startup import StartupProfile, print_profile
+from collections import Counter
+from functools import partial
+from typing import Optional
+import argparse
 import sys
+import signal
 import asyncio
 
 
+def build_application(config, logger, localization, questions_directory, parse_mode,
+                      telegram_token, shard=None, request=None) -> Application:
+    """
+    Builds the Telegram application with its database, handlers and background jobs.
+
+    Args:
+        config (Dict[str, Any]): The bot's configuration dictionary.
+        logger: Logger instance.
+        localization (Localization): Default localization.
+        questions_directory (Path): Path to the questions directory.
+        parse_mode (str): Default parse mode.
+        telegram_token (str): Bot token.
+        shard (Optional[Tuple[int, int]]): (worker index, worker count) when running as a
+            cluster worker fed by the dispatcher; None for standalone polling.
+        request (Optional[BaseRequest]): Bot API transport; benchmarks pass an
+            in-process fake, None uses the default HTTP client.
+
+    Returns:
+        Application: The configured application.
+    """
+    # Create an instance of the BotHandler with the necessary components
+    bot_handler = BotHandler(config, logger, localization, questions_directory)
+
+    # Enforce database enabled and prepare defaults
+    db_cfg = config.get('database', {})
+    if not db_cfg.get('db_enabled', True):
+        logger.error("Database is disabled in configuration. This application requires DB enabled.")
+        sys.exit(1)
+
+    default_settings = {
+        'questions_count': config['base_settings']['questions_count'][0],
+        'timer_enabled': config['base_settings']['timer_enabled'],
+        'timer_limit': config['base_settings']['timer_limit'][0],
+        'questions_random_enabled': config['base_settings']['questions_random_enabled'],
+    }
+    db_path = db_cfg.get('db_source', 'data/db/qbb.db')
+    success_rate = config['base_settings']['success_rate']
+    pragmas = tuning_pragmas(db_cfg.get('tuning_profile', 'balanced'), db_cfg.get('pragmas'))
+    bot_db = open_database(db_path=db_path, shards=db_cfg.get('shards', 1),
+                           success_rate=success_rate, default_settings=default_settings,
+                           pragmas=pragmas)
+    # Every cluster worker opens the same files; file-wide jobs run in worker 0 only
+    owns_files = shard is None or shard[0] == 0
+    maintenance_cfg = db_cfg.get('maintenance', {})
+    db_maintenance = DatabaseMaintenance(
+        bot_db,
+        logger,
+        interval=maintenance_cfg.get('interval', 3600),
+        checkpoint=maintenance_cfg.get('checkpoint', 'PASSIVE'),
+        retention_days=maintenance_cfg.get('retention_days', 0) if owns_files else 0,
+        batch_size=maintenance_cfg.get('batch_size', 500),
+        batch_pause=maintenance_cfg.get('batch_pause', 0.05),
+        vacuum_pages=maintenance_cfg.get('vacuum_pages', 2000),
+    )
+
+    tasks_cfg = config.get('tasks', {})
+    task_supervisor = TaskSupervisor(
+        logger,
+        max_per_owner=tasks_cfg.get('max_per_owner', 4),
+        max_total=tasks_cfg.get('max_total', 10000),
+    )
+
+    sessions_cfg = config.get('sessions', {})
+    session_sweeper = SessionSweeper(
+        logger,
+        idle_ttl=sessions_cfg.get('idle_ttl', 1800),
+        interval=sessions_cfg.get('sweep_interval', 60),
+    )
+
+    store_cfg = config.get('question_store', {})
+    question_store = None
+    if store_cfg.get('enabled', True):
+        question_store = QuestionStoreManager(
+            questions_directory,
+            store_cfg.get('cache_directory', 'data/cache'),
+            logger,
+            check_interval=store_cfg.get('check_interval', 30),
+        )
+
+    database_backup = None
+    if db_cfg.get('backup', {}).get('enabled', True) and owns_files:
+        database_backup = backup_from_config(config, logger)
+
+    metrics_cfg = config.get('metrics', {})
+    bot_metrics = metrics_server = None
+    if metrics_cfg.get('enabled', True):
+        bot_metrics = BotMetrics()
+        instrument_database(bot_db, bot_metrics)
+        # Cluster workers listen on consecutive ports
+        metrics_server = MetricsServer(
+            bot_metrics.registry, logger,
+            host=metrics_cfg.get('host', '127.0.0.1'),
+            port=int(metrics_cfg.get('port', 9464)) + (shard[0] if shard else 0),
+        )
+
+    # Event loop lag and the stacks of calls blocking it, in every process
+    loop_monitor = loop_monitor_from_config(config, logger)
+
+    # On-demand profiling: /profile from the admin chat, or SIGUSR2
+    profiler = profiler_from_config(config, logger)
+
+    def _profile_on_signal() -> None:
+        if profiler.running:
+            logger.warning(f"SIGUSR2 ignored, a {profiler.running} profiling session is running")
+            return
+        task_supervisor.spawn(profiler.profile(), owner="diagnostics", kind="profiler")
+
+    # Anonymized recording of incoming updates, for replay tests
+    recorder = recorder_from_config(config, logger)
+
+    # Span traces of handled updates, sampled into the log and a JSONL file
+    tracer = tracer_from_config(config, logger, shard)
+    if tracer:
+        trace_database(bot_db)
+
+    def _transport(inner):
+        if bot_metrics:
+            inner = InstrumentedRequest(inner, bot_metrics)
+        return TracedRequest(inner) if tracer else inner
+
+    async def _post_init(app: Application) -> None:
+        # Fail-fast on DB init errors
+        await bot_db.init()
+        app.bot_data['db'] = bot_db
+        resumed = resume_quiz_timers(app)
+        if resumed:
+            logger.info(f"Resumed {resumed} quiz timers from persisted sessions")
+        task_supervisor.spawn(session_sweeper.run(app), owner="sessions",
+                              kind="session_sweeper")
+        if question_store:
+            question_store.current()
+            task_supervisor.spawn(question_store.run(), owner="questions",
+                                  kind="question_store")
+        task_supervisor.spawn(db_maintenance.run(), owner="database",
+                              kind="database_maintenance")
+        if database_backup:
+            task_supervisor.spawn(database_backup.run(), owner="database",
+                                  kind="database_backup")
+        if metrics_server:
+            task_supervisor.spawn(metrics_server.run(), owner="metrics", kind="metrics_server")
+        if loop_monitor:
+            task_supervisor.spawn(loop_monitor.run(), owner="diagnostics", kind="loop_monitor")
+        if recorder:
+            task_supervisor.spawn(recorder.run(), owner="recording", kind="update_recorder")
+        if profiler and hasattr(signal, 'SIGUSR2'):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, _profile_on_signal)
+
+    async def _post_shutdown(app: Application) -> None:
+        if profiler and hasattr(signal, 'SIGUSR2'):
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR2)
+        await task_supervisor.shutdown()
+        await bot_db.close()
+        if tracer:
+            tracer.close()
+        if recorder:
+            recorder.close()
+
+    # Initialize the Telegram application with the bot token
+    builder = (
+        Application
+        .builder()
+        .token(telegram_token)
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+    )
+    api_base_url = config['telegram'].get('api_base_url')
+    if api_base_url:
+        # A local Bot API server, or the fake one load tests run against
+        api_base_url = api_base_url.rstrip('/')
+        builder = builder.base_url(f"{api_base_url}/bot").base_file_url(f"{api_base_url}/file/bot")
+    if bot_metrics or tracer:
+        # The transports the builder would create by default, timed per Bot API method
+        builder = (builder
+                   .request(_transport(request or HTTPXRequest(connection_pool_size=256)))
+                   .get_updates_request(_transport(request or HTTPXRequest())))
+    elif request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    if shard is not None:
+        # Updates arrive from the cluster dispatcher instead of getUpdates
+        builder = builder.updater(None)
+
+    # Crash-safe storage of running quiz sessions
+    if db_cfg.get('persist_sessions', True):
+        builder = builder.persistence(SessionPersistence(
+            bot_db, update_interval=db_cfg.get('persistence_interval', 10), shard=shard))
+
+    # Flood protection and admission control ahead of the regular handlers
+    throttling_cfg = config.get('throttling', {})
+    rejections = Counter()
+    flood_guard = None
+    if throttling_cfg.get('enabled', True):
+        update_processor = AdmissionControlProcessor(
+            max_concurrent_updates=throttling_cfg.get('max_concurrent_updates', 8),
+            max_backlog=throttling_cfg.get('max_backlog', 200),
+            rejections=rejections,
+        )
+        builder = builder.concurrent_updates(update_processor)
+        flood_guard = FloodGuard(rate=throttling_cfg.get('user_rate', 2.0),
+                                 burst=throttling_cfg.get('user_burst', 5),
+                                 rejections=rejections)
+    application = builder.build()
+    if recorder:
+        application.add_handler(TypeHandler(Update, recorder.record), group=-3)
+    if bot_metrics:
+        application.add_handler(TypeHandler(Update, bot_metrics.count_update), group=-2)
+    if flood_guard:
+        application.add_handler(TypeHandler(Update, flood_guard.check), group=-1)
+
+    # Add command and callback handlers
+    application.add_handler(CommandHandler("start", bot_handler.start))
+    application.add_handler(CommandHandler("history", bot_handler.history))
+    application.add_handler(CommandHandler("profile", bot_handler.profile))
+    application.add_handler(CallbackQueryHandler(bot_handler.button))
+    application.add_handler(PollAnswerHandler(bot_handler.poll_answer))
+
+    # Pass configuration, logger, and default localization to bot_data for global access
+    application.bot_data['config'] = config
+    application.bot_data['logger'] = logger
+    application.bot_data['events'] = EventLogger(logger, config.get('logging', {}))
+    application.bot_data['localization'] = localization  # default fallback
+    application.bot_data['parse_mode'] = parse_mode
+    application.bot_data['rejections'] = rejections
+    application.bot_data['tasks'] = task_supervisor
+    application.bot_data['session_sweeper'] = session_sweeper
+    application.bot_data['question_store'] = question_store
+    application.bot_data['poll_index'] = PollSessionIndex(
+        ttl_seconds=config['telegram'].get('poll_ttl', 3600))
+    application.bot_data['metrics'] = bot_metrics
+    application.bot_data['tracer'] = tracer
+    application.bot_data['loop_monitor'] = loop_monitor
+    application.bot_data['profiler'] = profiler
+    application.bot_data['recorder'] = recorder
+    if bot_metrics:
+        bot_metrics.watch(application, db_maintenance, database_backup)
+    return application
+
+
+def run_worker(index: int, count: int, socket_path: str,
+               config_directory: Optional[str] = None) -> None:
+    """
+    Entry point of a cluster worker process.
+
+    Args:
+        index (int): Worker index (shard).
+        count (int): Number of workers.
+        socket_path (str): Unix socket the dispatcher forwards updates to.
+        config_directory (Optional[str]): Directory holding config.yml; the
+            default `configs` directory when None.
+    """
+    loader = Loader(config_directory)
+    config, logger, proxy_handler, localization, telegram_token, telegram_chat_id, questions_directory, parse_mode = loader.initialize()
+    application = build_application(config, logger, localization, questions_directory,
+                                    parse_mode, telegram_token, shard=(index, count))
+    logger.info(f"Worker {index}/{count} started")
+    asyncio.run(serve_worker(application, socket_path))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="QuizBoutiqueBot")
+    parser.add_argument('--config', help="Directory holding config.yml (default: configs/)")
+    parser.add_argument('--startup-profile', action='store_true',
+                        help="Start a single process, print the time each start-up stage "
+                             "took and the slowest imports, then shut down")
+    return parser.parse_args()
+
+
 def main() -> None:
     """
     Main function to initialize and start the Telegram bot application.
     """
+    args = parse_args()
+    profile = StartupProfile(_started)
+    profile.add('imports', _started, time.perf_counter())
     logger = None  # Initialize logger to ensure it's always defined
     try:
         # Initialize the loader to set up configuration, logging, proxy, and localization
-        loader = Loader()
+        loader = Loader(args.config, profile)
         config, logger, proxy_handler, localization, telegram_token, telegram_chat_id, questions_directory, parse_mode = loader.initialize()
 
-        # Create an instance of the BotHandler with the necessary components
-        bot_handler = BotHandler(config, logger, localization, questions_directory)
-
-        # Enforce database enabled and prepare defaults
-        db_cfg = config.get('database', {})
-        if not db_cfg.get('db_enabled', True):
-            logger.error("Database is disabled in configuration. This application requires DB enabled.")
-            sys.exit(1)
-
-        default_settings = {
-            'questions_count': config['base_settings']['questions_count'][0],
-            'timer_enabled': config['base_settings']['timer_enabled'],
-            'timer_limit': config['base_settings']['timer_limit'][0],
-            'questions_random_enabled': config['base_settings']['questions_random_enabled'],
-        }
-        db_path = db_cfg.get('db_source', 'data/db/qbb.db')
-        success_rate = config['base_settings']['success_rate']
-        bot_db = BotDatabase(db_path=db_path, success_rate=success_rate, default_settings=default_settings)
-
-        async def _post_init(app: Application) -> None:
-            # Fail-fast on DB init errors
-            await bot_db.init()
-            app.bot_data['db'] = bot_db
-
-        async def _post_shutdown(app: Application) -> None:
-            await bot_db.close()
-
-        # Initialize the Telegram application with the bot token
-        application = (
-            Application
-            .builder()
-            .token(telegram_token)
-            .post_init(_post_init)
-            .post_shutdown(_post_shutdown)
-            .build()
-        )
-
-        # Add command and callback handlers
-        application.add_handler(CommandHandler("start", bot_handler.start))
-        application.add_handler(CallbackQueryHandler(bot_handler.button))
+        # Multi-process mode: webhook dispatcher in front of sharded workers
+        if int(config.get('cluster', {}).get('workers', 1)) > 1 and not args.startup_profile:
+            logger.info("Application started in cluster mode")
+            asyncio.run(run_cluster(config, logger, telegram_token,
+                                    partial(run_worker, config_directory=args.config)))
+            return
 
-        # Pass configuration, logger, and default localization to bot_data for global access
-        application.bot_data['config'] = config
-        application.bot_data['logger'] = logger
-        application.bot_data['localization'] = localization  # default fallback
-        application.bot_data['parse_mode'] = parse_mode
+        with profile.stage('build'):
+            application = build_application(config, logger, localization, questions_directory,
+                                            parse_mode, telegram_token)
 
         logger.info("Application started")
-        application.run_polling()
-        logger.info("Polling started")
+        asyncio.run(serve_polling(application, profile, stop_when_started=args.startup_profile))
+        if args.startup_profile:
+            print_profile(profile)
 
     except Exception as e:
         # Log any exception that occurs during the initialization and starting process
@@ -0,0 +1,123 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/callback_dedupe.py
+
+Description:
+Counts Bot API and database calls saved by session-bound callback
+deduplication. Virtual users take a quiz while a jittery client re-delivers
+answer and "next" taps and replays taps on older question messages. The same
+delivery sequence is run twice: through the real handler, and with the dedupe
+check bypassed to reproduce the previous behaviour.
+
+Usage:
+    python -m benchmarks.callback_dedupe --users 50 --dup-rate 0.3 --stale-rate 0.1
+"""
+
+import argparse
+import asyncio
+import random
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.stubs import (
+    FakeBot, CountingDatabase, NullLogger, load_config, make_context, make_database,
+    make_update, make_user
+)
+from modules.telegram import handlers as handlers_module
+from modules.telegram.handlers import BotHandler
+from modules.telegram.quizzes import ANSWER_CALLBACK, NEXT_CALLBACK
+
+CATEGORY = "BSIS"
+QUIZ = "Powers to Arrest EN"
+
+
+def _no_dedupe(context, data):
+    parts = data.split('_', 3)
+    return parts[3] if len(parts) > 3 else ""
+
+
+def _plan(rng: random.Random, questions: int, dup_rate: float, stale_rate: float):
+    """
+    Builds the tap sequence for one user as (kind, question index, key) tuples.
+    """
+    def copies() -> int:
+        return 1 + (rng.randint(1, 3) if rng.random() < dup_rate else 0)
+
+    plan = []
+    for index in range(questions):
+        if index and rng.random() < stale_rate:
+            plan.append((ANSWER_CALLBACK, rng.randrange(index), rng.choice("ABCD")))
+        plan.extend([(ANSWER_CALLBACK, index, rng.choice("ABCD"))] * copies())
+        if index < questions - 1:
+            plan.extend([(NEXT_CALLBACK, index + 1, "")] * copies())
+    return plan
+
+
+async def _run_user(handler: BotHandler, context, user, calls: Counter, plan) -> int:
+    await handler.button(make_update(user, user.id, calls, f"quiz_{QUIZ}_{CATEGORY}"), context)
+    nonce = context.user_data['quiz_nonce']
+    for kind, index, key in plan:
+        data = f"{kind}_{nonce}_{index}" + (f"_{key}" if key else "")
+        await handler.button(make_update(user, user.id, calls, data), context)
+    return len(plan)
+
+
+async def run(users: int, dup_rate: float, stale_rate: float, seed: int,
+              dedupe: bool) -> Counter:
+    config = load_config()
+    config['telegram']['quiz_delivery'] = 'buttons'
+    calls: Counter = Counter()
+    original = handlers_module.claim_session_callback
+    if not dedupe:
+        handlers_module.claim_session_callback = _no_dedupe
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = make_database(Path(tmp) / 'bench.db', config)
+            await db.init()
+            handler = BotHandler(config, NullLogger(), None, Path('data/questions'))
+            rng = random.Random(seed)
+            questions = config['base_settings']['questions_count'][0]
+            taps = 0
+            for telegram_id in range(1, users + 1):
+                context = make_context(config, CountingDatabase(db, calls), FakeBot(calls))
+                plan = _plan(rng, questions, dup_rate, stale_rate)
+                taps += await _run_user(handler, context, make_user(telegram_id), calls, plan)
+            await db.close()
+    finally:
+        handlers_module.claim_session_callback = original
+    calls['taps'] = taps
+    return calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--dup-rate', type=float, default=0.3,
+                        help="Probability that a tap is re-delivered 1-3 extra times")
+    parser.add_argument('--stale-rate', type=float, default=0.1,
+                        help="Probability of a tap on an older question message")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    legacy = asyncio.run(run(args.users, args.dup_rate, args.stale_rate, args.seed, dedupe=False))
+    deduped = asyncio.run(run(args.users, args.dup_rate, args.stale_rate, args.seed, dedupe=True))
+
+    keys = sorted(k for k in set(legacy) | set(deduped) if k != 'taps')
+    print(f"{'call':<28}{'no dedupe':>12}{'dedupe':>12}{'saved':>12}")
+    for key in keys:
+        print(f"{key:<28}{legacy[key]:>12}{deduped[key]:>12}{legacy[key] - deduped[key]:>12}")
+    api = [k for k in keys if not k.startswith('db.')]
+    db = [k for k in keys if k.startswith('db.')]
+    for label, group in (("API calls", api), ("DB calls", db)):
+        before = sum(legacy[k] for k in group)
+        after = sum(deduped[k] for k in group)
+        print(f"{label:<28}{before:>12}{after:>12}{before - after:>12}")
+    print(f"taps delivered: {deduped['taps']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/cluster_scaling.py
+
+Description:
+Local multi-process load test for cluster mode. For each worker count the real
+WebhookDispatcher and WorkerSupervisor are started; every worker runs the real
+BotHandler against a shared SQLite database (WAL) with a stub Bot. Virtual users
+take a quiz through webhook POSTs sent over several keep-alive connections, like
+Telegram does, and throughput is measured until every update has been handled.
+Speedup should stay close to the worker count up to the number of cores.
+
+Usage:
+    python -m benchmarks.cluster_scaling --users 200 --max-workers 4
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.stubs import (
+    FakeBot, NullLogger, load_config, make_context, make_database, make_update, make_user
+)
+from modules.telegram.cluster import WebhookDispatcher, WorkerSupervisor, serve_updates
+from modules.telegram.handlers import BotHandler
+from modules.telegram.quizzes import session_callback, ANSWER_CALLBACK, NEXT_CALLBACK
+
+CATEGORY = "BSIS"
+QUIZ = "Powers to Arrest EN"
+
+
+async def _serve_bench_worker(counters, db_path: str, index: int, socket_path: str) -> None:
+    config = load_config()
+    config['telegram']['quiz_delivery'] = 'buttons'
+    config['base_settings']['timer_enabled'] = False
+    calls: Counter = Counter()
+    bot = FakeBot(calls)
+    db = make_database(Path(db_path), config)
+    await db.init()
+    handler = BotHandler(config, NullLogger(), None, Path('data/questions'))
+    contexts = {}
+    chains = {}
+
+    async def process(previous, data) -> None:
+        if previous is not None:
+            await previous
+        query = data['callback_query']
+        user_id = query['from']['id']
+        context = contexts.setdefault(user_id, make_context(config, db, bot))
+        # The client cannot know the session nonce, so taps are bound here
+        payload = query['data']
+        if payload == ANSWER_CALLBACK:
+            payload = session_callback(context, ANSWER_CALLBACK, "A")
+        elif payload == NEXT_CALLBACK:
+            payload = session_callback(context, NEXT_CALLBACK)
+        await handler.button(make_update(make_user(user_id), user_id, calls, payload), context)
+        counters[index] += 1
+
+    async def handle(data) -> None:
+        # Keep each user's updates in order, like AdmissionControlProcessor does
+        user_id = data['callback_query']['from']['id']
+        task = asyncio.create_task(process(chains.get(user_id), data))
+        chains[user_id] = task
+        task.add_done_callback(lambda t: chains.pop(user_id, None) if chains.get(user_id) is t
+                               else None)
+
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    await serve_updates(socket_path, handle, stop)
+    await db.close()
+
+
+def bench_worker(counters, db_path: str, index: int, count: int, socket_path: str) -> None:
+    asyncio.run(_serve_bench_worker(counters, db_path, index, socket_path))
+
+
+def build_bodies(users: int, questions: int):
+    """
+    Returns the webhook bodies of each user's quiz, in order.
+    """
+    update_id = 0
+    per_user = {}
+    for user_id in range(1, users + 1):
+        taps = [f"quiz_{QUIZ}_{CATEGORY}"]
+        for index in range(questions):
+            taps.append(ANSWER_CALLBACK)
+            if index < questions - 1:
+                taps.append(NEXT_CALLBACK)
+        bodies = []
+        for data in taps:
+            update_id += 1
+            bodies.append(json.dumps({
+                'update_id': update_id,
+                'callback_query': {'id': str(update_id), 'chat_instance': "bench", 'data': data,
+                                   'from': {'id': user_id, 'is_bot': False,
+                                            'first_name': "Bench"}},
+            }).encode())
+        per_user[user_id] = bodies
+    return per_user
+
+
+async def post_all(port: int, bodies) -> None:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for body in bodies:
+        writer.write(b"POST /webhook HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                     + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+        status = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b""):
+            pass
+        if b" 200 " not in status:
+            raise RuntimeError(f"Dispatcher returned {status!r}")
+    writer.close()
+
+
+async def measure(workers: int, users: int, questions: int, connections: int) -> float:
+    context = multiprocessing.get_context("spawn")
+    counters = context.RawArray('q', workers)
+    per_user = build_bodies(users, questions)
+    total = sum(len(bodies) for bodies in per_user.values())
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / 'cluster.db')
+        # Migrate once up front so worker start-up is not part of the measurement
+        db = make_database(Path(db_path), load_config())
+        await db.init()
+        await db.close()
+        socket_paths = [os.path.join(tmp, f"worker-{index}.sock") for index in range(workers)]
+        supervisor = WorkerSupervisor(functools.partial(bench_worker, counters, db_path),
+                                      socket_paths, NullLogger())
+        supervisor.start()
+        try:
+            while not all(os.path.exists(path) for path in socket_paths):
+                await asyncio.sleep(0.05)
+            dispatcher = WebhookDispatcher(socket_paths, NullLogger())
+            server = await dispatcher.start('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+
+            # Users are pinned to a connection, so their updates stay in order
+            lanes = [[] for _ in range(connections)]
+            for user_id, bodies in per_user.items():
+                lanes[user_id % connections].extend(bodies)
+            started = time.perf_counter()
+            await asyncio.gather(*(post_all(port, lane) for lane in lanes if lane))
+            while sum(counters) < total:
+                await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - started
+            server.close()
+            await server.wait_closed()
+            dispatcher.close()
+        finally:
+            await asyncio.to_thread(supervisor.stop)
+    return total / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--questions', type=int, default=5)
+    parser.add_argument('--connections', type=int, default=40,
+                        help="Concurrent webhook connections (Telegram's max_connections)")
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(f"cores: {os.cpu_count()}")
+    print(f"{'workers':>8}{'updates/s':>12}{'speedup':>10}{'efficiency':>12}")
+    baseline = None
+    for workers in range(1, args.max_workers + 1):
+        rate = asyncio.run(measure(workers, args.users, args.questions, args.connections))
+        baseline = baseline or rate
+        speedup = rate / baseline
+        print(f"{workers:>8}{rate:>12.0f}{speedup:>10.2f}{speedup / workers:>12.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/cold_start.py
+
+Description:
+Start-up time check of the bot as a container restart sees it: `python app.py`
+is started as a new process with the shipped configuration (database and
+caches in a temporary directory, FakeBotAPIServer as its Bot API) and the
+clock stops when its first getUpdates reaches the fake, i.e. when it would
+start answering users. The bot runs with --startup-profile, so it shuts down
+right after.
+
+The first run is a first boot: the database is created and the question store
+compiled. The following --runs are restarts on the same files, which is what
+the --budget applies to: the run fails (exit status 1) when their median
+exceeds it. File contents stay in the OS page cache between runs; restarts on
+a freshly booted host read them from disk and take longer.
+
+Usage:
+    python -m benchmarks.cold_start
+    python -m benchmarks.cold_start --runs 10 --budget 1.5 --show-profile
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import yaml
+
+from benchmarks.fake_api import FakeBotAPI, FakeBotAPIServer
+from benchmarks.load_test import bot_config
+
+ROOT = Path(__file__).parent.parent
+
+
+async def start_once(api: FakeBotAPI, config_directory: Path,
+                     timeout: float) -> Tuple[float, str]:
+    """
+    Starts the bot and waits for it to exit.
+
+    Returns:
+        Tuple[float, str]: Seconds until the first getUpdates, and the bot's
+            standard output (its start-up profile).
+    """
+    polls = api.calls['getUpdates']
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "app.py", "--config", str(config_directory), "--startup-profile",
+        cwd=ROOT, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+    output = asyncio.ensure_future(process.stdout.read())
+    try:
+        while api.calls['getUpdates'] == polls:
+            if process.returncode is not None or time.perf_counter() - started > timeout:
+                raise RuntimeError(f"The bot did not poll within {timeout:.0f}s:\n"
+                                   + (await output).decode(errors='replace')[-2000:])
+            await asyncio.sleep(0.005)
+        ready = time.perf_counter() - started
+        await asyncio.wait_for(process.wait(), timeout)
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    return ready, (await output).decode(errors='replace')
+
+
+async def run(args: argparse.Namespace, tmp: Path) -> Dict[str, Any]:
+    api = FakeBotAPI()
+    server = FakeBotAPIServer(api)
+    await server.start()
+    config = bot_config(tmp, server.url)
+    config['telegram']['token'] = "123:fake"
+    config.setdefault('proxy_settings', {})['proxy_enabled'] = False
+    config['base_settings']['auto_reload_config_enabled'] = False
+    config['cluster'] = {'workers': 1}
+    config_directory = tmp / 'configs'
+    config_directory.mkdir()
+    with open(config_directory / 'config.yml', 'w', encoding='utf-8') as file:
+        yaml.safe_dump(config, file, allow_unicode=True, sort_keys=False)
+
+    try:
+        first_boot, output = await start_once(api, config_directory, args.timeout)
+        print(f"first boot   {first_boot * 1000:>8.0f} ms", flush=True)
+        restarts: List[float] = []
+        for index in range(args.runs):
+            ready, output = await start_once(api, config_directory, args.timeout)
+            restarts.append(ready)
+            print(f"restart {index + 1:<4} {ready * 1000:>8.0f} ms", flush=True)
+    finally:
+        await server.close()
+    return {'first_boot': first_boot, 'restarts': restarts, 'output': output}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5, help="Restarts measured")
+    parser.add_argument('--budget', type=float, default=2.0,
+                        help="Seconds the median restart may take until the first getUpdates")
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help="Seconds a start may take before the run is aborted")
+    parser.add_argument('--show-profile', action='store_true',
+                        help="Print the last restart's --startup-profile output")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = asyncio.run(run(args, Path(tmp)))
+    if args.show_profile:
+        print(f"\n{result['output']}")
+
+    restarts = result['restarts']
+    median = statistics.median(restarts)
+    print(f"\nrestart median {median * 1000:.0f} ms, max {max(restarts) * 1000:.0f} ms "
+          f"(budget {args.budget * 1000:.0f} ms)")
+    if median > args.budget:
+        print(f"\nFAIL: median restart {median:.2f}s exceeds the {args.budget:g}s budget")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
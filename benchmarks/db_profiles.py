@@ -0,0 +1,153 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/db_profiles.py
+
+Description:
+Replays the same synthetic database workload against each SQLite tuning
+profile (database.tuning_profile). Concurrent clients pick random users and
+issue the calls the handlers make: user bootstrap (get_or_create_user), a
+settings update, a quiz attempt insert and a stats read. The database is
+seeded with attempt history first so stats reads scan realistic indexes.
+Reports ops/sec and p50/p99 latency overall and p99 per operation, plus the
+time of one maintenance run (PRAGMA optimize + WAL checkpoint).
+
+Usage:
+    python -m benchmarks.db_profiles --ops 20000 --concurrency 32
+    python -m benchmarks.db_profiles --profiles durable,balanced
+"""
+
+import argparse
+import asyncio
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List
+
+from benchmarks.stubs import NullLogger, load_config
+from utils.database import BotDatabase, TUNING_PROFILES, tuning_pragmas
+from utils.maintenance import DatabaseMaintenance
+
+# Share of each operation once a user exists; new users always bootstrap first
+MIX = {'bootstrap': 0.3, 'settings': 0.1, 'attempt': 0.3, 'stats': 0.3}
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def seed_history(db_path: Path, users: int, attempts: int, rng: random.Random) -> None:
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("INSERT INTO users (id, telegram_id) VALUES (?, ?)",
+                         [(user_id, user_id) for user_id in range(1, users + 1)])
+        conn.executemany("INSERT INTO user_settings (user_id, questions_count) VALUES (?, 10)",
+                         [(user_id,) for user_id in range(1, users + 1)])
+        conn.executemany(
+            "INSERT INTO quiz_attempts (user_id, category, quiz_name, total_questions, "
+            "correct_count, success_rate, passed, started_at, finished_at, duration_seconds) "
+            "VALUES (?, 'BSIS', 'Powers to Arrest EN', 10, ?, ?, ?, ?, ?, 60)",
+            [(rng.randint(1, users), correct, correct * 10.0, int(correct >= 8),
+              "2024-01-01T00:00:00Z", "2024-01-01T00:01:00Z")
+             for correct in (rng.randint(0, 10) for _ in range(attempts))])
+
+
+async def run_profile(profile: str, directory: Path, users: int, history: int, ops: int,
+                      concurrency: int, config) -> Dict[str, object]:
+    base = config['base_settings']
+    db_path = directory / f"{profile}.db"
+    db = BotDatabase(str(db_path), base['success_rate'],
+                     {'questions_count': base['questions_count'][0], 'timer_enabled': False,
+                      'timer_limit': base['timer_limit'][0],
+                      'questions_random_enabled': base['questions_random_enabled']},
+                     pragmas=tuning_pragmas(profile))
+    await db.init()
+    await db.close()
+    seed_history(db_path, users, history, random.Random(1))
+    await db.init()
+
+    latencies: Dict[str, List[float]] = {kind: [] for kind in MIX}
+    known: Dict[int, int] = {}
+    remaining = ops
+
+    async def client(seed: int) -> None:
+        nonlocal remaining
+        rng = random.Random(seed)
+        kinds, weights = list(MIX), list(MIX.values())
+        while remaining > 0:
+            remaining -= 1
+            # Each client owns every concurrency-th user, as a user's updates are
+            # handled one after another; ids above the seeded range are new users
+            telegram_id = rng.randrange(seed + 1, users * 2 + 1, concurrency)
+            kind = rng.choices(kinds, weights)[0] if telegram_id in known else 'bootstrap'
+            started = time.perf_counter()
+            if kind == 'bootstrap':
+                tg_user = SimpleNamespace(id=telegram_id, username=None, first_name="Sim",
+                                          last_name=None, language_code="en")
+                known[telegram_id] = await db.get_or_create_user(tg_user, "en")
+            elif kind == 'settings':
+                await db.update_user_settings(known[telegram_id], last_quiz="Powers to Arrest EN",
+                                              last_category="BSIS")
+            elif kind == 'attempt':
+                await db.save_quiz_attempt(known[telegram_id], "BSIS", "Powers to Arrest EN", 10,
+                                           rng.randint(0, 10), duration_seconds=60)
+            else:
+                await db.get_user_stats(known[telegram_id])
+            latencies[kind].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(seed) for seed in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    maintenance = (await DatabaseMaintenance(db, NullLogger()).run_once())['seconds']
+    await db.close()
+
+    samples = [sample for kind_samples in latencies.values() for sample in kind_samples]
+    return {
+        'ops_per_sec': len(samples) / elapsed,
+        'p50': percentile(samples, 0.50),
+        'p99': percentile(samples, 0.99),
+        'kinds': {kind: (len(kind_samples), percentile(kind_samples, 0.99))
+                  for kind, kind_samples in latencies.items()},
+        'maintenance': maintenance,
+    }
+
+
+async def run(profiles: List[str], users: int, history: int, ops: int, concurrency: int) -> None:
+    config = load_config()
+    print(f"{ops} ops, {concurrency} clients, {users} seeded users, {history} seeded attempts")
+    print(f"{'profile':<11} {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>8}  "
+          + "  ".join(f"{kind + ' p99':>13}" for kind in MIX) + "  optimize ms")
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in profiles:
+            result = await run_profile(profile, Path(tmp), users, history, ops, concurrency,
+                                       config)
+            print(f"{profile:<11} {result['ops_per_sec']:>8.0f} {result['p50'] * 1000:>8.2f} "
+                  f"{result['p99'] * 1000:>8.2f}  "
+                  + "  ".join(f"{p99 * 1000:>13.2f}" for _, p99 in result['kinds'].values())
+                  + f"  {result['maintenance'] * 1000:>11.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--profiles', default=",".join(TUNING_PROFILES),
+                        help="Comma-separated tuning profiles to compare")
+    parser.add_argument('--users', type=int, default=5000, help="Users seeded before the run")
+    parser.add_argument('--history', type=int, default=200000,
+                        help="Quiz attempts seeded before the run")
+    parser.add_argument('--ops', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+    profiles = [profile.strip() for profile in args.profiles.split(",") if profile.strip()]
+    for profile in profiles:
+        tuning_pragmas(profile)
+    asyncio.run(run(profiles, args.users, args.history, args.ops, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,519 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/fake_api.py
+
+Description:
+This module provides FakeBotAPI, a stand-in for the Telegram Bot API, and
+scripted users driving it. The fake serves getUpdates from updates the
+simulated users produce (tracking which ones the bot confirmed through the
+offset, as Telegram does), keeps the messages and inline keyboards each chat
+currently shows and answers the other methods the bot uses, optionally after a
+latency and with a share of calls refused with 429 Too Many Requests.
+
+The fake is plugged into a real Application either in-process, as its request
+backend, or over HTTP through FakeBotAPIServer, which serves the Bot API URL
+layout (/bot<token>/<method>) for a bot started with `telegram.api_base_url`
+pointing at it. Simulated users read the buttons on screen and tap them like a
+person would.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': "Fake", 'username': "fake_bot"}
+
+# Messages kept per chat; older ones scroll out of the simulated users' view
+MAX_CHAT_MESSAGES = 10
+
+
+class FakeBotAPI(BaseRequest):
+    """
+    Bot API stand-in for Application.builder().request(...).
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, flood_rate: float = 0.0,
+                 retry_after: int = 1):
+        """
+        Initializes the fake.
+
+        Args:
+            latency (float): Seconds each non-polling call takes.
+            jitter (float): Up to this many seconds are added to the latency
+                at random.
+            flood_rate (float): Fraction of non-polling calls answered with
+                429 Too Many Requests.
+            retry_after (int): retry_after seconds sent with a 429.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.calls: Counter = Counter()
+        self.flooded: Counter = Counter()
+        # Updates below this id were confirmed by the bot and are never resent
+        self.confirmed = 1
+        self._pending: List[Dict[str, Any]] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._query_ids = itertools.count(1)
+        self._arrived = asyncio.Event()
+        # chat id -> message id -> (version, message)
+        self._screens: Dict[int, Dict[int, Tuple[int, Dict[str, Any]]]] = {}
+        self._changed: Dict[int, asyncio.Event] = {}
+        # Chats whose user left; what the bot sends them is not kept
+        self._gone: Set[int] = set()
+        self._versions = itertools.count(1)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        code, response = await self.call(endpoint, params)
+        return code, json.dumps(response).encode()
+
+    async def call(self, endpoint: str, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """
+        Answers one Bot API call.
+
+        Returns:
+            Tuple[int, Dict[str, Any]]: HTTP status and the JSON response.
+        """
+        self.calls[endpoint] += 1
+        if endpoint == 'getUpdates':
+            return 200, {'ok': True, 'result': await self._get_updates(params)}
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.random() * self.jitter)
+        if self.flood_rate and random.random() < self.flood_rate:
+            self.flooded[endpoint] += 1
+            return 429, {'ok': False, 'error_code': 429,
+                         'description': f"Too Many Requests: retry after {self.retry_after}",
+                         'parameters': {'retry_after': self.retry_after}}
+        handler = getattr(self, f"_{endpoint}", None)
+        return 200, {'ok': True, 'result': handler(params) if handler else True}
+
+    # Intake
+    def push(self, update: Dict[str, Any]) -> int:
+        """
+        Queues an update for getUpdates and returns its update_id.
+        """
+        update['update_id'] = next(self._update_ids)
+        self._pending.append(update)
+        self._arrived.set()
+        return update['update_id']
+
+    def command(self, user: Dict[str, Any], text: str) -> int:
+        self._gone.discard(user['id'])
+        message = {'message_id': next(self._message_ids), 'date': int(time.time()),
+                   'chat': {'id': user['id'], 'type': "private"}, 'from': user, 'text': text,
+                   'entities': [{'type': "bot_command", 'offset': 0,
+                                 'length': len(text.split(' ', 1)[0])}]}
+        return self.push({'message': message})
+
+    def tap(self, user: Dict[str, Any], message: Dict[str, Any], data: str) -> int:
+        query = {'id': str(next(self._query_ids)), 'from': user, 'chat_instance': "fake",
+                 'data': data, 'message': message}
+        return self.push({'callback_query': query})
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = params.get('offset') or 0
+        self.confirmed = max(self.confirmed, offset)
+        self._pending = [update for update in self._pending if update['update_id'] >= offset]
+        if not self._pending and params.get('timeout'):
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), params['timeout'])
+            except asyncio.TimeoutError:
+                pass
+        return self._pending[:params.get('limit') or 100]
+
+    # Screens
+    def _show(self, chat_id: int, message: Dict[str, Any]) -> Dict[str, Any]:
+        if chat_id in self._gone:
+            return message
+        screens = self._screens.setdefault(chat_id, {})
+        screens[message['message_id']] = (next(self._versions), message)
+        if len(screens) > MAX_CHAT_MESSAGES:
+            del screens[min(screens, key=lambda message_id: screens[message_id][0])]
+        self._changed.setdefault(chat_id, asyncio.Event()).set()
+        return message
+
+    def accepted(self, update_ids: List[int]) -> bool:
+        """
+        Returns True if the bot confirmed any of the given updates.
+        """
+        return any(update_id < self.confirmed for update_id in update_ids)
+
+    def version(self, chat_id: int) -> int:
+        return max((version for version, _ in self._screens.get(chat_id, {}).values()), default=0)
+
+    def forget(self, chat_id: int) -> None:
+        """
+        Drops what a chat shows and stops keeping what the bot sends it until
+        its user comes back with a command.
+        """
+        self._gone.add(chat_id)
+        self._screens.pop(chat_id, None)
+        self._changed.pop(chat_id, None)
+
+    def messages(self, chat_id: int) -> List[Dict[str, Any]]:
+        """
+        Returns the messages a chat shows, most recently changed first.
+        """
+        screens = sorted(self._screens.get(chat_id, {}).values(), key=lambda item: item[0],
+                         reverse=True)
+        return [message for _, message in screens]
+
+    async def wait_for_button(self, chat_id: int, since: int,
+                              match: Callable[[str], bool]) -> Tuple[Dict[str, Any], str]:
+        """
+        Waits until a message changed after version `since` shows a matching button.
+
+        Returns:
+            Tuple[Dict[str, Any], str]: The message and the button's callback data.
+        """
+        message, buttons = await self.wait_for_buttons(chat_id, since, match)
+        return message, buttons[0]
+
+    async def wait_for_buttons(self, chat_id: int, since: int,
+                               match: Callable[[str], bool]) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Like wait_for_button(), returning the callback data of every matching
+        button of the message.
+        """
+        changed = self._changed.setdefault(chat_id, asyncio.Event())
+        while True:
+            screen = self.shown_buttons(chat_id, since, match)
+            if screen is not None:
+                return screen
+            changed.clear()
+            await changed.wait()
+
+    def shown_buttons(self, chat_id: int, since: int, match: Callable[[str], bool]
+                      ) -> Optional[Tuple[Dict[str, Any], List[str]]]:
+        """
+        wait_for_buttons() without waiting: None when no such message is shown.
+        """
+        for version, message in self._screens.get(chat_id, {}).values():
+            if version <= since:
+                continue
+            buttons = [button['callback_data']
+                       for row in message.get('reply_markup', {}).get('inline_keyboard', [])
+                       for button in row
+                       if button.get('callback_data') and match(button['callback_data'])]
+            if buttons:
+                return message, buttons
+        return None
+
+    async def wait_for_text(self, chat_id: int, since: int,
+                            match: Callable[[str], bool]) -> Dict[str, Any]:
+        """
+        Waits until a message changed after version `since` has matching text.
+        """
+        changed = self._changed.setdefault(chat_id, asyncio.Event())
+        while True:
+            for version, message in self._screens.get(chat_id, {}).values():
+                if version > since and match(message['text']):
+                    return message
+            changed.clear()
+            await changed.wait()
+
+    def _message(self, params: Dict[str, Any], message_id: Optional[int] = None) -> Dict[str, Any]:
+        markup = params.get('reply_markup')
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        message = {'message_id': message_id or next(self._message_ids), 'date': int(time.time()),
+                   'chat': {'id': int(params['chat_id']), 'type': "private"},
+                   'from': BOT_USER, 'text': params.get('text') or ""}
+        if markup:
+            message['reply_markup'] = markup
+        return self._show(int(params['chat_id']), message)
+
+    # Bot API methods
+    def _getMe(self, params):
+        return BOT_USER
+
+    def _sendMessage(self, params):
+        return self._message(params)
+
+    def _editMessageText(self, params):
+        return self._message(params, int(params['message_id']))
+
+    def _answerCallbackQuery(self, params):
+        return True
+
+    def _deleteMessage(self, params):
+        self._screens.get(int(params['chat_id']), {}).pop(int(params['message_id']), None)
+        return True
+
+    def _sendPoll(self, params):
+        message = self._message(params)
+        message['poll'] = {'id': str(message['message_id']), 'question': params.get('question'),
+                           'options': [], 'total_voter_count': 0, 'is_closed': False,
+                           'is_anonymous': False, 'type': "quiz",
+                           'allows_multiple_answers': False}
+        return message
+
+
+# Parameters the fake reads as numbers or lists; HTTP clients send them as strings
+_JSON_PARAMS = ('offset', 'limit', 'timeout', 'allowed_updates')
+
+
+class FakeBotAPIServer:
+    """
+    Serves a FakeBotAPI over HTTP/1.1 with keep-alive, like api.telegram.org.
+    """
+
+    def __init__(self, api: FakeBotAPI, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            api (FakeBotAPI): The fake answering the calls.
+            host (str): Address to listen on.
+            port (int): Port to listen on; 0 picks a free one.
+        """
+        self.api = api
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        """
+        The value for `telegram.api_base_url`.
+        """
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    @staticmethod
+    def parse(headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+        if headers.get('content-type', '').startswith('application/json'):
+            return json.loads(body) if body else {}
+        params: Dict[str, Any] = dict(parse_qsl(body.decode('utf-8')))
+        for name in _JSON_PARAMS:
+            if name in params:
+                params[name] = json.loads(params[name])
+        return params
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b""
+                # "POST /bot<token>/<method> HTTP/1.1"
+                path = request_line.split(b" ")[1].decode('ascii').split('?', 1)[0]
+                try:
+                    status, response = await self.api.call(path.rsplit('/', 1)[-1],
+                                                           self.parse(headers, body))
+                except (ValueError, KeyError) as e:
+                    status, response = 400, {'ok': False, 'error_code': 400,
+                                             'description': f"Bad Request: {e}"}
+                payload = json.dumps(response).encode()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                             .encode('ascii') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+
+class StepStats:
+    """
+    Latencies of the simulated users' steps, from the update being queued to
+    the screen it leads to.
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.timeouts: Counter = Counter()
+        self.recording = True
+
+    def record(self, step: str, seconds: float) -> None:
+        if self.recording:
+            self.latencies.setdefault(step, []).append(seconds)
+
+    def timeout(self, step: str) -> None:
+        if self.recording:
+            self.timeouts[step] += 1
+
+    def reset(self) -> None:
+        self.latencies.clear()
+        self.timeouts.clear()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns count, timeouts and p50/p95/p99/max in milliseconds per step.
+        """
+        result = {}
+        for step in sorted(set(self.latencies) | set(self.timeouts)):
+            samples = sorted(self.latencies.get(step, []))
+            last = len(samples) - 1
+            row = {'count': len(samples), 'timeouts': self.timeouts[step]}
+            for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0)):
+                row[name] = samples[min(last, int(q * len(samples)))] * 1000 if samples else 0.0
+            result[step] = row
+        return result
+
+
+async def virtual_user(api: FakeBotAPI, telegram_id: int, stats: StepStats,
+                       think_time: float = 1.0, step_timeout: float = 30.0,
+                       restart_rate: float = 0.5) -> None:
+    """
+    Uses the bot like a person until cancelled: /start, the tests menu, a
+    random category and quiz, answers with a random option, then restarts the
+    quiz or goes back to /start; a quiz ended by its timer counts as finished.
+    Each step's latency goes to `stats`; a step
+    that gets no answer within `step_timeout` counts as a timeout and the user
+    starts over with /start.
+
+    Args:
+        api (FakeBotAPI): The fake the bot is connected to.
+        telegram_id (int): User and chat id.
+        stats (StepStats): Receives step latencies.
+        think_time (float): Mean pause before each tap (exponential).
+        step_timeout (float): Seconds to wait for the bot's answer to a step.
+        restart_rate (float): Share of finished quizzes followed by "restart".
+    """
+    user = {'id': telegram_id, 'is_bot': False, 'first_name': "Sim", 'language_code': "en"}
+
+    async def step(name: str, send: Callable[[], int],
+                   match: Callable[[str], bool]) -> Tuple[Dict[str, Any], List[str]]:
+        since = api.version(telegram_id)
+        if think_time:
+            await asyncio.sleep(random.expovariate(1 / think_time))
+            # What the user waits for may have come meanwhile (a quiz timer ran out)
+            screen = api.shown_buttons(telegram_id, since, match)
+            if screen is not None:
+                return screen
+            since = api.version(telegram_id)
+        started = time.perf_counter()
+        send()
+        try:
+            screen = await asyncio.wait_for(api.wait_for_buttons(telegram_id, since, match),
+                                            step_timeout)
+        except asyncio.TimeoutError:
+            stats.timeout(name)
+            raise
+        stats.record(name, time.perf_counter() - started)
+        return screen
+
+    navigate = True
+    message: Dict[str, Any] = {}
+    while True:
+        try:
+            if navigate:
+                message, _ = await step("start", lambda: api.command(user, "/start"),
+                                        lambda data: data == "tests")
+                message, buttons = await step("tests", lambda: api.tap(user, message, "tests"),
+                                              lambda data: data.startswith("cat_"))
+                category = random.choice(buttons)
+                message, buttons = await step("category",
+                                              lambda: api.tap(user, message, category),
+                                              lambda data: data.startswith("quiz_"))
+                quiz = random.choice(buttons)
+                message, buttons = await step("quiz", lambda: api.tap(user, message, quiz),
+                                              lambda data: data.startswith("ans_"))
+            else:
+                message, buttons = await step("restart",
+                                              lambda: api.tap(user, message, "restart"),
+                                              lambda data: data.startswith("ans_"))
+            while True:
+                answer = random.choice(buttons)
+                message, buttons = await step(
+                    "answer", lambda: api.tap(user, message, answer),
+                    lambda data: data.startswith("nxt_") or data == "restart")
+                if "restart" in buttons:
+                    break
+                message, buttons = await step(
+                    "next", lambda: api.tap(user, message, buttons[0]),
+                    lambda data: data.startswith("ans_") or data == "restart")
+                if "restart" in buttons:
+                    break
+            navigate = random.random() >= restart_rate
+        except asyncio.TimeoutError:
+            navigate = True
+
+
+async def quiz_user(api: FakeBotAPI, telegram_id: int, category: str, quiz_name: str,
+                    questions: int, rounds: List[Dict[str, List[int]]],
+                    think_time: float = 0.0) -> None:
+    """
+    Takes the same quiz over and over, recording the update ids of each round's
+    start and final answer in `rounds`. Runs until cancelled.
+
+    Args:
+        api (FakeBotAPI): The fake the bot is connected to.
+        telegram_id (int): User and chat id.
+        category (str): Quiz category.
+        quiz_name (str): Quiz name.
+        questions (int): Questions per quiz.
+        rounds (List[Dict[str, List[int]]]): Receives {'start': [...], 'final': [...]}.
+        think_time (float): Pause before each tap.
+    """
+    user = {'id': telegram_id, 'is_bot': False, 'first_name': "Sim", 'language_code': "en"}
+    since = api.version(telegram_id)
+    api.command(user, "/start")
+    message, _ = await api.wait_for_button(telegram_id, since, lambda data: True)
+    while True:
+        round_ids = {'start': [], 'final': []}
+        rounds.append(round_ids)
+        since = api.version(telegram_id)
+        round_ids['start'].append(api.tap(user, message, f"quiz_{quiz_name}_{category}"))
+        for index in range(questions):
+            message, data = await api.wait_for_button(telegram_id, since,
+                                                      lambda data: data.startswith("ans_"))
+            await asyncio.sleep(think_time)
+            since = api.version(telegram_id)
+            update_id = api.tap(user, message, data)
+            if index == questions - 1:
+                round_ids['final'].append(update_id)
+                message, _ = await api.wait_for_button(telegram_id, since,
+                                                       lambda data: data == "restart")
+            else:
+                message, data = await api.wait_for_button(telegram_id, since,
+                                                          lambda data: data.startswith("nxt_"))
+                await asyncio.sleep(think_time)
+                since = api.version(telegram_id)
+                api.tap(user, message, data)
+        await asyncio.sleep(think_time)
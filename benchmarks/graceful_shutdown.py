@@ -0,0 +1,173 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/graceful_shutdown.py
+
+Description:
+Shutdown check under load. A child process runs the real application (built by
+app.build_application, polling through serve_polling) against FakeBotAPI while
+simulated users take quizzes. Once load is running the parent sends SIGTERM.
+After the child exits the parent checks the SQLite database:
+
+- every quiz whose final answer the bot confirmed (getUpdates offset) has a
+  quiz_attempts row; unconfirmed updates would be delivered again after a restart;
+- every quiz the bot started but did not finish is in quiz_sessions with its
+  timer deadline, so it resumes after a restart.
+
+Exits with status 1 if anything was lost.
+
+Usage:
+    python -m benchmarks.graceful_shutdown --users 200 --latency 0.05 --load-seconds 5
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.fake_api import FakeBotAPI, quiz_user
+from benchmarks.stubs import load_config
+
+CATEGORY = "BSIS"
+QUIZ = "Powers to Arrest EN"
+
+
+class RecordingLogger:
+    """
+    Logger keeping shutdown messages, warnings and errors for the report.
+    """
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def _keep(self, level: str, message, *args, **kwargs) -> None:
+        self.lines.append(f"{level}: {message}")
+
+    def info(self, message, *args, **kwargs) -> None:
+        if str(message).startswith(("Shut", "Cancelled")):
+            self._keep("INFO", message)
+
+    def warning(self, message, *args, **kwargs) -> None:
+        self._keep("WARNING", message)
+
+    def error(self, message, *args, **kwargs) -> None:
+        self._keep("ERROR", message)
+
+    def debug(self, message, *args, **kwargs) -> None:
+        pass
+
+
+async def _run_bot(db_path: str, cache_dir: str, report_path: str, users: int, latency: float,
+                   drain_timeout: float, think_time: float, loaded) -> None:
+    from app import build_application
+    from utils.localization import Localization
+
+    config = load_config()
+    config['database'].update({'db_source': db_path, 'shards': 1, 'persist_sessions': True})
+    config['question_store']['cache_directory'] = cache_dir
+    config['telegram']['quiz_delivery'] = 'buttons'
+    config['base_settings']['timer_enabled'] = True
+    # Nothing may be shed or rate limited, so every received update is handled
+    config['throttling'].update({'user_rate': 1000, 'user_burst': 1000, 'max_backlog': 100000})
+    config.setdefault('shutdown', {})['drain_timeout'] = drain_timeout
+    # Slow-update warnings of the simulated latency would crowd the report
+    config.setdefault('tracing', {})['enabled'] = False
+    questions = config['base_settings']['questions_count'][0]
+
+    logger = RecordingLogger()
+    api = FakeBotAPI(latency=latency)
+    application = build_application(config, logger, Localization(config['telegram']['language']),
+                                    Path('data/questions'), config['telegram'].get('parse_mode'),
+                                    "123:fake", request=api)
+
+    from modules.telegram.lifecycle import serve_polling
+    bot = asyncio.create_task(serve_polling(application))
+    rounds: Dict[int, List[Dict[str, List[int]]]] = {user_id: [] for user_id in range(1, users + 1)}
+    simulators = [asyncio.create_task(quiz_user(api, user_id, CATEGORY, QUIZ, questions,
+                                                rounds[user_id], think_time))
+                  for user_id in rounds]
+    while not any(len(user_rounds) > 1 for user_rounds in rounds.values()):
+        await asyncio.sleep(0.05)
+    loaded.set()
+    await bot
+    for simulator in simulators:
+        simulator.cancel()
+
+    finished = open_sessions = 0
+    for user_rounds in rounds.values():
+        for index, round_ids in enumerate(user_rounds):
+            if api.accepted(round_ids['final']):
+                finished += 1
+            elif index == len(user_rounds) - 1 and api.accepted(round_ids['start']):
+                open_sessions += 1
+    with open(report_path, 'w') as file:
+        json.dump({'finished': finished, 'open_sessions': open_sessions,
+                   'confirmed': api.confirmed - 1, 'log': logger.lines}, file)
+
+
+def run_bot(*args) -> None:
+    asyncio.run(_run_bot(*args))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per Bot API call")
+    parser.add_argument('--think-time', type=float, default=0.0, help="Seconds before each tap")
+    parser.add_argument('--load-seconds', type=float, default=5.0,
+                        help="Seconds of load before SIGTERM")
+    parser.add_argument('--drain-timeout', type=float, default=20.0,
+                        help="shutdown.drain_timeout for the run (0 abandons in-flight updates)")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'qbb.db')
+        report_path = os.path.join(tmp, 'report.json')
+        loaded = context.Event()
+        child = context.Process(target=run_bot, args=(
+            db_path, os.path.join(tmp, 'cache'), report_path, args.users, args.latency,
+            args.drain_timeout, args.think_time, loaded))
+        child.start()
+        if not loaded.wait(60):
+            child.kill()
+            sys.exit("Bot did not come up")
+        time.sleep(args.load_seconds)
+        os.kill(child.pid, signal.SIGTERM)
+        signalled = time.perf_counter()
+        child.join()
+        exited = time.perf_counter() - signalled
+        if child.exitcode != 0:
+            sys.exit(f"Bot exited with status {child.exitcode}")
+
+        with open(report_path) as file:
+            report = json.load(file)
+        with sqlite3.connect(db_path) as conn:
+            attempts = conn.execute("SELECT COUNT(*) FROM quiz_attempts").fetchone()[0]
+            sessions, with_deadline = conn.execute(
+                "SELECT COUNT(*), COUNT(deadline) FROM quiz_sessions").fetchone()
+
+    for line in report['log']:
+        print(f"  {line}")
+    print(f"SIGTERM to exit: {exited:.2f}s, updates confirmed by the bot: {report['confirmed']}")
+    print(f"finished quizzes confirmed: {report['finished']}, attempts saved: {attempts}")
+    print(f"running quizzes confirmed: {report['open_sessions']}, sessions saved: {sessions} "
+          f"({with_deadline} with timer deadline)")
+    ok = (attempts == report['finished'] and sessions == report['open_sessions']
+          and with_deadline == sessions)
+    print("OK: nothing lost" if ok else "FAIL: work was lost during shutdown")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/history_pages.py
+
+Description:
+Page latency of the /history view against the depth of the page. One user is
+seeded with a long attempt history among other users' attempts. For pages at
+increasing depths the benchmark times BotDatabase.get_attempt_history (keyset
+pagination, both directions) and, for comparison, the same page fetched with
+LIMIT/OFFSET, which has to step over every row before it.
+
+The run fails (exit status 1) when the deepest keyset page is more than
+--tolerance times slower than the first page.
+
+Usage:
+    python -m benchmarks.history_pages
+    python -m benchmarks.history_pages --attempts 100000 --page-size 5
+"""
+
+import argparse
+import asyncio
+import datetime as dt
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, List
+
+from utils.database import BotDatabase
+
+USER_ID = 1
+
+_OFFSET_PAGE = (
+    "SELECT id, category, quiz_name, total_questions, correct_count, success_rate, passed, "
+    "finished_at FROM quiz_attempts WHERE user_id = ? ORDER BY finished_at DESC, id "
+    "LIMIT ? OFFSET ?"
+)
+
+
+def seed(path: Path, attempts: int, others: int, rng: random.Random) -> None:
+    """
+    Seeds `attempts` attempts of USER_ID and `others` attempts of 1000 other users.
+    """
+    start = dt.datetime(2020, 1, 1)
+    total = attempts + others
+    rows = []
+    for index in range(total):
+        # Every three attempts share a finished_at, so pages split ties on id
+        finished = (start + dt.timedelta(seconds=index // 3 * 60)).isoformat() + "Z"
+        user_id = USER_ID if rng.random() < attempts / total else rng.randint(2, 1001)
+        correct = rng.randint(0, 10)
+        rows.append((user_id, "BSIS", "Quiz EN", 10, correct, correct * 10.0, int(correct >= 8),
+                     finished, finished, 60))
+    with sqlite3.connect(path) as conn:
+        conn.executemany("INSERT INTO users (id, telegram_id) VALUES (?, ?)",
+                         [(user_id, user_id) for user_id in range(1, 1002)])
+        conn.executemany(
+            "INSERT INTO quiz_attempts (user_id, category, quiz_name, total_questions, "
+            "correct_count, success_rate, passed, started_at, finished_at, duration_seconds) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("ANALYZE")
+
+
+async def median_ms(call: Callable[[], Awaitable[object]], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+async def run(attempts: int, others: int, page_size: int, repeat: int,
+              tolerance: float) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'history.db'
+        db = BotDatabase(str(path))
+        await db.init()
+        await db.close()
+        seed(path, attempts, others, random.Random(1))
+        await db.init()
+
+        with sqlite3.connect(path) as conn:
+            owned = conn.execute("SELECT COUNT(*) FROM quiz_attempts WHERE user_id = ?",
+                                 (USER_ID,)).fetchone()[0]
+        pages = owned // page_size
+        depths = sorted({0, 1} | {depth for depth in (10, 100, 1000, 10000, 100000)
+                                  if depth < pages} | {pages - 1})
+        print(f"{owned} attempts of the user, {others} of others, {page_size} per page")
+        print(f"{'page':>8} {'keyset older ms':>16} {'keyset newer ms':>16} {'offset ms':>10}")
+
+        offset_conn = sqlite3.connect(path)
+        results: List[float] = []
+        for depth in depths:
+            skip = depth * page_size
+            # The row just before the page, as the previous page's last button would carry
+            row = offset_conn.execute(_OFFSET_PAGE, (USER_ID, 1, skip - 1)).fetchone() \
+                if skip else None
+            cursor = (row[7], row[0]) if row else None
+            older = await median_ms(
+                lambda: db.get_attempt_history(USER_ID, page_size, cursor=cursor), repeat)
+            # The page's first row, as the next page's "Newer" button would carry
+            first = offset_conn.execute(_OFFSET_PAGE, (USER_ID, 1, skip + page_size)).fetchone()
+            newer = await median_ms(
+                lambda: db.get_attempt_history(USER_ID, page_size, cursor=(first[7], first[0]),
+                                               newer=True), repeat) if first else float('nan')
+
+            async def offset_page():
+                return offset_conn.execute(_OFFSET_PAGE, (USER_ID, page_size + 1, skip)).fetchall()
+
+            offset = await median_ms(offset_page, max(3, repeat // 10))
+            results.append(older)
+            print(f"{depth:>8} {older:>16.3f} {newer:>16.3f} {offset:>10.3f}")
+        offset_conn.close()
+        await db.close()
+
+    # Sub-millisecond pages are noisy; allow a small absolute slack on top of the ratio
+    limit = results[0] * tolerance + 0.05
+    if results[-1] > limit:
+        print(f"\nFAIL: deepest keyset page took {results[-1]:.3f} ms, "
+              f"limit {limit:.3f} ms ({tolerance:g}x the first page)")
+        return False
+    print(f"\nOK: keyset page latency does not grow with depth "
+          f"(deepest {results[-1]:.3f} ms, first {results[0]:.3f} ms)")
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--attempts', type=int, default=200000,
+                        help="Attempts seeded for the paged user")
+    parser.add_argument('--others', type=int, default=200000,
+                        help="Attempts seeded for other users")
+    parser.add_argument('--page-size', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=200, help="Timed fetches per page")
+    parser.add_argument('--tolerance', type=float, default=2.0,
+                        help="Allowed ratio of deepest to first page latency")
+    args = parser.parse_args()
+    if not asyncio.run(run(args.attempts, args.others, args.page_size, args.repeat,
+                           args.tolerance)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
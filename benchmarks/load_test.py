@@ -0,0 +1,183 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/load_test.py
+
+Description:
+End-to-end load test of the bot against a local Bot API stand-in. The bot runs
+in its own process, built by app.build_application with the shipped
+configuration and polling through the real HTTP client, with
+`telegram.api_base_url` pointing at FakeBotAPIServer (getUpdates, sendMessage,
+editMessageText, answerCallbackQuery, deleteMessage, ...) in this process.
+Virtual users (fake_api.virtual_user) go through /start, the tests menu,
+category and quiz selection, answering and restart, with an exponential think
+time between taps.
+
+Users are started evenly over --ramp seconds; the following --duration seconds
+are measured. The report gives throughput (updates confirmed by the bot, user
+steps, Bot API calls) and per-step latency percentiles, measured from the
+update being queued to the screen it leads to. The fake can add latency to
+every Bot API call and answer a share of them with 429 Too Many Requests.
+--record makes the bot record its updates, for benchmarks/replay.py.
+
+The run fails (exit status 1) when --max-p99-ms is given and a step's p99
+exceeds it, or when steps time out.
+
+Usage:
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --users 2000 --think 5 --duration 60
+    python -m benchmarks.load_test --latency 0.05 --jitter 0.1 --flood-rate 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from benchmarks.fake_api import FakeBotAPI, FakeBotAPIServer, StepStats, virtual_user
+from benchmarks.stubs import NullLogger, load_config
+
+STEPS = ("start", "tests", "category", "quiz", "answer", "next", "restart")
+
+
+def _bot_process(config: Dict[str, Any]) -> None:
+    from app import build_application
+    from modules.telegram.lifecycle import serve_polling
+    from utils.localization import Localization
+
+    application = build_application(config, NullLogger(), Localization('en'),
+                                    Path('data/questions'), config['telegram'].get('parse_mode'),
+                                    "123:fake")
+    asyncio.run(serve_polling(application))
+
+
+def bot_config(tmp: Path, api_base_url: str, record: str = "") -> Dict[str, Any]:
+    """
+    Returns the shipped configuration with every file under `tmp`, recording
+    the updates to the directory `record` when given.
+    """
+    config = load_config()
+    config['telegram']['api_base_url'] = api_base_url
+    config['database'].update({'db_source': str(tmp / "qbb.db"), 'shards': 1})
+    config['database'].setdefault('backup', {})['enabled'] = False
+    config['question_store']['cache_directory'] = str(tmp / 'cache')
+    config['metrics'] = {'enabled': False}
+    config.setdefault('tracing', {})['export_path'] = str(tmp / 'traces.jsonl')
+    config.setdefault('profiling', {})['directory'] = str(tmp / 'logs')
+    config['recording'] = {'enabled': bool(record), 'directory': record}
+    return config
+
+
+async def run(args: argparse.Namespace, tmp: Path) -> Dict[str, Any]:
+    api = FakeBotAPI(latency=args.latency, jitter=args.jitter, flood_rate=args.flood_rate,
+                     retry_after=args.retry_after)
+    server = FakeBotAPIServer(api, port=args.port)
+    await server.start()
+    bot = multiprocessing.get_context('spawn').Process(
+        target=_bot_process, args=(bot_config(tmp, server.url, args.record), ), name="bot")
+    bot.start()
+    while not api.calls['getUpdates']:
+        if not bot.is_alive():
+            raise RuntimeError("The bot process exited during start-up")
+        await asyncio.sleep(0.1)
+
+    stats = StepStats()
+    users = []
+    for user_id in range(1, args.users + 1):
+        users.append(asyncio.create_task(virtual_user(
+            api, user_id, stats, think_time=args.think, step_timeout=args.step_timeout)))
+        await asyncio.sleep(args.ramp / args.users)
+
+    stats.reset()
+    confirmed, calls, flooded = api.confirmed, sum(api.calls.values()), sum(api.flooded.values())
+    started = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    elapsed = time.perf_counter() - started
+    stats.recording = False
+    summary = stats.summary()
+    result = {
+        'users': args.users,
+        'seconds': round(elapsed, 1),
+        'updates_per_second': (api.confirmed - confirmed) / elapsed,
+        'steps_per_second': sum(row['count'] for row in summary.values()) / elapsed,
+        'api_calls_per_second': (sum(api.calls.values()) - calls) / elapsed,
+        'flooded': sum(api.flooded.values()) - flooded,
+        'steps': summary,
+    }
+
+    bot.terminate()
+    await asyncio.to_thread(bot.join, 30)
+    for user in users:
+        user.cancel()
+    await asyncio.gather(*users, return_exceptions=True)
+    await server.close()
+    return result
+
+
+def report(result: Dict[str, Any]) -> None:
+    print(f"{result['users']} users, {result['seconds']} s measured: "
+          f"{result['updates_per_second']:.0f} updates/s, "
+          f"{result['steps_per_second']:.0f} steps/s, "
+          f"{result['api_calls_per_second']:.0f} Bot API calls/s, "
+          f"{result['flooded']} calls answered with 429")
+    print(f"\n{'step':<10} {'count':>7} {'timeouts':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8}")
+    steps = result['steps']
+    for step in sorted(steps, key=lambda name: STEPS.index(name) if name in STEPS else 99):
+        row = steps[step]
+        print(f"{step:<10} {row['count']:>7} {row['timeouts']:>8} {row['p50']:>8.1f} "
+              f"{row['p95']:>8.1f} {row['p99']:>8.1f} {row['max']:>8.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=200, help="Virtual users")
+    parser.add_argument('--think', type=float, default=2.0,
+                        help="Mean think time between a user's taps, seconds")
+    parser.add_argument('--ramp', type=float, default=10.0,
+                        help="Seconds over which users are started")
+    parser.add_argument('--duration', type=float, default=30.0, help="Measured seconds")
+    parser.add_argument('--step-timeout', type=float, default=30.0,
+                        help="Seconds a user waits for the bot before starting over")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds each Bot API call takes")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="Up to this many seconds added to each call's latency")
+    parser.add_argument('--flood-rate', type=float, default=0.0,
+                        help="Fraction of Bot API calls answered with 429")
+    parser.add_argument('--retry-after', type=int, default=1,
+                        help="retry_after seconds sent with a 429")
+    parser.add_argument('--port', type=int, default=0, help="Port of the fake Bot API")
+    parser.add_argument('--max-p99-ms', type=float, default=0.0,
+                        help="Fail when a step's p99 latency exceeds this (0 = report only)")
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    parser.add_argument('--record', default="",
+                        help="Record the bot's updates to this directory (see benchmarks.replay)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = asyncio.run(run(args, Path(tmp)))
+    report(result)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2), encoding='utf-8')
+
+    failures = [f"{step}: {row['timeouts']} timeouts" for step, row in result['steps'].items()
+                if row['timeouts'] and not args.flood_rate]
+    if args.max_p99_ms:
+        failures += [f"{step}: p99 {row['p99']:.0f} ms" for step, row in result['steps'].items()
+                     if row['p99'] > args.max_p99_ms]
+    if failures:
+        print(f"\nFAIL: {'; '.join(failures)}")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/log_overhead.py
+
+Description:
+Logging cost of one answered question: the answer's log output plus the next
+question's "sending" line. Three setups are compared for each logging
+framework, with the shipped `log_level: DEBUG`:
+
+- before: four INFO lines per answer (Question / Given Answer / Correct Answer /
+  Is Correct) and the whole rendered question at INFO, written synchronously;
+- events: one "quiz_answer" event (log_quiz_response) and the sampled DEBUG
+  "question_sent" event, written synchronously;
+- events + async: the same events, serialized and written by the writer thread.
+
+Each setup is run against a fast stream (/dev/null) and a slow one that takes
+a millisecond per write, like a stalled log pipe. "caller" is the time the
+calling (event loop) thread spends in the logging calls: its own CPU time plus
+time blocked in writes. "CPU" is the whole process, including the writer thread
+until its queue is drained. With one core the writer thread's CPU still counts,
+but it runs while the event loop waits for network I/O instead of delaying it.
+
+The run fails (exit status 1) when the shipped setup (loguru, events + async)
+costs the caller more than --max-caller-us per answer on either stream.
+
+Usage:
+    python -m benchmarks.log_overhead
+    python -m benchmarks.log_overhead --answers 20000
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Tuple
+
+from loguru import logger as loguru_logger
+
+from modules.telegram.quizzes import extract_key, log_quiz_response
+from utils.logger import EventLogger, LoguruLogger, StandardLogger
+
+QUESTIONS = Path('data/questions') / 'BSIS' / 'Powers to Arrest EN.json'
+EVENTS = {'quiz_answer': {'sample_rate': 1.0, 'rate_limit': 0},
+          'question_sent': {'sample_rate': 0.01, 'rate_limit': 5}}
+
+
+class SlowStream:
+    """
+    Text stream taking `delay` seconds per write, like a pipe nobody drains.
+    """
+
+    def __init__(self, delay: float = 0.001):
+        self.delay = delay
+        self.blocked = 0.0
+        self.caller = None
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        if threading.get_ident() == self.caller:
+            self.blocked += self.delay
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def render(question: dict, index: int) -> str:
+    # The text send_question builds
+    text = f"Q{index + 1}. {question['question']}\n\n\n"
+    for option in question['answers']:
+        text += f"{option}\n\n"
+    return text
+
+
+def answer_before(logger, question: dict, index: int) -> None:
+    answer = question['answers'][0]
+    logger.info(f"Question: {question['question']}")
+    logger.info(f"Given Answer: {answer}")
+    logger.info(f"Correct Answer: {question['correct_answer']}")
+    logger.info(f"Is Correct: {extract_key(answer) == extract_key(question['correct_answer'])}")
+    logger.info(f"Sending message: '{render(question, index + 1)}' in mode: HTML")
+
+
+def answer_events(events: EventLogger, question: dict, index: int) -> None:
+    log_quiz_response(events, 1, index, question, question['answers'][0])
+    events.emit("question_sent", "Sending question {question}/{total} in mode: {parse_mode}",
+                level="DEBUG", question=index + 2, total=20, parse_mode="HTML",
+                text=render(question, index + 1))
+
+
+def measure(framework: str, setup: str, stream, answers: int, questions) -> Tuple[float, float]:
+    """
+    Returns caller and total CPU microseconds per answer.
+    """
+    config = {'log_framework': framework, 'log_level': 'DEBUG', 'log_to_file': False,
+              'log_async': setup == "events + async", 'events': EVENTS}
+    saved = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = stream
+    try:
+        if framework == 'loguru':
+            setup_logger = LoguruLogger(config)
+        else:
+            setup_logger = StandardLogger(config)
+    finally:
+        sys.stdout, sys.stderr = saved
+    logger = setup_logger.get_logger()
+    events = EventLogger(logger, config)
+
+    cpu = time.process_time()
+    if isinstance(stream, SlowStream):
+        stream.blocked, stream.caller = 0.0, threading.get_ident()
+    caller = time.thread_time()
+    for index in range(answers):
+        question = questions[index % len(questions)]
+        if setup == "before":
+            answer_before(logger, question, index)
+        else:
+            answer_events(events, question, index)
+    caller = time.thread_time() - caller
+    if isinstance(stream, SlowStream):
+        caller += stream.blocked
+    # Drain the writer thread before reading the CPU time
+    if framework == 'loguru':
+        loguru_logger.remove()
+    else:
+        for handler in list(logger.handlers):
+            handler.close()
+            logger.removeHandler(handler)
+    cpu = time.process_time() - cpu
+    return caller / answers * 1e6, cpu / answers * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--answers', type=int, default=5000,
+                        help="Answers logged per run on the fast stream")
+    parser.add_argument('--slow-answers', type=int, default=200,
+                        help="Answers logged per run on the slow stream")
+    parser.add_argument('--max-caller-us', type=float, default=50.0,
+                        help="Allowed caller time per answer of the shipped setup")
+    args = parser.parse_args()
+
+    with open(QUESTIONS, 'r', encoding='utf-8') as file:
+        questions = json.load(file)
+    logging.raiseExceptions = False
+
+    results: Dict[Tuple[str, str, str], Tuple[float, float]] = {}
+    print(f"{'framework':<9} {'setup':<15} {'stream':<6} {'caller us':>10} {'CPU us':>9}")
+    with open(os.devnull, 'w') as devnull:
+        for framework in ('loguru', 'default'):
+            for setup in ("before", "events", "events + async"):
+                for name, stream, answers in (("fast", devnull, args.answers),
+                                              ("slow", SlowStream(), args.slow_answers)):
+                    caller, cpu = measure(framework, setup, stream, answers, questions)
+                    results[(framework, setup, name)] = caller, cpu
+                    print(f"{framework:<9} {setup:<15} {name:<6} {caller:>10.1f} {cpu:>9.1f}")
+
+    before = results[('loguru', "before", "fast")][0]
+    shipped = [results[('loguru', "events + async", name)][0] for name in ("fast", "slow")]
+    print(f"\nshipped setup: {shipped[0]:.1f} us per answer on the caller "
+          f"({before / shipped[0]:.1f}x less than before), {shipped[1]:.1f} us with a slow stream")
+    if max(shipped) > args.max_caller_us:
+        print(f"FAIL: logging costs the caller more than {args.max_caller_us:g} us per answer")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
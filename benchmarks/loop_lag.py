@@ -0,0 +1,122 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/loop_lag.py
+
+Description:
+Checks the event loop watchdog (utils/loop_monitor.py) against the blocking
+calls the bot actually makes from coroutines: reading every quiz file of a
+category (get_quiz_files, json.load) and parsing a locale file (Localization,
+YAML). Each offender runs on the loop long enough to exceed the threshold; the
+watchdog must report a stall whose offending frame is inside that function.
+
+Lag percentiles are printed for an idle loop and for the run with offenders,
+along with the CPU the monitor itself costs on an idle loop.
+
+The run fails (exit status 1) when a stall is missed or attributed to the
+wrong function.
+
+Usage:
+    python -m benchmarks.loop_lag
+    python -m benchmarks.loop_lag --threshold 0.1 --block 0.5
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from modules.telegram.quizzes import get_quiz_files
+from utils.localization import Localization
+from utils.loop_monitor import LoopMonitor
+
+
+class RecordingLogger:
+    """
+    Logger keeping warnings in memory.
+    """
+
+    def __init__(self):
+        self.warnings: List[str] = []
+
+    def warning(self, message, *args, **kwargs) -> None:
+        self.warnings.append(message)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def offenders() -> List[Tuple[str, str, Callable[[], object]]]:
+    """
+    Returns (label, expected function, blocking call) for each offender.
+    """
+    logger = RecordingLogger()
+    category = Path('data/questions') / 'BSIS'
+    return [
+        ("get_quiz_files", "get_quiz_files", lambda: get_quiz_files(str(category), logger)),
+        ("Localization('en')", "load_translations", lambda: Localization('en')),
+    ]
+
+
+def percentiles(monitor: LoopMonitor) -> str:
+    return ", ".join(f"p{float(q) * 100:g} {value * 1000:.2f} ms"
+                     for (q, ), value in monitor.quantiles().items())
+
+
+async def run(threshold: float, block: float, idle: float) -> bool:
+    logger = RecordingLogger()
+    monitor = LoopMonitor(logger, interval=0.1, threshold=threshold, window=100000)
+    task = asyncio.create_task(monitor.run())
+
+    cpu = time.process_time()
+    await asyncio.sleep(idle)
+    cpu = time.process_time() - cpu
+    print(f"idle loop: {percentiles(monitor)}; monitor CPU {cpu / idle * 100:.2f}%")
+
+    ok = True
+    for label, expected, call in offenders():
+        stalls = monitor.stalls
+        # Blocks the loop: calls the offender back to back for `block` seconds
+        deadline = time.monotonic() + block
+        calls = 0
+        while time.monotonic() < deadline:
+            call()
+            calls += 1
+        await asyncio.sleep(monitor.interval * 3)
+        stall = monitor.last_stall if monitor.stalls > stalls else None
+        if stall is None:
+            print(f"{label:<20} MISSED ({calls} calls, {block * 1000:.0f} ms)")
+            ok = False
+            continue
+        found = stall['frame'].endswith(f" in {expected}")
+        ok = ok and found
+        print(f"{label:<20} {'OK ' if found else 'WRONG'} blocked {stall['blocked_ms']} ms "
+              f"at {stall['frame']}")
+    print(f"with offenders: {percentiles(monitor)}; max {monitor.max_lag * 1000:.0f} ms, "
+          f"{monitor.stalls} stalls logged")
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Lag in seconds reported as a stall")
+    parser.add_argument('--block', type=float, default=0.5,
+                        help="Seconds each offender blocks the loop")
+    parser.add_argument('--idle', type=float, default=3.0,
+                        help="Seconds of idle loop measured first")
+    args = parser.parse_args()
+    if not asyncio.run(run(args.threshold, args.block, args.idle)):
+        print("FAIL: stall missed or attributed to the wrong frame")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/metrics_overhead.py
+
+Description:
+Cost of the metrics instrumentation (utils/metrics.py). First the recording
+primitives are timed in isolation: a histogram observation, a counter
+increment and the wrapper instrument_database() puts around a coroutine.
+Then the whole bot (app.build_application, polling through serve_polling)
+runs against FakeBotAPI with simulated quiz users, alternately with
+metrics.enabled off and on, and the CPU time per handled update is compared.
+
+End-to-end runs differ by more than the instrumentation costs, so the verdict
+uses a count instead: the /metrics scrape of the instrumented bot tells how
+many observations an update records (handler, database calls, Bot API calls),
+which times the primitive costs gives the overhead per update. The run fails
+(exit status 1) when that exceeds --max-overhead percent of the CPU time per
+update without metrics.
+
+Usage:
+    python -m benchmarks.metrics_overhead
+    python -m benchmarks.metrics_overhead --users 50 --seconds 5 --rounds 3
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import time
+import timeit
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Tuple
+
+from benchmarks.fake_api import FakeBotAPI, quiz_user
+from benchmarks.stubs import NullLogger, load_config
+from utils.metrics import BotMetrics, _timed
+
+CATEGORY = "BSIS"
+QUIZ = "Powers to Arrest EN"
+
+
+def primitives(number: int = 200000) -> Dict[str, float]:
+    """
+    Returns the cost of each recording primitive in nanoseconds.
+    """
+    metrics = BotMetrics()
+    histogram, counter = metrics.handler_seconds, metrics.updates
+
+    async def noop():
+        return None
+
+    timed = _timed(noop, "noop", metrics)
+
+    async def calls(function, count: int) -> float:
+        started = time.perf_counter()
+        for _ in range(count):
+            await function()
+        return time.perf_counter() - started
+
+    loop = asyncio.new_event_loop()
+    try:
+        plain = min(loop.run_until_complete(calls(noop, number)) for _ in range(3))
+        wrapped = min(loop.run_until_complete(calls(timed, number)) for _ in range(3))
+    finally:
+        loop.close()
+    return {
+        'histogram observe': min(timeit.repeat(lambda: histogram.observe(0.003, "quiz_"),
+                                               number=number, repeat=3)) / number * 1e9,
+        'counter inc': min(timeit.repeat(lambda: counter.inc("callback_query"),
+                                         number=number, repeat=3)) / number * 1e9,
+        'timed coroutine wrapper': (wrapped - plain) / number * 1e9,
+    }
+
+
+async def _scrape(port: int) -> str:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    await writer.drain()
+    response = (await reader.read()).decode('utf-8')
+    writer.close()
+    return response.split("\r\n\r\n", 1)[1]
+
+
+async def _run_bot(tmp: Path, enabled: bool, users: int, seconds: float,
+                   run: int) -> Tuple[int, float, str]:
+    from app import build_application
+    from modules.telegram.lifecycle import serve_polling
+    from utils.localization import Localization
+
+    config = load_config()
+    config['database'].update({'db_source': str(tmp / f"run{run}.db"), 'shards': 1,
+                               'persist_sessions': False})
+    config['database'].setdefault('backup', {})['enabled'] = False
+    config['question_store']['cache_directory'] = str(tmp / 'cache')
+    config['telegram']['quiz_delivery'] = 'buttons'
+    config['base_settings']['timer_enabled'] = False
+    config['throttling'].update({'user_rate': 1000, 'user_burst': 1000, 'max_backlog': 100000})
+    port = 19464 + run
+    config['metrics'] = {'enabled': enabled, 'host': "127.0.0.1", 'port': port}
+    config.setdefault('tracing', {})['export_path'] = str(tmp / 'traces.jsonl')
+    questions = config['base_settings']['questions_count'][0]
+
+    api = FakeBotAPI()
+    application = build_application(config, NullLogger(), Localization('en'),
+                                    Path('data/questions'), config['telegram'].get('parse_mode'),
+                                    "123:fake", request=api)
+    bot = asyncio.create_task(serve_polling(application))
+    simulators = [asyncio.create_task(quiz_user(api, user_id, CATEGORY, QUIZ, questions, []))
+                  for user_id in range(1, users + 1)]
+    # Warm up: every user past the first screen
+    await asyncio.sleep(1.0)
+    confirmed, cpu = api.confirmed, time.process_time()
+    await asyncio.sleep(seconds)
+    handled, cpu = api.confirmed - confirmed, time.process_time() - cpu
+    exposition = await _scrape(port) if enabled else ""
+    os.kill(os.getpid(), signal.SIGTERM)
+    await bot
+    for simulator in simulators:
+        simulator.cancel()
+    await asyncio.gather(*simulators, return_exceptions=True)
+    return handled, cpu, exposition
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=5.0, help="Measured seconds per run")
+    parser.add_argument('--rounds', type=int, default=3,
+                        help="Runs with metrics off and on, alternating")
+    parser.add_argument('--max-overhead', type=float, default=1.0,
+                        help="Allowed extra CPU per update, percent")
+    args = parser.parse_args()
+
+    costs = primitives()
+    for name, nanoseconds in costs.items():
+        print(f"{name:<24} {nanoseconds:>8.0f} ns")
+
+    best = {False: float('inf'), True: float('inf')}
+    exposition = ""
+    with tempfile.TemporaryDirectory() as tmp:
+        for run in range(args.rounds * 2):
+            enabled = bool(run % 2)
+            handled, cpu, text = asyncio.run(_run_bot(Path(tmp), enabled, args.users,
+                                                      args.seconds, run))
+            per_update = cpu / max(handled, 1) * 1e6
+            best[enabled] = min(best[enabled], per_update)
+            exposition = text or exposition
+            print(f"metrics {'on ' if enabled else 'off'}: {handled:>6} updates, "
+                  f"{handled / args.seconds:>7.0f}/s, {per_update:>7.1f} us CPU per update")
+
+    totals = Counter()
+    for line in exposition.splitlines():
+        name = line.split("{", 1)[0].split(" ", 1)[0]
+        if name in ('qbb_updates_total', 'qbb_handler_seconds_count',
+                    'qbb_db_call_seconds_count', 'qbb_telegram_api_seconds_count'):
+            totals[name] += float(line.rsplit(" ", 1)[1])
+    updates = max(totals['qbb_updates_total'], 1)
+    per_update = {name: totals[name] / updates for name in totals}
+    # Handler: one observation; database and Bot API calls: one wrapper each
+    cost_ns = (costs['counter inc']
+               + per_update['qbb_handler_seconds_count'] * costs['histogram observe']
+               + (per_update['qbb_db_call_seconds_count']
+                  + per_update['qbb_telegram_api_seconds_count'])
+               * costs['timed coroutine wrapper'])
+    overhead = cost_ns / 1000 / best[False] * 100
+    print(f"\nper update: {per_update['qbb_db_call_seconds_count']:.1f} database calls, "
+          f"{per_update['qbb_telegram_api_seconds_count']:.1f} Bot API calls, "
+          f"{per_update['qbb_handler_seconds_count']:.2f} handler observations")
+    print(f"measured best CPU per update: {best[False]:.1f} us off, {best[True]:.1f} us on "
+          f"({(best[True] / best[False] - 1) * 100:+.1f}%, end to end, noisy)")
+    print(f"instrumentation cost: {cost_ns / 1000:.1f} us per update ({overhead:.2f}%)")
+    if overhead > args.max_overhead:
+        print(f"FAIL: instrumentation costs more than {args.max_overhead:g}% CPU per update")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/micro.py
+
+Description:
+Microbenchmarks of the quiz hot paths: answer key extraction, answer message
+formatting, question rendering (send_question with stub Telegram objects),
+quiz file loading on the bundled data/questions files, translation lookups,
+and every BotDatabase method on a temporary database seeded with one user's
+attempt history and saved sessions.
+
+Each case is timed like timeit does: the number of calls per run is raised
+until a run takes --min-time seconds, the run is repeated --repeat times and
+the fastest run counts (slower runs are noise from the rest of the system).
+Database write methods include waiting for their batched commit. A fixed
+pure-Python reference workload is timed with every run; comparisons are
+scaled by its change, so a machine that is busier or clocked lower as a whole
+does not show up as a regression of every case.
+
+--save writes the results to a JSON baseline; --compare reads one and flags
+every case whose fastest and median runs both got slower by more than
+--threshold percent. Baselines are
+only comparable on the same machine and Python version.
+
+The run fails (exit status 1) when --compare finds a regression.
+
+Usage:
+    python -m benchmarks.micro --save baseline.json
+    python -m benchmarks.micro --compare baseline.json --threshold 10
+    python -m benchmarks.micro --filter db.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.stubs import (
+    FakeBot, NullLogger, load_config, make_context, make_database, make_update, make_user
+)
+from modules.telegram.quizzes import (
+    extract_key, format_question_message, get_quiz_files, load_random_questions, send_question
+)
+from utils.database import BotDatabase
+from utils.localization import Localization
+
+CATEGORY = Path('data/questions') / 'BSIS'
+QUIZ = CATEGORY / 'Powers to Arrest EN.json'
+
+# A batch runner takes a call count and returns the seconds the calls took
+Batch = Callable[[int], float]
+
+# Fixed pure-Python workload timed with every run; comparisons are scaled by
+# its change so a machine that is slower as a whole does not flag every case
+REFERENCE = "reference"
+
+
+def reference_workload() -> int:
+    total = 0
+    for index in range(1000):
+        total += len(str(index)) * (index % 7)
+    return total
+
+
+def measure(batch: Batch, repeat: int, min_time: float) -> Dict[str, float]:
+    """
+    Times a case, returning the fastest and median nanoseconds per call.
+    """
+    number = 1
+    while True:
+        if batch(number) >= min_time:
+            break
+        number *= 2
+    runs = sorted(batch(number) / number * 1e9 for _ in range(repeat))
+    return {'ns': round(runs[0], 1), 'median_ns': round(runs[len(runs) // 2], 1),
+            'number': number}
+
+
+def sync_batch(function: Callable[[], Any]) -> Batch:
+    return timeit.Timer(function).timeit
+
+
+def async_batch(loop: asyncio.AbstractEventLoop, function: Callable[[], Awaitable[Any]],
+                after: Optional[Callable[[], Awaitable[Any]]] = None) -> Batch:
+    async def calls(number: int) -> float:
+        started = time.perf_counter()
+        for _ in range(number):
+            await function()
+        if after is not None:
+            await after()
+        return time.perf_counter() - started
+
+    return lambda number: loop.run_until_complete(calls(number))
+
+
+def quiz_cases(config: Dict[str, Any], loop: asyncio.AbstractEventLoop) -> List[Tuple[str, Batch]]:
+    with open(QUIZ, 'r', encoding='utf-8') as file:
+        questions = json.load(file)
+    question = questions[0]
+    answer = question['answers'][1]
+    localization = Localization('en')
+    emoji = config['emoji']
+
+    context = make_context(config, None, FakeBot())
+    context.user_data.update({'quiz_data': questions[:20], 'current_index': 3,
+                              'quiz_nonce': "k3x9", 'timer_enabled': False,
+                              'localization': localization})
+    update = make_update(make_user(1), 1, FakeBot().calls, data="nxt_k3x9_2")
+
+    return [
+        (REFERENCE, sync_batch(reference_workload)),
+        ("quizzes.extract_key", sync_batch(lambda: extract_key(answer))),
+        ("quizzes.format_question_message", sync_batch(
+            lambda: format_question_message(question, answer, emoji, localization))),
+        ("quizzes.send_question", async_batch(
+            loop, lambda: send_question(update, context, config))),
+        ("quizzes.load_random_questions", sync_batch(
+            lambda: load_random_questions(str(QUIZ), 20, True))),
+        ("quizzes.get_quiz_files", sync_batch(
+            lambda: get_quiz_files(str(CATEGORY), NullLogger()))),
+        ("localization.get", sync_batch(
+            lambda: localization.get("time_remaining", minutes=4, seconds=30))),
+        ("localization.load", sync_batch(lambda: Localization('en'))),
+    ]
+
+
+def database_cases(config: Dict[str, Any], loop: asyncio.AbstractEventLoop,
+                   directory: Path) -> Tuple[List[Tuple[str, Batch]], BotDatabase]:
+    """
+    Returns the database cases and the database they run on, to be closed.
+    """
+    db = make_database(directory / 'micro.db', config)
+    loop.run_until_complete(db.init())
+    user = make_user(1)
+    user_id = loop.run_until_complete(db.get_or_create_user(user, "en"))
+    # Attempts saved while timing go to another user, so user 1's history stays the same
+    other_id = loop.run_until_complete(db.get_or_create_user(make_user(2), "en"))
+    for index in range(200):
+        loop.run_until_complete(db.save_quiz_attempt(
+            user_id, "BSIS", "Powers to Arrest EN", 20, index % 21,
+            started_at="2024-01-01T00:00:00Z",
+            finished_at=f"2024-{index % 12 + 1:02d}-{index % 28 + 1:02d}T12:00:00Z"))
+    session = {'user_id': user_id, 'chat_id': 1, 'category': "BSIS",
+               'quiz_name': "Powers to Arrest EN", 'question_ids': list(range(20)),
+               'current_index': 3, 'correct_count': 2, 'quiz_nonce': "k3x9",
+               'started_at': "2024-01-01T00:00:00Z", 'deadline': None}
+    for telegram_id in range(1000, 1100):
+        loop.run_until_complete(db.upsert_quiz_session(telegram_id, session))
+    loop.run_until_complete(db.flush())
+    page, _ = loop.run_until_complete(db.get_attempt_history(user_id, limit=5))
+    cursor = (page[-1]['finished_at'], page[-1]['id'])
+
+    def db_batch(call: Callable[[], Awaitable[Any]]) -> Batch:
+        return async_batch(loop, call, after=db.flush)
+
+    cases = [
+        ("db.get_or_create_user", db_batch(lambda: db.get_or_create_user(user, "en"))),
+        ("db.get_user_language", db_batch(lambda: db.get_user_language(user_id))),
+        ("db.update_user_language", db_batch(lambda: db.update_user_language(user_id, "en"))),
+        ("db.get_user_settings", db_batch(lambda: db.get_user_settings(user_id))),
+        ("db.update_user_settings", db_batch(
+            lambda: db.update_user_settings(user_id, questions_count=20))),
+        ("db.save_quiz_attempt", db_batch(lambda: db.save_quiz_attempt(
+            other_id, "BSIS", "Powers to Arrest EN", 20, 17))),
+        ("db.get_user_stats", db_batch(lambda: db.get_user_stats(user_id))),
+        ("db.get_attempt_history", db_batch(lambda: db.get_attempt_history(user_id, limit=5))),
+        ("db.get_attempt_history (page 2)", db_batch(
+            lambda: db.get_attempt_history(user_id, limit=5, cursor=cursor))),
+        ("db.upsert_quiz_session", db_batch(lambda: db.upsert_quiz_session(1, session))),
+        ("db.delete_quiz_session", db_batch(lambda: db.delete_quiz_session(1))),
+        ("db.load_quiz_sessions", db_batch(db.load_quiz_sessions)),
+    ]
+    return cases, db
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any],
+            threshold: float) -> List[str]:
+    """
+    Prints each case against the baseline and returns the regressed ones.
+    """
+    regressions = []
+    speed = 1.0
+    if REFERENCE in results and REFERENCE in baseline['results']:
+        speed = results[REFERENCE]['ns'] / baseline['results'][REFERENCE]['ns']
+        print(f"\nreference workload: {(speed - 1) * 100:+.1f}% against the baseline; "
+              f"changes below are relative to it")
+    print(f"\n{'case':<34} {'baseline us':>12} {'now us':>10} {'change':>8}")
+    for name, result in results.items():
+        if name == REFERENCE:
+            continue
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f"{name:<34} {'-':>12} {result['ns'] / 1000:>10.2f}      new")
+            continue
+        change = (result['ns'] / before['ns'] / speed - 1) * 100
+        median_change = (result['median_ns'] / before['median_ns'] / speed - 1) * 100
+        flag = ""
+        # Both the fastest and the median run must have slowed down
+        if min(change, median_change) > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{name:<34} {before['ns'] / 1000:>12.2f} {result['ns'] / 1000:>10.2f} "
+              f"{change:>+7.1f}%{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--filter', default="", help="Only run cases containing this text")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per case")
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="Seconds a timed run lasts at least")
+    parser.add_argument('--save', help="Write the results to this JSON baseline")
+    parser.add_argument('--compare', help="Compare with this JSON baseline")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="Percent slowdown reported as a regression")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+
+    config = load_config()
+    loop = asyncio.new_event_loop()
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_cases, db = database_cases(config, loop, Path(tmp))
+        try:
+            print(f"{'case':<34} {'us/call':>10} {'median':>10} {'calls':>8}")
+            for name, batch in quiz_cases(config, loop) + db_cases:
+                if args.filter not in name and name != REFERENCE:
+                    continue
+                result = results[name] = measure(batch, args.repeat, args.min_time)
+                print(f"{name:<34} {result['ns'] / 1000:>10.2f} "
+                      f"{result['median_ns'] / 1000:>10.2f} {result['number']:>8}")
+        finally:
+            loop.run_until_complete(db.close())
+            loop.close()
+
+    if args.save:
+        Path(args.save).write_text(json.dumps({
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'results': results,
+        }, indent=2), encoding='utf-8')
+        print(f"\nBaseline written to {args.save}")
+    if baseline is not None:
+        if baseline.get('python') != platform.python_version():
+            print(f"\nnote: baseline is from Python {baseline.get('python')}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nFAIL: {len(regressions)} cases slower by more than "
+                  f"{args.threshold:g}%: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
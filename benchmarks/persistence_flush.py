@@ -0,0 +1,115 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/persistence_flush.py
+
+Description:
+Measures the cost of a SessionPersistence run with many in-flight quiz
+sessions. Each run mirrors what python-telegram-bot does every update_interval:
+deep-copy the user_data of touched users and gather update_user_data for them.
+Three passes are timed: the initial write of every session, a steady-state run
+where only a fraction of the sessions advanced, and a restart that loads all
+sessions back. The initial write is repeated with one commit per row to show
+what the batched writer saves.
+
+Usage:
+    python -m benchmarks.persistence_flush --sessions 10000 --changed 0.05
+"""
+
+import argparse
+import asyncio
+import copy
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Any
+
+from benchmarks.stubs import load_config, make_database
+from modules.telegram.persistence import SessionPersistence
+
+
+def make_sessions(count: int, rng: random.Random) -> Dict[int, Dict[str, Any]]:
+    sessions = {}
+    for telegram_id in range(1, count + 1):
+        sessions[telegram_id] = {
+            'user_id': telegram_id,
+            'telegram_id': telegram_id,
+            'chat_id': telegram_id,
+            'last_category': "BSIS",
+            'last_quiz': "Powers to Arrest EN",
+            'question_ids': rng.sample(range(100), 30),
+            'current_index': 0,
+            'correct_count': 0,
+            'quiz_nonce': f"{telegram_id:08x}",
+            'quiz_started_at': "2024-01-01T00:00:00Z",
+            'quiz_deadline': time.time() + 1800,
+            'handled_callbacks': {},
+        }
+    return sessions
+
+
+async def persist(persistence: SessionPersistence, sessions, user_ids) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(persistence.update_user_data(user_id, copy.deepcopy(sessions[user_id]))
+                           for user_id in user_ids))
+    await persistence.flush()
+    return time.perf_counter() - started
+
+
+async def run(count: int, changed: float, compare_unbatched: bool) -> None:
+    config = load_config()
+    rng = random.Random(42)
+    sessions = make_sessions(count, rng)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_database(Path(tmp) / 'flush.db', config)
+        persistence = SessionPersistence(db)
+        await persistence.get_user_data()
+
+        elapsed = await persist(persistence, sessions, list(sessions))
+        print(f"initial write   {count:>7} sessions  {elapsed * 1000:>9.1f} ms  "
+              f"rows={persistence.rows_written}")
+
+        touched = rng.sample(list(sessions), max(1, int(count * changed)))
+        for user_id in touched:
+            sessions[user_id]['current_index'] += 1
+        # Users that sent an update without advancing are deep-copied but not written
+        idle = rng.sample(list(sessions), len(touched))
+        rows_before = persistence.rows_written
+        elapsed = await persist(persistence, sessions, set(touched) | set(idle))
+        print(f"steady state    {len(touched):>7} changed   {elapsed * 1000:>9.1f} ms  "
+              f"rows={persistence.rows_written - rows_before}")
+        await db.close()
+
+        restarted = SessionPersistence(db)
+        started = time.perf_counter()
+        restored = await restarted.get_user_data()
+        elapsed = time.perf_counter() - started
+        print(f"restore         {len(restored):>7} sessions  {elapsed * 1000:>9.1f} ms")
+        await db.close()
+
+        if compare_unbatched:
+            db = make_database(Path(tmp) / 'unbatched.db', config)
+            persistence = SessionPersistence(db)
+            await persistence.get_user_data()
+            db.writer.max_batch = 1
+            elapsed = await persist(persistence, sessions, list(sessions))
+            print(f"commit per row  {count:>7} sessions  {elapsed * 1000:>9.1f} ms")
+            await db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sessions', type=int, default=10000)
+    parser.add_argument('--changed', type=float, default=0.05,
+                        help="Fraction of sessions that advance between runs")
+    parser.add_argument('--compare-unbatched', action='store_true',
+                        help="Also time the initial write with one commit per row")
+    args = parser.parse_args()
+    asyncio.run(run(args.sessions, args.changed, args.compare_unbatched))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/profile_session.py
+
+Description:
+Checks on-demand profiling (utils/profiler.py) on the whole bot: it runs
+against FakeBotAPI with simulated quiz users, and profiling sessions are
+started the ways an operator would start them:
+
+- /profile from a chat other than telegram.chat_id - must be ignored;
+- /profile <seconds> sample from the admin chat;
+- SIGUSR2 (the configured mode, cprofile here);
+- /profile <seconds> memory from the admin chat.
+
+Each session's files are checked: the .collapsed file parses as
+"frame;...;frame count" lines and contains the bot's handlers, the .pstats
+file loads with pstats, the tracemalloc list is not empty. Updates handled per
+second are printed for each session next to a run without profiling.
+
+The run fails (exit status 1) when a check does not hold.
+
+Usage:
+    python -m benchmarks.profile_session
+    python -m benchmarks.profile_session --users 20 --seconds 3
+"""
+
+import argparse
+import asyncio
+import os
+import pstats
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+from benchmarks.fake_api import FakeBotAPI, quiz_user
+from benchmarks.stubs import NullLogger, load_config
+
+CATEGORY = "BSIS"
+QUIZ = "Powers to Arrest EN"
+ADMIN = 999999
+
+
+def check_cpu_files(files: List[Path]) -> List[str]:
+    """
+    Returns the problems found in a CPU session's files.
+    """
+    problems = []
+    collapsed = next((path for path in files if path.suffix == '.collapsed'), None)
+    stats = next((path for path in files if path.suffix == '.pstats'), None)
+    if collapsed is None or stats is None:
+        return [f"missing files: {files}"]
+    lines = collapsed.read_text(encoding='utf-8').splitlines()
+    for line in lines:
+        stack, _, count = line.rpartition(" ")
+        if not stack or not count.isdigit():
+            problems.append(f"malformed collapsed line: {line[:80]}")
+            break
+    if not any("modules/telegram/handlers.py" in line for line in lines):
+        problems.append("no BotHandler frame in the collapsed stacks")
+    try:
+        functions = len(pstats.Stats(str(stats)).stats)
+    except Exception as e:
+        problems.append(f"pstats file does not load: {e}")
+    else:
+        if not functions:
+            problems.append("pstats file is empty")
+    return problems
+
+
+async def session(api: FakeBotAPI, start, label: str,
+                  timeout: float) -> Tuple[float, List[Path], List[str]]:
+    """
+    Starts a session with `start()` and waits for the report in the admin chat.
+
+    Returns:
+        Tuple[float, List[Path], List[str]]: Updates per second during the
+            session, the files written and the problems found.
+    """
+    since = api.version(ADMIN)
+    confirmed, started = api.confirmed, time.perf_counter()
+    start()
+    try:
+        report = await asyncio.wait_for(
+            api.wait_for_text(ADMIN, since, lambda text: text.startswith("Profile")), timeout)
+    except asyncio.TimeoutError:
+        return 0.0, [], [f"{label}: no report within {timeout:g} s"]
+    rate = (api.confirmed - confirmed) / (time.perf_counter() - started)
+    files = [Path(line) for line in report['text'].splitlines()[1:] if line.startswith("/")]
+    problems = [] if files else [f"{label}: no files reported"]
+    return rate, files, problems
+
+
+async def run(users: int, seconds: float, tmp: Path) -> bool:
+    from app import build_application
+    from modules.telegram.lifecycle import serve_polling
+    from utils.localization import Localization
+
+    config = load_config()
+    config['database'].update({'db_source': str(tmp / "bot.db"), 'shards': 1,
+                               'persist_sessions': False})
+    config['database'].setdefault('backup', {})['enabled'] = False
+    config['question_store']['cache_directory'] = str(tmp / 'cache')
+    config['telegram'].update({'quiz_delivery': 'buttons', 'chat_id': str(ADMIN)})
+    config['base_settings']['timer_enabled'] = False
+    config['throttling'].update({'user_rate': 1000, 'user_burst': 1000, 'max_backlog': 100000})
+    config['metrics'] = {'enabled': False}
+    config['tracing'] = {'enabled': False}
+    config['profiling'] = {'enabled': True, 'directory': str(tmp / 'logs'), 'seconds': seconds,
+                           'mode': "cprofile"}
+    questions = config['base_settings']['questions_count'][0]
+
+    api = FakeBotAPI()
+    application = build_application(config, NullLogger(), Localization('en'),
+                                    Path('data/questions'), config['telegram'].get('parse_mode'),
+                                    "123:fake", request=api)
+    bot = asyncio.create_task(serve_polling(application))
+    simulators = [asyncio.create_task(quiz_user(api, user_id, CATEGORY, QUIZ, questions, []))
+                  for user_id in range(1, users + 1)]
+    admin = {'id': ADMIN, 'is_bot': False, 'first_name': "Admin", 'language_code': "en"}
+    stranger = {'id': users + 1, 'is_bot': False, 'first_name': "Sim", 'language_code': "en"}
+    await asyncio.sleep(1.0)
+
+    ok = True
+    confirmed = api.confirmed
+    await asyncio.sleep(seconds)
+    print(f"{'no profiling':<16} {(api.confirmed - confirmed) / seconds:>7.0f} updates/s")
+
+    since = api.version(users + 1)
+    api.command(stranger, f"/profile {seconds:g}")
+    await asyncio.sleep(0.5)
+    if api.version(users + 1) != since or application.bot_data['profiler'].running:
+        print("FAIL: /profile from a non-admin chat was answered")
+        ok = False
+
+    sessions = [
+        ("sample", lambda: api.command(admin, f"/profile {seconds:g} sample")),
+        ("cprofile", lambda: os.kill(os.getpid(), signal.SIGUSR2)),
+        ("memory", lambda: api.command(admin, f"/profile memory {seconds:g}")),
+    ]
+    exact = None
+    for mode, start in sessions:
+        if mode == "cprofile":
+            # SIGUSR2 reports to the log only; wait for the session and read the files
+            logs = tmp / 'logs'
+            before = set(logs.iterdir()) if logs.exists() else set()
+            confirmed, started = api.confirmed, time.perf_counter()
+            start()
+            await asyncio.sleep(0.1)
+            while application.bot_data['profiler'].running:
+                await asyncio.sleep(0.1)
+            rate = (api.confirmed - confirmed) / (time.perf_counter() - started)
+            files = sorted(set(logs.iterdir()) - before)
+            problems = [] if files else ["SIGUSR2 wrote no files"]
+        else:
+            rate, files, problems = await session(api, start, mode, seconds * 3 + 10)
+        if mode == "memory":
+            text = files[0].read_text(encoding='utf-8') if files else ""
+            if text.count("size=") < 2:
+                problems.append("tracemalloc list is empty")
+        elif files:
+            problems += check_cpu_files(files)
+            if mode == "cprofile":
+                exact = next((path for path in files if path.suffix == '.pstats'), None)
+        sizes = ", ".join(f"{path.name} {path.stat().st_size / 1024:.0f} KiB" for path in files)
+        print(f"{mode:<16} {rate:>7.0f} updates/s   {sizes}")
+        for problem in problems:
+            print(f"  FAIL: {problem}")
+        ok = ok and not problems
+
+    if exact is not None:
+        print("\nhottest functions of the cprofile session, by own time:")
+        pstats.Stats(str(exact), stream=sys.stdout).sort_stats('tottime').print_stats(5)
+
+    os.kill(os.getpid(), signal.SIGTERM)
+    await bot
+    for simulator in simulators:
+        simulator.cancel()
+    await asyncio.gather(*simulators, return_exceptions=True)
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--seconds', type=float, default=3.0, help="Length of each session")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = asyncio.run(run(args.users, args.seconds, Path(tmp)))
+    if not ok:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/query_plans.py
+
+Description:
+Query plan regression check for the SQL the bot sends to SQLite. For each
+seeded size (number of quiz attempts) a scripted session calls every
+BotDatabase method, plus one attempt retention run, while a trace callback
+records the statements they issue. Each distinct statement is run through
+EXPLAIN QUERY PLAN and timed. Writes are timed inside a transaction that is
+rolled back.
+
+The check fails (exit status 1) when a statement scans a whole table or
+builds a temporary B-tree, unless ALLOWED lists the reason. It also fails
+when an index is redundant because it repeats the leading columns of
+another index.
+
+Usage:
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --sizes 10000,100000 --plans
+"""
+
+import argparse
+import asyncio
+import datetime as dt
+import random
+import re
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from benchmarks.stubs import NullLogger, make_user
+from utils.database import BotDatabase
+from utils.maintenance import DatabaseMaintenance
+
+# (method, plan detail prefix) -> why the scan or temp B-tree is acceptable
+ALLOWED = {
+    ('load_quiz_sessions', "SCAN quiz_sessions"): "startup reads every running session",
+    ('apply_retention', "USE TEMP B-TREE FOR GROUP BY"): "groups one retention batch",
+}
+
+_DML = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class StatementLog:
+    """
+    Trace callback collecting the distinct statements of each labelled step.
+    """
+
+    def __init__(self):
+        self.label = ""
+        # (label, statement shape) -> first statement seen, with its literal values
+        self.statements: Dict[Tuple[str, str], str] = {}
+
+    def __call__(self, sql: str) -> None:
+        words = sql.split(None, 1)
+        if self.label and words and words[0].upper() in _DML:
+            shape = " ".join(_LITERALS.sub("?", sql).split())
+            self.statements.setdefault((self.label, shape), sql)
+
+
+class TracedMaintenance(DatabaseMaintenance):
+    """
+    DatabaseMaintenance whose own connections report to the statement log.
+    """
+
+    def __init__(self, db, log: StatementLog, **kwargs):
+        super().__init__(db, NullLogger(), **kwargs)
+        self.log = log
+
+    def _connect(self, path: Path) -> sqlite3.Connection:
+        conn = super()._connect(path)
+        conn.set_trace_callback(self.log)
+        return conn
+
+
+def seed(path: Path, attempts: int, rng: random.Random) -> int:
+    """
+    Fills a migrated database with users, attempts, rollups and sessions.
+
+    Returns:
+        int: Number of users.
+    """
+    users = max(100, attempts // 50)
+    now = dt.datetime.utcnow()
+
+    def stamp(days_ago: float) -> str:
+        return (now - dt.timedelta(days=days_ago)).replace(microsecond=0).isoformat() + "Z"
+
+    with sqlite3.connect(path) as conn:
+        conn.executemany(
+            "INSERT INTO users (id, telegram_id, username, language, last_seen_at) "
+            "VALUES (?, ?, ?, 'en', ?)",
+            [(user_id, 10_000_000 + user_id, f"user{user_id}", stamp(rng.uniform(0, 30)))
+             for user_id in range(1, users + 1)])
+        conn.executemany(
+            "INSERT INTO user_settings (user_id, questions_count, timer_enabled, timer_limit, "
+            "questions_random_enabled) VALUES (?, 10, 1, 5, 1)",
+            [(user_id,) for user_id in range(1, users + 1)])
+        rows = []
+        for _ in range(attempts):
+            correct = rng.randint(0, 10)
+            finished = stamp(rng.uniform(0, 730))
+            rows.append((rng.randint(1, users), rng.choice(("BSIS", "GEN")), "Quiz EN", 10,
+                         correct, correct * 10.0, int(correct >= 8), finished, finished, 60))
+        # Insert in time order, like the bot does
+        rows.sort(key=lambda row: row[7])
+        conn.executemany(
+            "INSERT INTO quiz_attempts (user_id, category, quiz_name, total_questions, "
+            "correct_count, success_rate, passed, started_at, finished_at, duration_seconds) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.executemany(
+            "INSERT INTO quiz_sessions (telegram_id, user_id, chat_id, question_ids) "
+            "VALUES (?, ?, ?, '[1,2,3]')",
+            [(10_000_000 + user_id, user_id, 10_000_000 + user_id)
+             for user_id in range(1, users + 1, 10)])
+    return users
+
+
+async def record_statements(path: Path, users: int) -> StatementLog:
+    """
+    Runs every BotDatabase method once and returns the statements they issued.
+    """
+    log = StatementLog()
+    db = BotDatabase(str(path), default_settings={'questions_count': 10})
+    await db.init()
+    await db.conn.set_trace_callback(log)
+    user_id = users // 2
+    telegram_id = 10_000_000 + user_id
+    session = {'user_id': user_id, 'chat_id': telegram_id, 'question_ids': [1, 2, 3]}
+    steps = [
+        ('get_or_create_user (new)', lambda: db.get_or_create_user(make_user(1), "en")),
+        ('get_or_create_user', lambda: db.get_or_create_user(make_user(telegram_id), "en")),
+        ('get_user_language', lambda: db.get_user_language(user_id)),
+        ('update_user_language', lambda: db.update_user_language(user_id, "en")),
+        ('get_user_settings', lambda: db.get_user_settings(user_id)),
+        ('update_user_settings', lambda: db.update_user_settings(user_id, last_quiz="Quiz EN")),
+        ('save_quiz_attempt', lambda: db.save_quiz_attempt(user_id, "BSIS", "Quiz EN", 10, 8)),
+        ('get_user_stats', lambda: db.get_user_stats(user_id)),
+        ('get_attempt_history', lambda: db.get_attempt_history(user_id)),
+        ('get_attempt_history (older)',
+         lambda: db.get_attempt_history(user_id, cursor=("2030-01-01T00:00:00Z", 1))),
+        ('get_attempt_history (newer)',
+         lambda: db.get_attempt_history(user_id, cursor=("2000-01-01T00:00:00Z", 1), newer=True)),
+        ('upsert_quiz_session', lambda: db.upsert_quiz_session(telegram_id, session)),
+        ('delete_quiz_session', lambda: db.delete_quiz_session(telegram_id)),
+        ('load_quiz_sessions', lambda: db.load_quiz_sessions()),
+    ]
+    for label, call in steps:
+        log.label = label
+        await call()
+        await db.flush()
+    # Seeded attempts go back two years; roll up the oldest few days only
+    log.label = 'apply_retention'
+    await TracedMaintenance(db, log, retention_days=725).apply_retention()
+    log.label = ""
+    await db.close()
+    return log
+
+
+def plan_of(conn: sqlite3.Connection, sql: str) -> List[str]:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def plan_problems(label: str, plan: List[str], tables: set) -> List[str]:
+    problems = []
+    for detail in plan:
+        scan = re.match(r"SCAN (\w+)", detail)
+        bad = (scan and scan.group(1) in tables) or "USE TEMP B-TREE" in detail
+        if bad and not any(key == label and detail.startswith(prefix)
+                           for key, prefix in ALLOWED):
+            problems.append(detail)
+    return problems
+
+
+def redundant_indexes(conn: sqlite3.Connection) -> List[str]:
+    """
+    Returns indexes whose columns are a leading part of another index on the same table.
+    """
+    found = []
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    for table in tables:
+        indexes = {}
+        for _, name, unique, *_ in conn.execute(f"PRAGMA index_list('{table}')"):
+            columns = tuple(row[2] for row in conn.execute(f"PRAGMA index_info('{name}')"))
+            indexes[name] = (columns, bool(unique))
+        for name, (columns, unique) in indexes.items():
+            for other, (other_columns, _) in indexes.items():
+                if other == name or other_columns[:len(columns)] != columns:
+                    continue
+                if columns == other_columns:
+                    # Of an identical pair, report the explicit index (or the later name)
+                    redundant = (not name.startswith("sqlite_autoindex")
+                                 and (other.startswith("sqlite_autoindex") or name > other))
+                else:
+                    # A unique prefix still enforces its constraint
+                    redundant = not unique
+                if redundant:
+                    found.append(f"{table}.{name}{columns} duplicates {other}{other_columns}")
+                    break
+    return found
+
+
+def time_statement(conn: sqlite3.Connection, sql: str, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        conn.execute("BEGIN")
+        started = time.perf_counter()
+        conn.execute(sql).fetchall()
+        samples.append(time.perf_counter() - started)
+        conn.execute("ROLLBACK")
+    return statistics.median(samples)
+
+
+async def check_size(attempts: int, repeat: int, rng: random.Random):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'plans.db'
+        db = BotDatabase(str(path))
+        await db.init()
+        await db.close()
+        users = seed(path, attempts, rng)
+        # Statements are replayed on the seeded state, not on what recording changed
+        pristine = Path(tmp) / 'pristine.db'
+        shutil.copyfile(path, pristine)
+        log = await record_statements(path, users)
+
+        conn = sqlite3.connect(pristine, isolation_level=None)
+        conn.execute("CREATE TEMP TABLE retention_batch (id INTEGER PRIMARY KEY)")
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        results = {}
+        for key, sql in log.statements.items():
+            plan = plan_of(conn, sql)
+            results[key] = (plan, plan_problems(key[0], plan, tables),
+                            time_statement(conn, sql, repeat))
+        redundant = redundant_indexes(conn)
+        conn.close()
+    return results, redundant
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default="10000,100000,1000000",
+                        help="Comma-separated numbers of seeded quiz attempts")
+    parser.add_argument('--repeat', type=int, default=20, help="Timed runs per statement")
+    parser.add_argument('--plans', action='store_true', help="Print the plan of every statement")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    by_size = {}
+    redundant = set()
+    for size in sizes:
+        started = time.perf_counter()
+        by_size[size], found = asyncio.run(check_size(size, args.repeat, random.Random(size)))
+        redundant.update(found)
+        print(f"checked {size} attempts in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    keys = sorted({key for results in by_size.values() for key in results})
+    width = max(len(label) for label, _ in keys)
+    print(f"{'method':<{width}}  " + "".join(f"{f'{size:,} ms':>14}" for size in sizes)
+          + "  statement")
+    failures = []
+    for key in keys:
+        label, shape = key
+        row = [by_size[size].get(key) for size in sizes]
+        print(f"{label:<{width}}  "
+              + "".join(f"{result[2] * 1000:>14.3f}" if result else f"{'-':>14}"
+                        for result in row)
+              + f"  {shape[:70]}")
+        plan, problems, _ = next(result for result in reversed(row) if result)
+        if args.plans:
+            for detail in plan:
+                print(f"{'':<{width}}    {detail}")
+        for size, result in zip(sizes, row):
+            if result and result[1]:
+                failures.append(f"{label} at {size} attempts: {'; '.join(result[1])}\n    {shape}")
+
+    for finding in sorted(redundant):
+        failures.append(f"redundant index {finding}")
+    if failures:
+        print("\nFAIL")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nOK: every statement uses an index; no redundant indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/question_store_rss.py
+
+Description:
+Per-process memory report for the shared question store. Several worker
+processes run the same set of quiz sessions while alive at the same time, and
+each reports how much its RSS and PSS (proportional set size: shared pages
+divided by the processes sharing them) grew, read from /proc/self/smaps_rollup.
+
+Modes:
+    files    today's approach without the store: every quiz selection parses the
+             JSON file and the session keeps its own question dicts
+    cached   every process parses and holds every question bank
+    store    processes map the compiled store and sessions hold lazy views
+
+The banks in data/questions are replicated --copies times to get a realistic size.
+
+Usage:
+    python -m benchmarks.question_store_rss --processes 4 --copies 50 --sessions 2000
+"""
+
+import argparse
+import gc
+import multiprocessing
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+from modules.telegram.quizzes import read_questions, select_question_indices, pick_questions
+from utils.question_store import QuestionStore, build_question_store
+
+MODES = ('files', 'cached', 'store')
+
+
+def memory_kib() -> Dict[str, int]:
+    """
+    Reads Rss, Pss and private memory of the current process in KiB (Linux only).
+    """
+    values = {}
+    with open('/proc/self/smaps_rollup', 'r') as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return {'rss': values['Rss'], 'pss': values['Pss'],
+            'private': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)}
+
+
+def worker(mode: str, bank_dir: str, store_path: str, sessions: int, per_session: int,
+           seed: int, loaded, done, results) -> None:
+    gc.collect()
+    base = memory_kib()
+    rng = random.Random(seed)
+    quizzes = [(path.parent.name, path.stem, path)
+               for path in sorted(Path(bank_dir).glob('*/*.json'))]
+    if mode == 'cached':
+        cache = {(category, name): read_questions(path) for category, name, path in quizzes}
+    elif mode == 'store':
+        store = QuestionStore(store_path)
+
+    held = []
+    for _ in range(sessions):
+        category, name, path = rng.choice(quizzes)
+        if mode == 'files':
+            questions = read_questions(path)
+        elif mode == 'cached':
+            questions = cache[(category, name)]
+        else:
+            questions = store.questions(category, name)
+        session = pick_questions(questions, select_question_indices(len(questions),
+                                                                    per_session, True))
+        for question in session:
+            question['question']
+        held.append(session)
+
+    del questions
+    gc.collect()
+    # Measure while every process is alive, so shared pages are split in PSS
+    loaded.wait()
+    after = memory_kib()
+    results.put({key: after[key] - base[key] for key in after})
+    done.wait()
+
+
+def replicate_banks(source: Path, target: Path, copies: int) -> None:
+    for path in source.glob('*/*.json'):
+        category_dir = target / path.parent.name
+        category_dir.mkdir(parents=True, exist_ok=True)
+        for copy in range(copies):
+            shutil.copyfile(path, category_dir / f"{path.stem} #{copy}.json")
+
+
+def run_mode(mode: str, processes: int, bank_dir: str, store_path: str, sessions: int,
+             per_session: int) -> Dict[str, float]:
+    context = multiprocessing.get_context("spawn")
+    loaded = context.Barrier(processes)
+    done = context.Event()
+    results = context.Queue()
+    procs = [context.Process(target=worker, args=(mode, bank_dir, store_path, sessions,
+                                                  per_session, index, loaded, done, results))
+             for index in range(processes)]
+    for proc in procs:
+        proc.start()
+    samples = [results.get() for _ in procs]
+    done.set()
+    for proc in procs:
+        proc.join()
+    return {key: sum(sample[key] for sample in samples) / processes / 1024
+            for key in samples[0]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--copies', type=int, default=50,
+                        help="Replicate each question bank this many times")
+    parser.add_argument('--sessions', type=int, default=2000,
+                        help="Quiz sessions held by each process")
+    parser.add_argument('--questions', type=int, default=30, help="Questions per session")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bank_dir = Path(tmp) / 'questions'
+        replicate_banks(Path('data/questions'), bank_dir, args.copies)
+        bank_size = sum(path.stat().st_size for path in bank_dir.glob('*/*.json'))
+        started = time.perf_counter()
+        store_path = build_question_store(bank_dir, Path(tmp) / 'cache')
+        print(f"banks: {bank_size / 2**20:.1f} MiB JSON, store: "
+              f"{store_path.stat().st_size / 2**20:.1f} MiB, "
+              f"built in {time.perf_counter() - started:.2f}s")
+        print(f"{args.processes} processes x {args.sessions} sessions x "
+              f"{args.questions} questions; growth per process in MiB")
+        print(f"{'mode':<8}{'RSS':>10}{'PSS':>10}{'private':>10}{'total PSS':>12}")
+        for mode in MODES:
+            usage = run_mode(mode, args.processes, str(bank_dir), str(store_path),
+                             args.sessions, args.questions)
+            print(f"{mode:<8}{usage['rss']:>10.1f}{usage['pss']:>10.1f}"
+                  f"{usage['private']:>10.1f}{usage['pss'] * args.processes:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
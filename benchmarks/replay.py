@@ -0,0 +1,339 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/replay.py
+
+Description:
+Replays recorded traffic (utils/recorder.py, `recording` config section)
+against the bot, for comparing releases on real traffic shapes. The bot is
+built by app.build_application with the shipped configuration, a temporary
+database and FakeBotAPI as its Bot API, in this process; recorded updates are
+queued for getUpdates at their recorded times, at --speed times real time.
+
+Recorded callback queries point at messages and quiz sessions of the
+recording, so they are rewritten against what the replayed bot shows in that
+chat: the button with the same callback data, or for answer and next buttons
+the one of the same kind and answer (the quiz nonce and question index differ
+between runs). Poll answers go to the chat's latest poll. A tap whose button
+is not on screen yet waits up to --screen-wait seconds for it, as a user
+cannot tap a button before seeing it; taps that find no such button are sent
+unchanged and usually get no reply, and the report counts them as unmatched.
+
+The latency of an update is measured from it being queued to the next change
+of its chat's screen. It is reported per update kind (command, callback route,
+poll answer) as p50/p95/p99/max; updates without a reply within --step-timeout
+count as timeouts. At --speed N the per-user flood limits are raised N times,
+so compressed taps are not rejected as floods.
+
+--output writes the results to JSON; --compare reads such a file and flags
+the kinds whose p95 got slower by more than --threshold percent. The run fails
+(exit status 1) when --compare finds a regression.
+
+Usage:
+    python -m benchmarks.replay data/recordings/updates-*.jsonl.gz
+    python -m benchmarks.replay recording.jsonl.gz --speed 10 --max-gap 5 --output new.json
+    python -m benchmarks.replay recording.jsonl.gz --speed 10 --compare old.json
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import signal
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.fake_api import FakeBotAPI, StepStats
+from benchmarks.load_test import bot_config
+from benchmarks.stubs import NullLogger
+from modules.telegram.handlers import BotHandler
+from modules.telegram.quizzes import ANSWER_CALLBACK, NEXT_CALLBACK
+
+# Kinds with fewer updates than this are not compared against a baseline
+MIN_COMPARED = 20
+
+
+def read_recording(paths: List[str]) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    Reads recording files into (time, update) pairs, oldest first.
+
+    A file cut short (the bot was killed while recording) is read up to its
+    last complete line.
+    """
+    records = []
+    for path in paths:
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    records.append((record['t'], record['update']))
+        except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+            print(f"note: {path} is truncated ({e}); read {len(records)} updates so far")
+    records.sort(key=lambda record: record[0])
+    return records
+
+
+def update_kind(update: Dict[str, Any]) -> str:
+    """
+    Returns the kind an update is reported under.
+    """
+    if 'message' in update:
+        text = update['message'].get('text', "")
+        return text.split(' ', 1)[0].split('@', 1)[0] if text.startswith('/') else "message"
+    if 'callback_query' in update:
+        data = update['callback_query'].get('data') or ""
+        route = BotHandler.callback_route(data, {})
+        return route if route != "unknown" else data
+    return "poll_answer"
+
+
+def chat_of(update: Dict[str, Any]) -> int:
+    if 'message' in update:
+        return update['message']['chat']['id']
+    if 'callback_query' in update:
+        query = update['callback_query']
+        return query['message']['chat']['id'] if query.get('message') else query['from']['id']
+    return update['poll_answer']['user']['id']
+
+
+def buttons(message: Dict[str, Any]) -> List[str]:
+    return [button['callback_data']
+            for row in message.get('reply_markup', {}).get('inline_keyboard', [])
+            for button in row if button.get('callback_data')]
+
+
+class Replayer:
+    """
+    Sends recorded updates to the bot and measures the time to its reply.
+    """
+
+    def __init__(self, api: FakeBotAPI, stats: StepStats, step_timeout: float,
+                 screen_wait: float):
+        self.api = api
+        self.stats = stats
+        self.step_timeout = step_timeout
+        self.screen_wait = screen_wait
+        self.taps: Counter = Counter()
+        self._query_ids = 0
+
+    async def rewrite(self, update: Dict[str, Any], chat_id: int) -> Dict[str, Any]:
+        """
+        Points a recorded update at what the replayed bot shows in the chat.
+        """
+        update = json.loads(json.dumps(update))
+        if 'message' in update:
+            update['message']['date'] = int(time.time())
+        elif 'callback_query' in update:
+            query = update['callback_query']
+            self._query_ids += 1
+            query['id'] = str(self._query_ids)
+            data = query.get('data') or ""
+            found = await self.on_screen(chat_id, lambda: self.find_button(chat_id, data))
+            self.taps['matched' if found else 'unmatched'] += 1
+            if found:
+                query['message'], query['data'] = found
+        elif 'poll_answer' in update:
+            poll = await self.on_screen(chat_id, lambda: next(
+                (message['poll'] for message in self.api.messages(chat_id) if 'poll' in message),
+                None))
+            self.taps['matched' if poll else 'unmatched'] += 1
+            if poll:
+                update['poll_answer']['poll_id'] = poll['id']
+        return update
+
+    async def on_screen(self, chat_id: int, find: Callable[[], Any]) -> Any:
+        """
+        Returns find()'s result once it is not None, waiting up to screen_wait
+        seconds for the chat's screen to change; None after that.
+        """
+        deadline = time.perf_counter() + self.screen_wait
+        while True:
+            found = find()
+            remaining = deadline - time.perf_counter()
+            if found is not None or remaining <= 0:
+                return found
+            try:
+                await asyncio.wait_for(self.api.wait_for_text(
+                    chat_id, self.api.version(chat_id), lambda text: True), remaining)
+            except asyncio.TimeoutError:
+                return None
+
+    def find_button(self, chat_id: int, data: str) -> Optional[Tuple[Dict[str, Any], str]]:
+        """
+        Finds the button a recorded tap corresponds to on the chat's screen.
+
+        Returns:
+            Optional[Tuple[Dict[str, Any], str]]: The message and the button's
+                callback data, or None.
+        """
+        parts = data.split('_', 3)
+        session = parts[0] in (ANSWER_CALLBACK, NEXT_CALLBACK) and len(parts) >= 3
+        for message in self.api.messages(chat_id):
+            for button in buttons(message):
+                if button == data:
+                    return message, button
+                if session:
+                    candidate = button.split('_', 3)
+                    if candidate[0] == parts[0] and candidate[3:] == parts[3:]:
+                        return message, button
+        return None
+
+    async def send(self, update: Dict[str, Any]) -> None:
+        chat_id = chat_of(update)
+        kind = update_kind(update)
+        update = await self.rewrite(update, chat_id)
+        since = self.api.version(chat_id)
+        started = time.perf_counter()
+        self.api.push(update)
+        try:
+            await asyncio.wait_for(self.api.wait_for_text(chat_id, since, lambda text: True),
+                                   self.step_timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeout(kind)
+        else:
+            self.stats.record(kind, time.perf_counter() - started)
+
+
+async def run(args: argparse.Namespace, records: List[Tuple[float, Dict[str, Any]]],
+              tmp: Path) -> Dict[str, Any]:
+    from app import build_application
+    from modules.telegram.lifecycle import serve_polling
+    from utils.localization import Localization
+
+    config = bot_config(tmp, "")
+    config['recording'] = {'enabled': False}
+    throttling = config.setdefault('throttling', {})
+    throttling['user_rate'] = float(throttling.get('user_rate', 2.0)) * args.speed
+    throttling['user_burst'] = int(throttling.get('user_burst', 5) * args.speed)
+    throttling['max_backlog'] = max(int(throttling.get('max_backlog', 200)), len(records))
+
+    api = FakeBotAPI(latency=args.latency, jitter=args.jitter)
+    application = build_application(config, NullLogger(), Localization('en'),
+                                    Path('data/questions'), config['telegram'].get('parse_mode'),
+                                    "123:fake", request=api)
+    bot = asyncio.create_task(serve_polling(application))
+    while not api.calls['getUpdates']:
+        await asyncio.sleep(0.05)
+
+    stats = StepStats()
+    replayer = Replayer(api, stats, args.step_timeout, args.screen_wait)
+    pending = set()
+    started = time.perf_counter()
+    clock = 0.0
+    previous = records[0][0]
+    for recorded_at, update in records:
+        gap = (recorded_at - previous) / args.speed
+        clock += min(gap, args.max_gap) if args.max_gap else gap
+        previous = recorded_at
+        delay = started + clock - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(replayer.send(update))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    sent = time.perf_counter() - started
+    await asyncio.gather(*pending)
+
+    os.kill(os.getpid(), signal.SIGTERM)
+    await bot
+    recorded = records[-1][0] - records[0][0]
+    return {
+        'updates': len(records),
+        'recorded_seconds': round(recorded, 1),
+        'replayed_seconds': round(sent, 1),
+        'speed': args.speed,
+        'updates_per_second': len(records) / max(sent, 1e-9),
+        'taps': dict(replayer.taps),
+        'kinds': stats.summary(),
+    }
+
+
+def report(result: Dict[str, Any]) -> None:
+    taps = result['taps']
+    print(f"{result['updates']} updates recorded over {result['recorded_seconds']} s, "
+          f"replayed in {result['replayed_seconds']} s ({result['updates_per_second']:.0f}/s); "
+          f"taps matched on screen: {taps.get('matched', 0)}, "
+          f"unmatched: {taps.get('unmatched', 0)}")
+    print(f"\n{'kind':<24} {'count':>7} {'timeouts':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8}")
+    for kind, row in sorted(result['kinds'].items(), key=lambda item: -item[1]['count']):
+        print(f"{kind:<24} {row['count']:>7} {row['timeouts']:>8} {row['p50']:>8.1f} "
+              f"{row['p95']:>8.1f} {row['p99']:>8.1f} {row['max']:>8.1f}")
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Prints each kind's p50/p95/p99 against the baseline and returns the kinds
+    whose p95 regressed.
+    """
+    regressions = []
+    print(f"\n{'kind':<24} {'p50 change':>11} {'p95 change':>11} {'p99 change':>11}")
+    for kind, row in sorted(result['kinds'].items(), key=lambda item: -item[1]['count']):
+        before = baseline['kinds'].get(kind)
+        if before is None or min(row['count'], before['count']) < MIN_COMPARED:
+            continue
+        changes = [(row[name] / before[name] - 1) * 100 if before[name] else 0.0
+                   for name in ('p50', 'p95', 'p99')]
+        flag = ""
+        if changes[1] > threshold:
+            flag = "  REGRESSION"
+            regressions.append(kind)
+        print(f"{kind:<24} {changes[0]:>+10.1f}% {changes[1]:>+10.1f}% {changes[2]:>+10.1f}%{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('recordings', nargs='+', help="Recording files (.jsonl.gz)")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Replay speed, as a multiple of the recorded pace")
+    parser.add_argument('--max-gap', type=float, default=0.0,
+                        help="Longest pause between updates after scaling, seconds (0 = as recorded)")
+    parser.add_argument('--limit', type=int, default=0, help="Replay only the first N updates")
+    parser.add_argument('--step-timeout', type=float, default=10.0,
+                        help="Seconds to wait for the bot's reply to an update")
+    parser.add_argument('--screen-wait', type=float, default=2.0,
+                        help="Seconds a tap waits for its button to appear on screen")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds each Bot API call takes")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="Up to this many seconds added to each call's latency")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Compare with the results in this JSON file")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="Percent p95 slowdown reported as a regression")
+    args = parser.parse_args()
+
+    records = read_recording(args.recordings)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("No updates to replay")
+        sys.exit(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        result = asyncio.run(run(args, records, Path(tmp)))
+    report(result)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2), encoding='utf-8')
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"\nFAIL: p95 slower by more than {args.threshold:g}%: {', '.join(regressions)}")
+            sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/session_soak.py
+
+Description:
+Soak test for idle session eviction. Each round adds a batch of virtual users
+who start a quiz, answer a question and go idle; the clock is then moved past
+the idle TTL and the SessionSweeper runs. Traced Python memory is sampled
+after every round and a linear fit gives the retained bytes per user. The run
+fails (exit code 1) if that slope exceeds the threshold.
+
+Usage:
+    python -m benchmarks.session_soak --rounds 20 --users-per-round 200
+    python -m benchmarks.session_soak --no-sweep     # baseline without eviction
+"""
+
+import argparse
+import asyncio
+import gc
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import List, Tuple
+
+from benchmarks.stubs import (
+    FakeBot, NullLogger, load_config, make_context, make_database, make_update, make_user
+)
+from modules.telegram.handlers import BotHandler
+from modules.telegram.quizzes import session_callback, ANSWER_CALLBACK
+from modules.telegram.sessions import SessionSweeper
+
+CATEGORY = "BSIS"
+QUIZ = "Powers to Arrest EN"
+
+
+def slope(points: List[Tuple[int, int]]) -> float:
+    """
+    Least-squares slope of (x, y) points.
+    """
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var_x:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+
+async def run(rounds: int, users_per_round: int, sweep: bool) -> List[Tuple[int, int]]:
+    config = load_config()
+    config['telegram']['quiz_delivery'] = 'buttons'
+    calls: Counter = Counter()
+    bot = FakeBot(calls)
+    sweeper = SessionSweeper(NullLogger(), idle_ttl=60)
+    sessions = {}
+    samples = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_database(Path(tmp) / 'soak.db', config)
+        await db.init()
+        handler = BotHandler(config, NullLogger(), None, Path('data/questions'))
+        context = make_context(config, db, bot)
+        shared = (bot, context.bot_data, calls)
+        tracemalloc.start()
+        for round_index in range(rounds):
+            for offset in range(users_per_round):
+                telegram_id = round_index * users_per_round + offset + 1
+                user = make_user(telegram_id)
+                context.user_data = sessions.setdefault(telegram_id, {})
+                await handler.button(make_update(user, telegram_id, calls,
+                                                 f"quiz_{QUIZ}_{CATEGORY}"), context)
+                answer = session_callback(context, ANSWER_CALLBACK, "A")
+                await handler.button(make_update(user, telegram_id, calls, answer), context)
+            if sweep:
+                sweeper.sweep(sessions, now=time.time() + sweeper.idle_ttl + 1, shared=shared)
+            gc.collect()
+            current, _ = tracemalloc.get_traced_memory()
+            samples.append((len(sessions), current))
+        tracemalloc.stop()
+        await db.close()
+    print(f"sessions stripped: {sweeper.evicted_total}, "
+          f"bytes reclaimed: ~{sweeper.bytes_reclaimed_total}")
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--users-per-round', type=int, default=200)
+    parser.add_argument('--max-bytes-per-user', type=int, default=4096,
+                        help="Fail if retained memory grows faster than this per user")
+    parser.add_argument('--no-sweep', action='store_true', help="Disable eviction (baseline)")
+    args = parser.parse_args()
+
+    samples = asyncio.run(run(args.rounds, args.users_per_round, not args.no_sweep))
+    print(f"{'users':>8}{'traced KiB':>14}")
+    for users, current in samples:
+        print(f"{users:>8}{current / 1024:>14.1f}")
+    # Skip the first round: it includes one-off allocations (caches, imports)
+    per_user = slope(samples[1:]) if len(samples) > 2 else slope(samples)
+    print(f"retained bytes per user: {per_user:.0f} (threshold {args.max_bytes_per_user})")
+    if per_user > args.max_bytes_per_user:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/soak.py
+
+Description:
+Long-running soak test of the whole bot with memory leak detection. The bot is
+built by app.build_application with the shipped configuration, a temporary
+database and FakeBotAPI as its Bot API, in this process, and visited by
+simulated users (fake_api.virtual_user) for hours of simulated time.
+
+Time is compressed by --compression: think times, visit lengths, quiz timer
+limits, the idle session TTL and sweep interval, the persistence and
+maintenance intervals and the poll TTL are all divided by it, so 10 minutes at
+60x exercise 10 hours of timers, evictions and background jobs. Users come and
+go: a visit lasts --visit simulated minutes on average and ends wherever the
+user is, mid-quiz included (an abandoned quiz keeps its timer); a share of
+visits are by returning users, the rest by new ones.
+
+Every --sample-every seconds, after a full garbage collection, the run records
+traced Python memory (tracemalloc), asyncio tasks, objects tracked by the
+garbage collector and live telegram Message/CallbackQuery objects. After the
+--warmup, a least-squares slope per simulated hour is fitted to each series;
+the run fails (exit status 1) when any slope exceeds its threshold. The report
+lists the allocation sites that grew most between the end of the warmup and
+the end of the run.
+
+Usage:
+    python -m benchmarks.soak
+    python -m benchmarks.soak --duration 3600 --compression 120 --users 40
+    python -m benchmarks.soak --frames 10 --report soak.json
+"""
+
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import os
+import random
+import signal
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+from telegram import CallbackQuery, Message
+
+from benchmarks.fake_api import FakeBotAPI, StepStats, virtual_user
+from benchmarks.load_test import bot_config
+from benchmarks.session_soak import slope
+from benchmarks.stubs import NullLogger
+
+# Sampled series and their --max-<name>-per-hour thresholds
+SERIES = {
+    'kib': ("traced KiB", 512.0),
+    'tasks': ("asyncio tasks", 5.0),
+    'objects': ("gc objects", 5000.0),
+    'messages': ("Message/CallbackQuery", 50.0),
+}
+
+
+def scaled_config(tmp: Path, compression: float) -> Dict[str, Any]:
+    """
+    Returns the shipped configuration with files under `tmp` and every
+    time-based setting divided by `compression`.
+    """
+    config = bot_config(tmp, "")
+    config['metrics'] = {'enabled': True, 'host': "127.0.0.1", 'port': 0}
+
+    base = config['base_settings']
+    base['timer_enabled'] = True
+    base['timer_limit'] = [minutes / compression for minutes in base['timer_limit']]
+    sessions = config.setdefault('sessions', {})
+    sessions['idle_ttl'] = float(sessions.get('idle_ttl', 1800)) / compression
+    sessions['sweep_interval'] = float(sessions.get('sweep_interval', 60)) / compression
+    database = config['database']
+    database['persistence_interval'] = float(database.get('persistence_interval', 10)) / compression
+    maintenance = database.setdefault('maintenance', {})
+    maintenance['interval'] = float(maintenance.get('interval', 3600)) / compression
+    config['telegram']['poll_ttl'] = float(config['telegram'].get('poll_ttl', 3600)) / compression
+    # Users tap `compression` times as often; flood limits follow
+    throttling = config.setdefault('throttling', {})
+    throttling['user_rate'] = float(throttling.get('user_rate', 2.0)) * compression
+    throttling['user_burst'] = int(throttling.get('user_burst', 5) * compression)
+    return config
+
+
+async def visitor(api: FakeBotAPI, stats: StepStats, args: argparse.Namespace,
+                  new_ids: itertools.count, seen: List[int], active: Set[int]) -> None:
+    """
+    Plays one visit after another until cancelled, each by a new or a
+    returning user.
+    """
+    while True:
+        returning = [telegram_id for telegram_id in seen if telegram_id not in active]
+        if returning and random.random() < args.returning:
+            telegram_id = random.choice(returning)
+        else:
+            telegram_id = next(new_ids)
+            seen.append(telegram_id)
+        active.add(telegram_id)
+        visit = random.expovariate(1 / (args.visit * 60 / args.compression))
+        try:
+            await asyncio.wait_for(virtual_user(api, telegram_id, stats,
+                                                think_time=args.think / args.compression,
+                                                step_timeout=args.step_timeout), visit)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            active.discard(telegram_id)
+            # The fake's copy of the chat is test state, not the bot's; a
+            # returning user starts over with /start anyway
+            api.forget(telegram_id)
+
+
+def sample(application, started: float, compression: float) -> Dict[str, float]:
+    gc.collect()
+    objects = gc.get_objects()
+    messages = sum(1 for obj in objects if isinstance(obj, (Message, CallbackQuery)))
+    return {
+        'hours': (time.perf_counter() - started) * compression / 3600,
+        'kib': tracemalloc.get_traced_memory()[0] / 1024,
+        'tasks': len(asyncio.all_tasks()),
+        'objects': len(objects),
+        'messages': messages,
+        'sessions': len(application.user_data),
+    }
+
+
+async def run(args: argparse.Namespace, tmp: Path) -> Dict[str, Any]:
+    from app import build_application
+    from modules.telegram.lifecycle import serve_polling
+    from utils.localization import Localization
+
+    config = scaled_config(tmp, args.compression)
+    api = FakeBotAPI()
+    application = build_application(config, NullLogger(), Localization('en'),
+                                    Path('data/questions'), config['telegram'].get('parse_mode'),
+                                    "123:fake", request=api)
+    tracemalloc.start(args.frames)
+    bot = asyncio.create_task(serve_polling(application))
+    while not api.calls['getUpdates']:
+        await asyncio.sleep(0.05)
+
+    stats = StepStats()
+    new_ids, seen, active = itertools.count(1), [], set()
+    visitors = [asyncio.create_task(visitor(api, stats, args, new_ids, seen, active))
+                for _ in range(args.users)]
+
+    started = time.perf_counter()
+    samples = []
+    baseline = None
+    while time.perf_counter() - started < args.duration:
+        await asyncio.sleep(args.sample_every)
+        samples.append(sample(application, started, args.compression))
+        if baseline is None and time.perf_counter() - started >= args.warmup:
+            baseline = tracemalloc.take_snapshot()
+            samples[-1]['warm'] = True
+        row = samples[-1]
+        print(f"{row['hours']:>6.2f} h  {row['kib']:>9.0f} KiB  {row['tasks']:>5} tasks  "
+              f"{row['objects']:>8} objects  {row['messages']:>5} messages  "
+              f"{row['sessions']:>6} sessions  {api.confirmed - 1:>8} updates", flush=True)
+    final = tracemalloc.take_snapshot()
+
+    for task in visitors:
+        task.cancel()
+    await asyncio.gather(*visitors, return_exceptions=True)
+    os.kill(os.getpid(), signal.SIGTERM)
+    await bot
+    tracemalloc.stop()
+
+    warm = next((index for index, row in enumerate(samples) if row.get('warm')), 0)
+    measured = samples[warm:]
+    slopes = {name: slope([(row['hours'], row[name]) for row in measured])
+              if len(measured) > 2 else 0.0 for name in SERIES}
+    ignored = (tracemalloc.Filter(False, tracemalloc.__file__),
+               tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+               tracemalloc.Filter(False, "<unknown>"))
+    group = 'traceback' if args.frames > 1 else 'lineno'
+    growth = []
+    if baseline is not None:
+        growth = final.filter_traces(ignored).compare_to(baseline.filter_traces(ignored),
+                                                         group)[:args.top]
+    return {
+        'simulated_hours': samples[-1]['hours'] if samples else 0.0,
+        'users_seen': len(seen),
+        'updates': api.confirmed - 1,
+        'steps': stats.summary(),
+        'samples': samples,
+        'slopes': slopes,
+        'growth': [{'site': str(stat), 'size_diff': stat.size_diff, 'count_diff': stat.count_diff,
+                    'traceback': stat.traceback.format() if group == 'traceback' else []}
+                   for stat in growth],
+    }
+
+
+def report(result: Dict[str, Any], thresholds: Dict[str, float]) -> List[str]:
+    """
+    Prints the slopes and the allocation sites that grew most, returning the
+    series whose slope exceeds its threshold.
+    """
+    print(f"\n{result['simulated_hours']:.1f} simulated hours, {result['users_seen']} users, "
+          f"{result['updates']} updates; "
+          f"{sum(row['timeouts'] for row in result['steps'].values())} steps timed out")
+    print(f"\n{'series':<24} {'per hour':>10} {'threshold':>10}")
+    failed = []
+    for name, (label, _) in SERIES.items():
+        per_hour = result['slopes'][name]
+        flag = ""
+        if per_hour > thresholds[name]:
+            flag = "  FAIL"
+            failed.append(label)
+        print(f"{label:<24} {per_hour:>+10.1f} {thresholds[name]:>10g}{flag}")
+    print("\nallocation sites that grew most after the warmup:")
+    for stat in result['growth']:
+        print(f"  {stat['site']}")
+        for line in stat['traceback']:
+            print(f"      {line}")
+    return failed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--duration', type=float, default=600.0, help="Real seconds to run")
+    parser.add_argument('--compression', type=float, default=60.0,
+                        help="Simulated seconds per real second")
+    parser.add_argument('--warmup', type=float, default=60.0,
+                        help="Real seconds before growth is measured")
+    parser.add_argument('--sample-every', type=float, default=10.0,
+                        help="Real seconds between samples")
+    parser.add_argument('--users', type=int, default=20, help="Concurrent visits")
+    parser.add_argument('--think', type=float, default=20.0,
+                        help="Mean simulated seconds between a user's taps")
+    parser.add_argument('--visit', type=float, default=10.0,
+                        help="Mean simulated minutes of a visit")
+    parser.add_argument('--returning', type=float, default=0.3,
+                        help="Share of visits by users seen before")
+    parser.add_argument('--step-timeout', type=float, default=5.0,
+                        help="Real seconds a user waits for the bot before starting over")
+    parser.add_argument('--frames', type=int, default=1,
+                        help="Frames per allocation traced; more group growth by call path")
+    parser.add_argument('--top', type=int, default=15, help="Allocation sites reported")
+    for name, (label, default) in SERIES.items():
+        parser.add_argument(f'--max-{name}-per-hour', type=float, default=default,
+                            help=f"Fail when {label} grow faster than this per simulated hour")
+    parser.add_argument('--report', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = asyncio.run(run(args, Path(tmp)))
+    thresholds = {name: getattr(args, f'max_{name}_per_hour') for name in SERIES}
+    failed = report(result, thresholds)
+    if args.report:
+        Path(args.report).write_text(json.dumps(result, indent=2), encoding='utf-8')
+    if failed:
+        print(f"\nFAIL: {', '.join(failed)} keep growing")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: benchmarks/stubs.py
+
+Description:
+This module provides lightweight in-process stand-ins for the Telegram objects
+the handlers touch (Bot, Message, CallbackQuery, Update, CallbackContext) and a
+call-counting wrapper around BotDatabase. Benchmarks use them to drive the real
+handler code without network access.
+"""
+
+import itertools
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+import yaml
+
+from utils.database import BotDatabase
+from utils.localization import Localization
+from utils.logger import EventLogger
+from utils.tasks import TaskSupervisor
+
+_message_ids = itertools.count(1)
+
+
+class NullLogger:
+    """
+    Logger stand-in that discards everything.
+    """
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class FakeMessage:
+    """
+    Message stand-in recording edit and delete calls.
+    """
+
+    def __init__(self, calls: Counter, chat_id: int):
+        self.calls = calls
+        self.chat_id = chat_id
+        self.message_id = next(_message_ids)
+        self.poll = None
+
+    async def edit_text(self, *args, **kwargs):
+        self.calls['editMessageText'] += 1
+        return self
+
+    async def reply_text(self, *args, **kwargs):
+        self.calls['sendMessage'] += 1
+        return FakeMessage(self.calls, self.chat_id)
+
+    async def delete(self):
+        self.calls['deleteMessage'] += 1
+        return True
+
+
+class FakeBot:
+    """
+    Bot stand-in recording outbound API calls.
+    """
+
+    def __init__(self, calls: Optional[Counter] = None):
+        self.calls = calls if calls is not None else Counter()
+
+    async def send_message(self, chat_id, *args, **kwargs):
+        self.calls['sendMessage'] += 1
+        return FakeMessage(self.calls, chat_id)
+
+    async def send_poll(self, chat_id, *args, **kwargs):
+        self.calls['sendPoll'] += 1
+        message = FakeMessage(self.calls, chat_id)
+        message.poll = SimpleNamespace(id=str(message.message_id))
+        return message
+
+
+class FakeQuery:
+    """
+    CallbackQuery stand-in bound to a FakeMessage.
+    """
+
+    def __init__(self, calls: Counter, user, data: str, message: FakeMessage):
+        self.calls = calls
+        self.from_user = user
+        self.data = data
+        self.message = message
+
+    async def answer(self, *args, **kwargs):
+        self.calls['answerCallbackQuery'] += 1
+        return True
+
+    async def edit_message_text(self, *args, **kwargs):
+        self.calls['editMessageText'] += 1
+        return self.message
+
+
+def make_user(telegram_id: int) -> SimpleNamespace:
+    return SimpleNamespace(id=telegram_id, username=f"user{telegram_id}",
+                           first_name="Bench", last_name=None, language_code="en")
+
+
+def make_update(user, chat_id: int, calls: Counter, data: Optional[str] = None,
+                message: Optional[FakeMessage] = None) -> SimpleNamespace:
+    """
+    Builds a command update (data is None) or a callback query update.
+    """
+    message = message or FakeMessage(calls, chat_id)
+    query = FakeQuery(calls, user, data, message) if data is not None else None
+    return SimpleNamespace(effective_user=user, effective_chat=SimpleNamespace(id=chat_id),
+                           callback_query=query, message=None if query else message,
+                           poll_answer=None)
+
+
+class CountingDatabase:
+    """
+    Proxy around BotDatabase counting awaited method calls.
+    """
+
+    def __init__(self, db: BotDatabase, calls: Counter):
+        self._db = db
+        self.calls = calls
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        async def counted(*args, **kwargs):
+            self.calls[f"db.{name}"] += 1
+            return await attr(*args, **kwargs)
+        return counted
+
+
+def load_config() -> Dict[str, Any]:
+    with open(Path('configs') / 'config.yml', 'r', encoding='utf-8') as file:
+        return yaml.safe_load(file)
+
+
+def make_context(config: Dict[str, Any], db: Any, bot: FakeBot,
+                 user_data: Optional[Dict[str, Any]] = None) -> SimpleNamespace:
+    """
+    Builds a CallbackContext stand-in sharing bot_data with its application.
+    """
+    bot_data = {
+        'config': config,
+        'logger': NullLogger(),
+        'events': EventLogger(NullLogger()),
+        'localization': Localization(config['telegram']['language']),
+        'parse_mode': config['telegram'].get('parse_mode', 'HTML'),
+        'db': db,
+        'tasks': TaskSupervisor(NullLogger()),
+    }
+    application = SimpleNamespace(bot_data=bot_data,
+                                  mark_data_for_update_persistence=lambda **kwargs: None)
+    return SimpleNamespace(bot=bot, bot_data=bot_data, application=application,
+                           user_data=user_data if user_data is not None else {})
+
+
+def make_database(path: Path, config: Dict[str, Any]) -> BotDatabase:
+    base = config['base_settings']
+    return BotDatabase(db_path=str(path), success_rate=base['success_rate'],
+                       default_settings={
+                           'questions_count': base['questions_count'][0],
+                           'timer_enabled': False,
+                           'timer_limit': base['timer_limit'][0],
+                           'questions_random_enabled': base['questions_random_enabled'],
+                       })
@@ -104,7 +104,7 @@ def main():
         sys.stdout.write("No environment overrides provided. Using existing YAML config.\n")
 
     # Exec the app
-    os.execvp("python", ["python", "app.py"])  # replace process
+    os.execvp("python", ["python", "app.py", *sys.argv[1:]])  # replace process, passing options on
 
 
 if __name__ == "__main__":
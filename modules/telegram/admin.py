@@ -0,0 +1,107 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: modules/telegram/admin.py
+
+Description:
+This module implements the admin-only /profile command. Only the chat
+configured as `telegram.chat_id` may use it; commands from any other chat are
+logged and ignored without a reply.
+
+"/profile [seconds] [sample|cprofile|memory]" starts a profiling session
+(utils/profiler.py) as a background task and replies right away; when the
+session ends the admin chat gets the paths of the written files and the
+hottest functions or largest allocation sites.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from telegram import Bot, Update
+from telegram.ext import CallbackContext
+from utils.profiler import MODES, Profiler
+
+USAGE = f"Usage: /profile [seconds] [{'|'.join(MODES)}]"
+
+
+def is_admin_chat(update: Update, config: Dict[str, Any]) -> bool:
+    """
+    Tells whether an update comes from the admin chat (`telegram.chat_id`).
+    """
+    chat = update.effective_chat
+    return chat is not None and str(chat.id) == str(config['telegram'].get('chat_id'))
+
+
+def parse_profile_args(args: List[str]) -> Tuple[Optional[float], Optional[str]]:
+    """
+    Parses the arguments of /profile, in any order.
+
+    Returns:
+        Tuple[Optional[float], Optional[str]]: Seconds and mode; None for the
+            profiler's defaults.
+
+    Raises:
+        ValueError: An argument is neither a positive number nor a mode.
+    """
+    seconds = mode = None
+    for arg in args:
+        if arg.lower() in MODES:
+            mode = arg.lower()
+            continue
+        seconds = float(arg)
+        if not seconds > 0:
+            raise ValueError(arg)
+    return seconds, mode
+
+
+async def handle_profile_command(update: Update, context: CallbackContext) -> None:
+    """
+    Starts a profiling session requested from the admin chat.
+
+    Args:
+        update (Update): The update object from Telegram.
+        context (CallbackContext): The context object from Telegram.
+    """
+    logger = context.bot_data['logger']
+    if not is_admin_chat(update, context.bot_data['config']):
+        logger.warning(f"Ignored /profile from chat {update.effective_chat.id}")
+        return
+    profiler: Optional[Profiler] = context.bot_data.get('profiler')
+    if profiler is None:
+        await update.message.reply_text("Profiling is disabled in the configuration")
+        return
+    if profiler.running:
+        await update.message.reply_text(f"A {profiler.running} session is already running")
+        return
+    try:
+        seconds, mode = parse_profile_args(context.args or [])
+    except ValueError:
+        await update.message.reply_text(USAGE)
+        return
+
+    chat_id = update.effective_chat.id
+    task = context.bot_data['tasks'].spawn(
+        report_profile(context.bot, chat_id, profiler, seconds, mode),
+        owner="diagnostics", kind="profiler")
+    if task is None:
+        await update.message.reply_text("Too many background tasks, try again later")
+        return
+    seconds = min(seconds or profiler.seconds, profiler.max_seconds)
+    await update.message.reply_text(f"Profiling ({mode or profiler.mode}) for {seconds:g} s")
+
+
+async def report_profile(bot: Bot, chat_id: int, profiler: Profiler,
+                         seconds: Optional[float], mode: Optional[str]) -> None:
+    """
+    Runs a profiling session and sends its result to the admin chat.
+    """
+    try:
+        files, summary = await profiler.profile(seconds, mode)
+    except (RuntimeError, OSError, ValueError) as e:
+        # Busy profiler, unwritable output directory or full disk, unknown mode
+        profiler.logger.error(f"Profiling session failed: {e}")
+        await bot.send_message(chat_id, f"Profiling failed: {e}")
+        return
+    text = "\n".join(["Profile written:"] + [str(path) for path in files] + [""] + summary)
+    # Plain text: frame labels such as "<module>" are not valid HTML
+    await bot.send_message(chat_id, text[:4096])
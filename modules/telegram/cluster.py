@@ -0,0 +1,458 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: modules/telegram/cluster.py
+
+Description:
+This module implements the multi-process deployment mode. A front dispatcher
+receives Telegram webhook requests, hashes the sending user's id to one of N
+worker processes and forwards the raw update over a local Unix socket. Each
+worker runs a regular Application that owns the sessions of its users, and all
+workers share the SQLite database in WAL mode. A supervisor starts the workers
+and restarts any that crash.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+from telegram import Bot, Update
+from telegram.ext import Application
+
+from .lifecycle import graceful_shutdown
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+MAX_BODY_SIZE = 1 << 20
+
+
+def shard_for(user_id: Optional[int], workers: int) -> int:
+    """
+    Returns the worker index owning a user.
+
+    Args:
+        user_id (Optional[int]): Telegram user ID, None for updates without a user.
+        workers (int): Number of worker processes.
+
+    Returns:
+        int: Worker index in range(workers).
+    """
+    return user_id % workers if user_id is not None else 0
+
+
+def extract_user_id(update: Dict[str, Any]) -> Optional[int]:
+    """
+    Finds the sending user's id in a raw Telegram update.
+
+    Args:
+        update (Dict[str, Any]): Update as decoded from the webhook body.
+
+    Returns:
+        Optional[int]: Telegram user ID, or None if the update has no user.
+    """
+    for key, value in update.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        user = value.get('from') or value.get('user')
+        if isinstance(user, dict) and 'id' in user:
+            return int(user['id'])
+    return None
+
+
+class WorkerLink:
+    """
+    Connection from the dispatcher to one worker's Unix socket.
+    """
+
+    def __init__(self, socket_path: str, logger):
+        self.socket_path = socket_path
+        self.logger = logger
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connecting = asyncio.Lock()
+
+    async def send(self, line: bytes) -> bool:
+        """
+        Forwards one newline-terminated update.
+
+        Args:
+            line (bytes): JSON-encoded update followed by a newline.
+
+        Returns:
+            bool: False if the worker is unreachable.
+        """
+        try:
+            writer = await self._connect()
+            writer.write(line)
+            await writer.drain()
+            return True
+        except (OSError, ConnectionError) as e:
+            self.logger.warning(f"Worker socket {self.socket_path} unavailable: {e}")
+            self.close()
+            return False
+
+    async def _connect(self) -> asyncio.StreamWriter:
+        async with self._connecting:
+            if self._writer is None or self._writer.is_closing():
+                _, self._writer = await asyncio.open_unix_connection(self.socket_path)
+            return self._writer
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class WebhookDispatcher:
+    """
+    Minimal HTTP/1.1 webhook receiver routing updates to workers by user id.
+    """
+
+    def __init__(self, socket_paths: Sequence[str], logger, secret_token: str = ""):
+        """
+        Initializes the dispatcher.
+
+        Args:
+            socket_paths (Sequence[str]): Worker socket paths, indexed by shard.
+            logger: Logger instance.
+            secret_token (str): Expected X-Telegram-Bot-Api-Secret-Token, empty to skip the check.
+        """
+        self.links = [WorkerLink(path, logger) for path in socket_paths]
+        self.logger = logger
+        self.secret_token = secret_token
+        self.forwarded = [0] * len(self.links)
+        self.failed = 0
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._serve, host, port)
+
+    def close(self) -> None:
+        for link in self.links:
+            link.close()
+
+    async def dispatch(self, body: bytes) -> int:
+        """
+        Routes one update body to its worker.
+
+        Args:
+            body (bytes): JSON body of the webhook request.
+
+        Returns:
+            int: HTTP status for Telegram; 503 makes Telegram redeliver later.
+        """
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return 400
+        if not isinstance(update, dict):
+            return 400
+        shard = shard_for(extract_user_id(update), len(self.links))
+        if not await self.links[shard].send(body.rstrip(b"\r\n") + b"\n"):
+            self.failed += 1
+            return 503
+        self.forwarded[shard] += 1
+        return 200
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_SIZE:
+                    status = 413
+                    body = b""
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    if not request_line.startswith(b"POST "):
+                        status = 405
+                    elif self.secret_token and headers.get(SECRET_HEADER) != self.secret_token:
+                        status = 403
+                    else:
+                        status = await self.dispatch(body)
+                keep_alive = headers.get('connection', '').lower() != 'close' and status != 413
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                             f"Content-Length: 0\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                             .encode('ascii'))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve_updates(socket_path: str,
+                        handle: Callable[[Dict[str, Any]], Awaitable[None]],
+                        stop: asyncio.Event, drain_timeout: float = 0, logger=None) -> None:
+    """
+    Reads newline-delimited updates from the dispatcher until stop is set.
+
+    A line that cannot be read or decoded is logged and skipped; the
+    connection stays open for the updates after it.
+
+    Args:
+        socket_path (str): Unix socket to listen on.
+        handle (Callable): Coroutine function called with each decoded update.
+        stop (asyncio.Event): Set to shut the server down.
+        drain_timeout (float): Seconds to keep reading open connections after
+            stop, so updates the dispatcher already forwarded are not dropped.
+        logger: Logger for skipped lines; None to skip them silently.
+    """
+    connections: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    def skipped(reason: str, e: Exception) -> None:
+        if logger:
+            logger.warning(f"Skipped an update from the dispatcher on {socket_path}: {reason}: {e}")
+
+    async def on_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError as e:
+                    # Longer than the limit; the reader has dropped it
+                    skipped("line too long", e)
+                    continue
+                if not line:
+                    break
+                try:
+                    await handle(json.loads(line))
+                except (ValueError, TypeError, KeyError, AttributeError) as e:
+                    # Not JSON, or not an update Update.de_json accepts
+                    skipped("undecodable", e)
+        except ConnectionError:
+            pass
+        finally:
+            connections.pop(writer, None)
+            writer.close()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    # One line holds a whole webhook body
+    server = await asyncio.start_unix_server(on_connection, socket_path, limit=MAX_BODY_SIZE + 1)
+    try:
+        await stop.wait()
+    finally:
+        server.close()
+        if connections and drain_timeout > 0:
+            # The dispatcher closes its links before stopping workers, so
+            # readers end with EOF once the buffered updates are handled
+            await asyncio.wait(list(connections.values()), timeout=drain_timeout)
+        # Closing the transports ends the remaining readers with EOF
+        for writer in list(connections):
+            writer.close()
+        await asyncio.sleep(0)
+        await server.wait_closed()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+async def serve_worker(application: Application, socket_path: str) -> None:
+    """
+    Runs an Application fed by the dispatcher instead of polling.
+
+    Mirrors the lifecycle of Application.run_polling(): post_init, start,
+    stop and post_shutdown hooks run as usual, and shutdown goes through
+    graceful_shutdown().
+
+    Args:
+        application (Application): Application built without an Updater.
+        socket_path (str): Unix socket to receive updates on.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    shutdown_cfg = application.bot_data.get('config', {}).get('shutdown', {})
+
+    async def enqueue(data: Dict[str, Any]) -> None:
+        await application.update_queue.put(Update.de_json(data, application.bot))
+
+    await application.initialize()
+    intake = None
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        intake = loop.create_task(serve_updates(
+            socket_path, enqueue, stop, drain_timeout=shutdown_cfg.get('intake_grace', 2),
+            logger=application.bot_data['logger']))
+        # A failing socket server shuts the worker down as well
+        intake.add_done_callback(lambda _: stop.set())
+        await stop.wait()
+    finally:
+        stop.set()
+        await graceful_shutdown(application, intake=intake)
+
+
+class WorkerSupervisor:
+    """
+    Starts worker processes and restarts them when they exit unexpectedly.
+    """
+
+    def __init__(self, target: Callable[[int, int, str], None], socket_paths: Sequence[str],
+                 logger, restart_backoff: float = 1.0, max_backoff: float = 30.0):
+        """
+        Initializes the supervisor.
+
+        Args:
+            target (Callable[[int, int, str], None]): Top-level worker entry point called
+                with (index, worker count, socket path) in the child process.
+            socket_paths (Sequence[str]): Worker socket paths, indexed by shard.
+            logger: Logger instance.
+            restart_backoff (float): Initial delay before restarting a crashed worker.
+            max_backoff (float): Upper bound for the doubling restart delay.
+        """
+        self.target = target
+        self.socket_paths = list(socket_paths)
+        self.logger = logger
+        self.restart_backoff = restart_backoff
+        self.max_backoff = max_backoff
+        self._context = multiprocessing.get_context("spawn")
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * len(self.socket_paths)
+        self._started_at = [0.0] * len(self.socket_paths)
+        self._failures = [0] * len(self.socket_paths)
+        self.restarts = 0
+
+    def start_worker(self, index: int) -> None:
+        process = self._context.Process(
+            target=self.target, args=(index, len(self.socket_paths), self.socket_paths[index]),
+            name=f"qbb-worker-{index}", daemon=False)
+        process.start()
+        self.processes[index] = process
+        self._started_at[index] = time.monotonic()
+        self.logger.info(f"Started worker {index} (pid {process.pid})")
+
+    def start(self) -> None:
+        for index in range(len(self.socket_paths)):
+            self.start_worker(index)
+
+    async def monitor(self, interval: float = 1.0) -> None:
+        """
+        Restarts crashed workers until cancelled.
+
+        The restart delay doubles for a worker that keeps crashing and resets
+        once it has stayed up for max_backoff seconds.
+
+        Args:
+            interval (float): Seconds between liveness checks.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self.processes):
+                if process is None or process.is_alive():
+                    continue
+                uptime = time.monotonic() - self._started_at[index]
+                self._failures[index] = 0 if uptime > self.max_backoff else self._failures[index] + 1
+                delay = min(self.max_backoff,
+                            self.restart_backoff * (2 ** max(0, self._failures[index] - 1)))
+                self.logger.error(f"Worker {index} exited with code {process.exitcode}, "
+                                  f"restarting in {delay:.1f}s")
+                self.processes[index] = None
+                asyncio.get_running_loop().call_later(delay, self._restart, index)
+
+    def _restart(self, index: int) -> None:
+        if self.processes[index] is None:
+            self.restarts += 1
+            self.start_worker(index)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """
+        Terminates all workers, killing those that do not exit in time.
+
+        Args:
+            timeout (float): Seconds to wait for a graceful exit.
+        """
+        running = [process for process in self.processes if process is not None]
+        self.processes = [None] * len(self.socket_paths)
+        for process in running:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in running:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                self.logger.warning(f"Worker pid {process.pid} did not exit, killing it")
+                process.kill()
+                process.join()
+
+
+def socket_paths_for(config: Dict[str, Any]) -> List[str]:
+    """
+    Returns the worker socket paths for the configured cluster size.
+
+    Args:
+        config (Dict[str, Any]): The bot's configuration dictionary.
+
+    Returns:
+        List[str]: One socket path per worker.
+    """
+    cluster_cfg = config.get('cluster', {})
+    socket_dir = Path(cluster_cfg.get('socket_dir', 'data/run'))
+    socket_dir.mkdir(parents=True, exist_ok=True)
+    return [str(socket_dir / f"worker-{index}.sock")
+            for index in range(int(cluster_cfg.get('workers', 1)))]
+
+
+async def run_cluster(config: Dict[str, Any], logger, telegram_token: str,
+                      target: Callable[[int, int, str], None]) -> None:
+    """
+    Runs the dispatcher and supervised workers until SIGTERM/SIGINT.
+
+    Args:
+        config (Dict[str, Any]): The bot's configuration dictionary.
+        logger: Logger instance.
+        telegram_token (str): Bot token, used to register the webhook.
+        target (Callable[[int, int, str], None]): Worker entry point.
+    """
+    cluster_cfg = config.get('cluster', {})
+    socket_paths = socket_paths_for(config)
+    secret_token = cluster_cfg.get('secret_token', '')
+    supervisor = WorkerSupervisor(target, socket_paths, logger,
+                                  restart_backoff=cluster_cfg.get('restart_backoff', 1.0))
+    dispatcher = WebhookDispatcher(socket_paths, logger, secret_token=secret_token)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    supervisor.start()
+    monitor = loop.create_task(supervisor.monitor())
+    server = await dispatcher.start(cluster_cfg.get('listen', '0.0.0.0'),
+                                    int(cluster_cfg.get('port', 8443)))
+    webhook_url = cluster_cfg.get('webhook_url')
+    if webhook_url:
+        async with Bot(telegram_token) as bot:
+            await bot.set_webhook(webhook_url, secret_token=secret_token or None,
+                                  allowed_updates=Update.ALL_TYPES,
+                                  max_connections=cluster_cfg.get('max_connections', 40))
+    logger.info(f"Dispatcher listening with {len(socket_paths)} workers")
+    try:
+        await stop.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        dispatcher.close()
+        monitor.cancel()
+        # Workers get their own shutdown deadline before they are killed
+        deadline = float(config.get('shutdown', {}).get('deadline', 25))
+        await asyncio.to_thread(supervisor.stop, deadline + 5)
+        logger.info(f"Dispatcher stopped: forwarded {sum(dispatcher.forwarded)}, "
+                    f"failed {dispatcher.failed}, worker restarts {supervisor.restarts}")
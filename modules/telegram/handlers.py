@@ -23,14 +23,27 @@ from .menus import (
 )
 from .quizzes import (
     get_questions_directory, handle_category_selection,
-    handle_quiz_selection, send_question, handle_quiz_response, stop_timer
+    handle_quiz_selection, send_question, handle_quiz_response, stop_timer,
+    claim_session_callback, restore_quiz_data, ANSWER_CALLBACK, NEXT_CALLBACK
 )
+from .polls import handle_poll_answer
+from .history import show_history, HISTORY_CALLBACK
+from .admin import handle_profile_command
+from .sessions import touch_session
 from .settings import (
     handle_questions_count_selection, handle_timer_selection,
     handle_timer_limit_selection, handle_questions_random_selection, show_questions_random_menu
 )
 from utils.localization import Localization
-from typing import Dict, Any, Callable, Awaitable
+from utils.tracing import Span, span
+from typing import Dict, Any, Callable, Awaitable, Optional
+import time
+
+# Callback data prefixes, used as metric routes for parameterized buttons
+CALLBACK_PREFIXES = (
+    "set_questions_count_", "set_timer_", "cat_", "quiz_", "set_language_",
+    "set_questions_random_",
+)
 
 
 class BotHandler:
@@ -58,8 +71,13 @@ class BotHandler:
         """
         Ensure per-user context is initialized from database.
         """
+        with span("ensure_user_context"):
+            await self._ensure_user_context(update, context)
+
+    async def _ensure_user_context(self, update: Update, context: CallbackContext) -> None:
         # Initialize global bot_data if needed
         self.initialize_context(context)
+        touch_session(context.user_data)
 
         db = context.application.bot_data.get('db')
         config = context.bot_data['config']
@@ -100,14 +118,64 @@ class BotHandler:
             update (Update): The update object from Telegram.
             context (CallbackContext): The context object from Telegram.
         """
+        started = time.perf_counter()
+        trace = self.begin_trace(context, update)
+        failed = False
         try:
             await self.ensure_user_context(update, context)
             await show_main_menu(update, context)
             self.log_user_action(update.effective_user.id, "started bot")
         except KeyError as e:
+            failed = True
             self.logger.error(f"KeyError in start handler: {e}", exc_info=True)
         except Exception as e:
+            failed = True
             self.logger.error(f"Unexpected error in start handler: {e}", exc_info=True)
+        finally:
+            self.observe(context, "/start", started, failed, trace)
+
+    async def history(self, update: Update, context: CallbackContext) -> None:
+        """
+        Handles the /history command.
+
+        Args:
+            update (Update): The update object from Telegram.
+            context (CallbackContext): The context object from Telegram.
+        """
+        started = time.perf_counter()
+        trace = self.begin_trace(context, update)
+        failed = False
+        try:
+            await self.ensure_user_context(update, context)
+            await show_history(update, context)
+            self.log_user_action(update.effective_user.id, "opened history")
+        except KeyError as e:
+            failed = True
+            self.logger.error(f"KeyError in history handler: {e}", exc_info=True)
+        except Exception as e:
+            failed = True
+            self.logger.error(f"Unexpected error in history handler: {e}", exc_info=True)
+        finally:
+            self.observe(context, "/history", started, failed, trace)
+
+    async def profile(self, update: Update, context: CallbackContext) -> None:
+        """
+        Handles the admin-only /profile command.
+
+        Args:
+            update (Update): The update object from Telegram.
+            context (CallbackContext): The context object from Telegram.
+        """
+        started = time.perf_counter()
+        trace = self.begin_trace(context, update)
+        failed = False
+        try:
+            await handle_profile_command(update, context)
+        except Exception as e:
+            failed = True
+            self.logger.error(f"Unexpected error in profile handler: {e}", exc_info=True)
+        finally:
+            self.observe(context, "/profile", started, failed, trace)
 
     def initialize_context(self, context: CallbackContext) -> None:
         """
@@ -131,8 +199,10 @@ class BotHandler:
             update (Update): The update object from Telegram.
             context (CallbackContext): The context object from Telegram.
         """
+        started = time.perf_counter()
+        trace = self.begin_trace(context, update)
         query = update.callback_query
-        await query.answer()
+        session_kind = query.data.split('_', 1)[0]
 
         handlers: Dict[str, Callable[[Update, CallbackContext], Awaitable[None]]] = {
             "tests": self.show_tests_menu,
@@ -144,18 +214,41 @@ class BotHandler:
             "choose_language": show_language_menu,
             "restart": self.restart_last_quiz,
             "list_tests": self.list_tests,
-            "next_question": lambda u, c: send_question(u, c, self.config),
             "main_menu": self.go_to_main_menu,
+            "history": show_history,
             "questions_random": show_questions_random_menu
         }
 
+        failed = False
+        route = None
         try:
+            await query.answer()
+
+            # Session-bound quiz callbacks are deduplicated before any DB or API work
+            session_value = None
+            if session_kind in (ANSWER_CALLBACK, NEXT_CALLBACK):
+                session_value = claim_session_callback(context, query.data)
+                if session_value is None:
+                    self.logger.debug(f"Dropped duplicate or stale callback: {query.data}")
+                    route = "duplicate"
+                    return
+
             # Ensure per-user context is initialized for every callback
             await self.ensure_user_context(update, context)
 
+            # Reload questions if the idle sweeper evicted them
+            if session_value is not None:
+                restore_quiz_data(context, self.questions_directory)
+
             handler = handlers.get(query.data)
             if handler:
                 await handler(update, context)
+            elif session_kind == NEXT_CALLBACK:
+                await send_question(update, context, self.config)
+            elif session_kind == ANSWER_CALLBACK:
+                await handle_quiz_response(update, context, session_value)
+            elif session_kind == HISTORY_CALLBACK:
+                await show_history(update, context, query.data)
             elif query.data.startswith("set_questions_count_"):
                 await handle_questions_count_selection(update, context, self.extract_option_key(query.data))
             elif query.data.startswith("set_timer_"):
@@ -169,11 +262,96 @@ class BotHandler:
             elif query.data.startswith("set_questions_random_"):
                 await handle_questions_random_selection(update, context, self.extract_option_key(query.data))
             else:
-                await handle_quiz_response(update, context, query.data)
+                self.logger.debug(f"Ignored unknown callback: {query.data}")
         except KeyError as e:
+            failed = True
             self.logger.error(f"KeyError in button handler: {e}", exc_info=True)
         except Exception as e:
+            failed = True
             self.logger.error(f"Unexpected error in button handler: {e}", exc_info=True)
+        finally:
+            # Every exit is observed, including a failed query.answer()
+            self.observe(context, route or self.callback_route(query.data, handlers), started,
+                         failed, trace)
+
+    async def poll_answer(self, update: Update, context: CallbackContext) -> None:
+        """
+        Handles answers to quiz polls sent in poll delivery mode.
+
+        Args:
+            update (Update): The update object from Telegram.
+            context (CallbackContext): The context object from Telegram.
+        """
+        started = time.perf_counter()
+        trace = self.begin_trace(context, update)
+        failed = False
+        try:
+            await handle_poll_answer(update, context)
+        except KeyError as e:
+            failed = True
+            self.logger.error(f"KeyError in poll answer handler: {e}", exc_info=True)
+        except Exception as e:
+            failed = True
+            self.logger.error(f"Unexpected error in poll answer handler: {e}", exc_info=True)
+        finally:
+            self.observe(context, "poll_answer", started, failed, trace)
+
+    @staticmethod
+    def callback_route(data: str, handlers: Dict[str, Any]) -> str:
+        """
+        Maps callback data to a bounded set of metric routes.
+
+        Args:
+            data (str): Callback data of the button.
+            handlers (Dict[str, Any]): Buttons with fixed callback data.
+
+        Returns:
+            str: The data itself for fixed buttons, otherwise its kind or prefix.
+        """
+        if data in handlers:
+            return data
+        kind = data.split('_', 1)[0]
+        if kind in (ANSWER_CALLBACK, NEXT_CALLBACK, HISTORY_CALLBACK):
+            return kind
+        return next((prefix for prefix in CALLBACK_PREFIXES if data.startswith(prefix)), "unknown")
+
+    @staticmethod
+    def begin_trace(context: CallbackContext, update: Update) -> Optional[Span]:
+        """
+        Starts the span trace of an update when tracing is enabled.
+
+        Args:
+            context (CallbackContext): The context object from Telegram.
+            update (Update): The update being handled.
+
+        Returns:
+            Optional[Span]: The root span, to be handed to observe().
+        """
+        tracer = context.bot_data.get('tracer')
+        if tracer is None:
+            return None
+        user = update.effective_user
+        return tracer.start(update_id=update.update_id, user_id=user.id if user else None)
+
+    @staticmethod
+    def observe(context: CallbackContext, route: str, started: float, failed: bool = False,
+                trace: Optional[Span] = None) -> None:
+        """
+        Records the handling time of an update when metrics are enabled, and
+        finishes its span trace.
+
+        Args:
+            context (CallbackContext): The context object from Telegram.
+            route (str): Command or callback route.
+            started (float): time.perf_counter() when handling began.
+            failed (bool): The handler raised.
+            trace (Optional[Span]): Root span returned by begin_trace().
+        """
+        metrics = context.bot_data.get('metrics')
+        if metrics is not None:
+            metrics.observe_handler(route, started, failed)
+        if trace is not None:
+            context.bot_data['tracer'].finish(trace, route, failed)
 
     async def show_help_section(self, update: Update, context: CallbackContext) -> None:
         """
@@ -0,0 +1,151 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: modules/telegram/history.py
+
+Description:
+This module implements the /history view: a user's finished quiz attempts,
+newest first, a page at a time with inline "Newer" / "Older" buttons.
+
+Pages are fetched with keyset pagination (BotDatabase.get_attempt_history),
+so a page deep in the history costs the same as the first one. The position
+is carried in the button's callback data rather than in user_data: the
+(finished_at, id) of the row next to the requested page, packed in base 36,
+e.g. "hst_o_sdkj1c_4fz" - far below Telegram's 64-byte callback data limit.
+"""
+
+import datetime as dt
+from typing import Optional, Tuple, Dict, Any
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import CallbackContext
+from utils.tracing import span
+
+HISTORY_CALLBACK = "hst"
+OLDER = "o"
+NEWER = "n"
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+_EPOCH = dt.datetime(1970, 1, 1)
+
+
+def _base36(value: int) -> str:
+    digits = ""
+    while True:
+        value, digit = divmod(value, 36)
+        digits = _DIGITS[digit] + digits
+        if not value:
+            return digits
+
+
+def encode_cursor(direction: str, finished_at: str, attempt_id: int) -> str:
+    """
+    Builds the callback data of a history page button.
+    Args:
+        direction (str): OLDER or NEWER than the given attempt.
+        finished_at (str): finished_at of the attempt, "YYYY-MM-DDTHH:MM:SSZ".
+        attempt_id (int): id of the attempt.
+    Returns:
+        str: Callback data of the form "hst_<direction>_<seconds>_<id>".
+    """
+    finished = dt.datetime.strptime(finished_at, "%Y-%m-%dT%H:%M:%SZ")
+    seconds = int((finished - _EPOCH).total_seconds())
+    return f"{HISTORY_CALLBACK}_{direction}_{_base36(seconds)}_{_base36(attempt_id)}"
+
+
+def decode_cursor(data: str) -> Optional[Tuple[str, str, int]]:
+    """
+    Parses callback data built by encode_cursor.
+    Args:
+        data (str): Callback data.
+    Returns:
+        Optional[Tuple[str, str, int]]: Direction, finished_at and attempt id,
+            or None if the data is malformed.
+    """
+    parts = data.split('_')
+    if len(parts) != 4 or parts[1] not in (OLDER, NEWER):
+        return None
+    try:
+        finished = _EPOCH + dt.timedelta(seconds=int(parts[2], 36))
+        attempt_id = int(parts[3], 36)
+    except (ValueError, OverflowError):
+        return None
+    return parts[1], finished.isoformat() + "Z", attempt_id
+
+
+def format_attempt(localization, emoji: Dict[str, Any], attempt: Dict[str, Any]) -> str:
+    """
+    Formats one attempt as a line of the history page.
+    """
+    mark = emoji['enabled'] if attempt['passed'] else emoji['failed']
+    return localization.get(
+        "history_entry",
+        mark=mark,
+        date=(attempt['finished_at'] or "")[:16].replace("T", " "),
+        quiz=attempt['quiz_name'] or "-",
+        category=attempt['category'] or "-",
+        correct_count=attempt['correct_count'] or 0,
+        total_questions=attempt['total_questions'] or 0,
+        success_rate=attempt['success_rate'] or 0.0,
+    )
+
+
+async def show_history(update: Update, context: CallbackContext, data: str = "") -> None:
+    """
+    Displays one page of the user's quiz history.
+
+    Args:
+        update (Update): The incoming update from Telegram.
+        context (CallbackContext): The context containing bot and user data.
+        data (str): Callback data of a page button; empty for the newest page.
+    """
+    localization = context.user_data.get('localization', context.bot_data['localization'])
+    config = context.bot_data['config']
+    emoji = config['emoji']
+    parse_mode = context.bot_data['parse_mode']
+    db = context.application.bot_data.get('db')
+    page_size = int(config['telegram'].get('history_page_size', 5))
+
+    cursor = decode_cursor(data) if data else None
+    if data and cursor is None:
+        context.bot_data['logger'].debug(f"Ignored malformed history callback: {data}")
+        return
+    newer = cursor is not None and cursor[0] == NEWER
+    attempts, more = await db.get_attempt_history(
+        context.user_data['user_id'], page_size,
+        cursor=cursor[1:] if cursor else None, newer=newer)
+
+    # Coming from a neighbouring page means there is one in that direction
+    has_newer = more if newer else cursor is not None
+    has_older = more if not newer else cursor is not None
+    with span("render.history", attempts=len(attempts)):
+        if attempts:
+            message_text = "\n".join([localization.get("history_title")]
+                                     + [format_attempt(localization, emoji, a) for a in attempts])
+        else:
+            message_text = localization.get("history_empty")
+
+        navigation = []
+        if attempts and has_newer:
+            navigation.append(InlineKeyboardButton(
+                f"{emoji['back_button']} {localization.get('history_newer')}",
+                callback_data=encode_cursor(NEWER, attempts[0]['finished_at'], attempts[0]['id'])))
+        if attempts and has_older:
+            navigation.append(InlineKeyboardButton(
+                f"{localization.get('history_older')} {emoji['next_button']}",
+                callback_data=encode_cursor(OLDER, attempts[-1]['finished_at'],
+                                            attempts[-1]['id'])))
+        keyboard = [navigation] if navigation else []
+        keyboard.append([InlineKeyboardButton(
+            f"{emoji['back_button']} {localization.get('main_menu_button')}",
+            callback_data="main_menu")])
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+    if update.callback_query:
+        await update.callback_query.message.edit_text(message_text, reply_markup=reply_markup,
+                                                      parse_mode=parse_mode)
+    elif update.message:
+        await update.message.reply_text(message_text, reply_markup=reply_markup,
+                                        parse_mode=parse_mode)
+    context.bot_data['logger'].info(f"Displayed history page of {len(attempts)} attempts")
@@ -0,0 +1,157 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: modules/telegram/lifecycle.py
+
+Description:
+This module runs the Application in polling mode and shuts it down in a fixed
+order under a deadline: stop taking updates, let in-flight handlers finish,
+persist sessions (including quiz deadlines, so timers resume after a restart),
+cancel timers and background tasks, flush pending writes and close
+connections. The time spent in each phase is logged, and so are the start-up
+stages (utils/startup.py).
+"""
+
+import asyncio
+import signal
+import time
+from typing import Awaitable, Dict, Optional
+from telegram.ext import Application
+from utils.startup import StartupProfile
+
+
+async def graceful_shutdown(application: Application,
+                            intake: Optional[Awaitable[None]] = None) -> Dict[str, float]:
+    """
+    Shuts a started Application down within the configured deadline.
+
+    Phases that exceed their share of the deadline are abandoned (in-flight
+    handlers are cancelled) and the remaining phases still run.
+
+    Args:
+        application (Application): The running application.
+        intake (Optional[Awaitable[None]]): Completes once no more updates are
+            accepted from a custom source (e.g. the cluster socket server).
+
+    Returns:
+        Dict[str, float]: Seconds spent per phase and in total.
+    """
+    logger = application.bot_data['logger']
+    shutdown_cfg = application.bot_data.get('config', {}).get('shutdown', {})
+    deadline = float(shutdown_cfg.get('deadline', 25))
+    drain_timeout = min(float(shutdown_cfg.get('drain_timeout', 20)), deadline)
+    started = time.monotonic()
+    timings: Dict[str, float] = {}
+
+    def remaining() -> float:
+        return max(0.0, deadline - (time.monotonic() - started))
+
+    async def phase(name: str, awaitable: Awaitable, timeout: float) -> bool:
+        begin = time.monotonic()
+        try:
+            await asyncio.wait_for(awaitable, timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"Shutdown phase '{name}' did not finish within {timeout:.1f}s")
+            return False
+        except Exception as e:
+            logger.error(f"Shutdown phase '{name}' failed: {e}", exc_info=True)
+            return False
+        finally:
+            timings[name] = time.monotonic() - begin
+
+    async def stop_intake() -> None:
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+        if intake is not None:
+            await intake
+
+    async def persist() -> None:
+        nonlocal timers
+        timers = tasks.counts().get('quiz_timer', 0) if tasks else 0
+        # Running sessions carry absolute quiz deadlines; timers resume from them
+        if application.persistence:
+            await application.update_persistence()
+
+    async def flush() -> None:
+        db = application.bot_data.get('db')
+        if db:
+            await db.flush()
+
+    async def close() -> None:
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+    logger.info(f"Shutting down (deadline {deadline:.0f}s)")
+    tasks = application.bot_data.get('tasks')
+    processor = application.update_processor
+    timers = 0
+
+    await phase('intake', stop_intake(), remaining())
+    if application.running:
+        # Application.stop() handles queued updates, waits for handlers and
+        # writes persistence one last time
+        stopping = asyncio.ensure_future(application.stop())
+        if not await phase('drain', asyncio.shield(stopping), min(drain_timeout, remaining())):
+            abandon = getattr(processor, 'abandon', None)
+            abandoned = abandon() if abandon else []
+            logger.warning(f"Abandoned {len(abandoned)} updates still in progress or waiting")
+            # With the handlers cancelled and the rest dropped, stop() ends quickly
+            await phase('abandon', stopping, max(remaining(), 1.0))
+    await phase('persist', persist(), remaining())
+    if tasks:
+        await phase('timers', tasks.shutdown(timeout=remaining()), remaining())
+    await phase('flush', flush(), remaining())
+    # Closing gets at least a moment even when the deadline is spent
+    await phase('close', close(), max(remaining(), 1.0))
+
+    timings['total'] = time.monotonic() - started
+    logger.info(f"Shutdown finished in {timings['total']:.2f}s ("
+                + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()
+                            if name != 'total')
+                + f"); {timers} quiz timers saved for resume")
+    return timings
+
+
+async def serve_polling(application: Application, startup: Optional[StartupProfile] = None,
+                        stop_when_started: bool = False) -> None:
+    """
+    Runs the Application with long polling until SIGTERM/SIGINT.
+
+    Follows the start-up order of Application.run_polling() and replaces its
+    shutdown with graceful_shutdown().
+
+    Args:
+        application (Application): Application with an Updater.
+        startup (Optional[StartupProfile]): Profile of the start-up so far; its
+            remaining stages are added and the summary is logged.
+        stop_when_started (bool): Shut down as soon as polling has started.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    startup = startup or StartupProfile()
+
+    with startup.stage('initialize'):
+        await application.initialize()
+    try:
+        if application.post_init:
+            with startup.stage('post_init'):
+                await application.post_init(application)
+        with startup.stage('polling'):
+            await application.updater.start_polling()
+            await application.start()
+        logger = application.bot_data['logger']
+        logger.info("Polling started")
+        logger.info(startup.summary())
+        if stop_when_started:
+            stop.set()
+        await stop.wait()
+    finally:
+        await graceful_shutdown(application)
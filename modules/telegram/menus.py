@@ -87,6 +87,8 @@ async def show_main_menu(update: Update, context: CallbackContext) -> None:
         [InlineKeyboardButton(
             f"{emoji['settings']} {localization.get('settings_button')}",
             callback_data="settings")],
+        [InlineKeyboardButton(f"{emoji['history']} {localization.get('history_button')}",
+                              callback_data="history")],
         [InlineKeyboardButton(f"{emoji['help']} {localization.get('help_button')}",
                               callback_data="help")]
     ]
@@ -0,0 +1,152 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: modules/telegram/persistence.py
+
+Description:
+This module provides SessionPersistence, a python-telegram-bot persistence
+backend that stores in-flight quiz sessions in the bot's SQLite database. Only
+the small resumable part of a session (quiz, question order, position, score,
+nonce, deadline and open quiz poll) is written, one row per user, and only when it changed
+since the last write. Questions, messages and localization are rebuilt on
+demand after a restart.
+"""
+
+from typing import Any, Dict, Optional, Tuple
+from telegram.ext import BasePersistence, PersistenceInput
+
+from utils.database import BotDatabase
+from .cluster import shard_for
+
+# user_data key -> quiz_sessions column
+SESSION_FIELDS = (
+    ('user_id', 'user_id'),
+    ('chat_id', 'chat_id'),
+    ('last_category', 'category'),
+    ('last_quiz', 'quiz_name'),
+    ('question_ids', 'question_ids'),
+    ('current_index', 'current_index'),
+    ('correct_count', 'correct_count'),
+    ('quiz_nonce', 'quiz_nonce'),
+    ('quiz_started_at', 'started_at'),
+    ('quiz_deadline', 'deadline'),
+    ('poll_id', 'poll_id'),
+    ('poll_correct_option_id', 'poll_correct_option_id'),
+)
+
+
+def extract_session(user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Returns the persistable part of a running quiz session.
+
+    Args:
+        user_data (Dict[str, Any]): The user's context.user_data.
+
+    Returns:
+        Optional[Dict[str, Any]]: Column values, or None if no quiz is running.
+    """
+    if not user_data.get('question_ids'):
+        return None
+    return {column: user_data.get(key) for key, column in SESSION_FIELDS}
+
+
+class SessionPersistence(BasePersistence):
+    """
+    Persists running quiz sessions to SQLite with row-level upserts.
+    """
+
+    def __init__(self, db: BotDatabase, update_interval: float = 10,
+                 shard: Optional[Tuple[int, int]] = None):
+        """
+        Initializes the persistence backend.
+
+        Args:
+            db (BotDatabase): Database holding the quiz_sessions table (or a
+                ShardedBotDatabase with the same interface).
+            update_interval (float): Seconds between PTB persistence runs.
+            shard (Optional[Tuple[int, int]]): (worker index, worker count) in cluster
+                mode; only sessions of users owned by this worker are restored.
+        """
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False,
+                                                     user_data=True, callback_data=False),
+                         update_interval=update_interval)
+        self.db = db
+        self.shard = shard
+        # Last written row per user; unchanged sessions are not rewritten
+        self._written: Dict[int, Tuple] = {}
+        self.rows_written = 0
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        # Called from Application.initialize(), before post_init
+        await self.db.init()
+        sessions = await self.db.load_quiz_sessions()
+        user_data = {}
+        for telegram_id, session in sessions.items():
+            if self.shard and shard_for(telegram_id, self.shard[1]) != self.shard[0]:
+                continue
+            self._written[telegram_id] = tuple(session[column] for _, column in SESSION_FIELDS)
+            data = {key: session[column] for key, column in SESSION_FIELDS}
+            data['telegram_id'] = telegram_id
+            data['handled_callbacks'] = {}
+            user_data[telegram_id] = data
+        return user_data
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        session = extract_session(data)
+        if session is None:
+            if self._written.pop(user_id, None) is not None:
+                await self.db.delete_quiz_session(user_id)
+                self.rows_written += 1
+            return
+        row = tuple(session[column] for _, column in SESSION_FIELDS)
+        if self._written.get(user_id) == row:
+            return
+        self._written[user_id] = row
+        await self.db.upsert_quiz_session(user_id, session)
+        self.rows_written += 1
+
+    async def drop_user_data(self, user_id: int) -> None:
+        if self._written.pop(user_id, None) is not None:
+            await self.db.delete_quiz_session(user_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def flush(self) -> None:
+        await self.db.flush()
+
+    # Chat, bot, callback and conversation data are not persisted
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
@@ -0,0 +1,289 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: modules/telegram/polls.py
+
+Description:
+This module implements the native Telegram quiz-poll delivery mode. Questions
+are sent with sendPoll(type=quiz), with the correct option and explanation
+precomputed from the question record, and answers are graded from PollAnswer
+updates through an in-memory poll_id index with TTL eviction. The session also
+records its open poll, so answers the index no longer knows are still graded.
+"""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Poll
+from telegram.constants import PollLimit
+from telegram.ext import CallbackContext
+
+DELIVERY_BUTTONS = "buttons"
+DELIVERY_POLL = "poll"
+
+
+@dataclass(frozen=True)
+class PollEntry:
+    """
+    A single sent quiz poll awaiting an answer.
+    """
+    user_id: int
+    chat_id: int
+    question_index: int
+    correct_option_id: int
+    expires_at: float
+
+
+class PollSessionIndex:
+    """
+    Maps poll_id to the quiz session that sent it. Entries expire after a fixed
+    TTL, so insertion order is also expiry order and eviction only has to look
+    at the oldest entries.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, max_entries: int = 100000):
+        """
+        Initializes the index.
+
+        Args:
+            ttl_seconds (int): Lifetime of an unanswered poll entry in seconds.
+            max_entries (int): Hard cap on tracked polls; the oldest are dropped first.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, PollEntry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, poll_id: str, user_id: int, chat_id: int, question_index: int,
+            correct_option_id: int) -> None:
+        """
+        Registers a sent poll.
+
+        Args:
+            poll_id (str): Telegram poll identifier.
+            user_id (int): Telegram ID of the user taking the quiz.
+            chat_id (int): Chat the poll was sent to.
+            question_index (int): Index of the question within the session.
+            correct_option_id (int): Index of the correct poll option.
+        """
+        self.evict_expired()
+        while len(self._entries) >= self.max_entries:
+            self._entries.popitem(last=False)
+        self._entries[poll_id] = PollEntry(user_id, chat_id, question_index,
+                                           correct_option_id,
+                                           time.monotonic() + self.ttl_seconds)
+
+    def pop(self, poll_id: str) -> Optional[PollEntry]:
+        """
+        Removes and returns the entry for a poll if it has not expired.
+
+        Args:
+            poll_id (str): Telegram poll identifier.
+
+        Returns:
+            Optional[PollEntry]: The entry, or None if unknown or expired.
+        """
+        entry = self._entries.pop(poll_id, None)
+        if entry is None or entry.expires_at < time.monotonic():
+            return None
+        return entry
+
+    def evict_expired(self) -> int:
+        """
+        Drops expired entries.
+
+        Returns:
+            int: The number of evicted entries.
+        """
+        now = time.monotonic()
+        evicted = 0
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if entry.expires_at >= now:
+                break
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+
+def get_delivery_mode(config: Dict[str, Any]) -> str:
+    """
+    Returns the configured question delivery mode.
+
+    Args:
+        config (Dict[str, Any]): The bot's configuration dictionary.
+
+    Returns:
+        str: Either "buttons" or "poll".
+    """
+    mode = str(config['telegram'].get('quiz_delivery', DELIVERY_BUTTONS)).lower()
+    return DELIVERY_POLL if mode == DELIVERY_POLL else DELIVERY_BUTTONS
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def build_poll_payload(question: dict, index: int) -> Optional[Dict[str, Any]]:
+    """
+    Precomputes the sendPoll arguments for a question record.
+
+    Full answer texts are used as poll options when they fit; otherwise the
+    answers are appended to the question text and only their keys are offered
+    as options. Questions that fit neither way return None and are rendered as
+    text with an inline keyboard instead.
+
+    Args:
+        question (dict): The quiz question.
+        index (int): Zero-based index of the question within the session.
+
+    Returns:
+        Optional[Dict[str, Any]]: Keyword arguments for sendPoll, or None.
+    """
+    from .quizzes import extract_key
+
+    answers = question['answers']
+    if not PollLimit.MIN_OPTION_NUMBER <= len(answers) <= PollLimit.MAX_OPTION_NUMBER:
+        return None
+    correct_key = extract_key(question['correct_answer'])
+    keys = [extract_key(option) for option in answers]
+    if correct_key not in keys:
+        return None
+
+    title = f"Q{index + 1}. {question['question']}"
+    if (len(title) <= PollLimit.MAX_QUESTION_LENGTH
+            and all(len(option) <= PollLimit.MAX_OPTION_LENGTH for option in answers)):
+        text, options = title, list(answers)
+    else:
+        text = title + "\n\n" + "\n".join(answers)
+        options = keys
+        if (len(text) > PollLimit.MAX_QUESTION_LENGTH
+                or any(len(key) > PollLimit.MAX_OPTION_LENGTH for key in keys)):
+            return None
+
+    payload = {
+        'question': text,
+        'options': options,
+        'correct_option_id': keys.index(correct_key),
+    }
+    explanation = " ".join(question.get('explanation', '').split())
+    if explanation:
+        payload['explanation'] = _truncate(explanation, PollLimit.MAX_EXPLANATION_LENGTH)
+    return payload
+
+
+def build_poll_payloads(quiz_data: List[dict]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Precomputes poll payloads for every question of a quiz session.
+
+    Args:
+        quiz_data (List[dict]): The selected quiz questions.
+
+    Returns:
+        List[Optional[Dict[str, Any]]]: One payload (or None) per question.
+    """
+    return [build_poll_payload(question, index) for index, question in enumerate(quiz_data)]
+
+
+async def send_quiz_poll(update: Update, context: CallbackContext,
+                         config: Dict[str, Any], payload: Dict[str, Any]) -> None:
+    """
+    Sends the current question as a native quiz poll.
+
+    Args:
+        update (Update): The update object from Telegram.
+        context (CallbackContext): The context object from Telegram.
+        config (Dict[str, Any]): The bot's configuration dictionary.
+        payload (Dict[str, Any]): Precomputed sendPoll arguments.
+    """
+    localization = context.user_data.get('localization', context.bot_data['localization'])
+    emoji = config['emoji']
+    chat_id = context.user_data['chat_id']
+    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(
+        f"{emoji['back_button']} {localization.get('back_button')}",
+        callback_data="list_tests")]])
+
+    sent_message = await context.bot.send_poll(chat_id=chat_id, type=Poll.QUIZ,
+                                               is_anonymous=False,
+                                               reply_markup=reply_markup, **payload)
+    context.user_data['last_message'] = sent_message
+    context.user_data['poll_id'] = sent_message.poll.id
+    context.user_data['poll_correct_option_id'] = payload['correct_option_id']
+    context.bot_data['poll_index'].add(sent_message.poll.id, update.effective_user.id,
+                                       chat_id, context.user_data.get('current_index', 0),
+                                       payload['correct_option_id'])
+
+
+def session_poll_entry(user_data: Dict[str, Any], poll_id: str,
+                       user_id: int) -> Optional[PollEntry]:
+    """
+    Returns the open poll recorded in a quiz session, if it is the answered one.
+
+    Args:
+        user_data (Dict[str, Any]): The answering user's context.user_data.
+        poll_id (str): Telegram identifier of the answered poll.
+        user_id (int): Telegram ID of the answering user.
+
+    Returns:
+        Optional[PollEntry]: The entry for the current question, or None.
+    """
+    if user_data.get('poll_id') != poll_id or 'poll_correct_option_id' not in user_data:
+        return None
+    return PollEntry(user_id, user_data.get('chat_id'), user_data.get('current_index', 0),
+                     user_data['poll_correct_option_id'], time.monotonic())
+
+
+async def handle_poll_answer(update: Update, context: CallbackContext) -> None:
+    """
+    Grades a PollAnswer update and advances the quiz session.
+
+    Polls missing from the index (past poll_ttl or evicted) are matched against
+    the open poll recorded in the session; answers to any other poll are
+    ignored without any API call.
+
+    Args:
+        update (Update): The update object from Telegram.
+        context (CallbackContext): The context object from Telegram.
+    """
+    from .quizzes import (
+        send_question, send_results, log_quiz_response, stop_timer, restore_quiz_data
+    )
+    from .sessions import touch_session
+
+    poll_answer = update.poll_answer
+    poll_index: Optional[PollSessionIndex] = context.bot_data.get('poll_index')
+    entry = poll_index.pop(poll_answer.poll_id) if poll_index else None
+    if entry is None:
+        entry = session_poll_entry(context.user_data, poll_answer.poll_id, poll_answer.user.id)
+    if entry is None or entry.user_id != poll_answer.user.id:
+        return
+
+    if context.user_data.get('current_index') != entry.question_index:
+        return
+    # Answered; a redelivered update must not be graded again through the session
+    context.user_data.pop('poll_id', None)
+    touch_session(context.user_data)
+    if not restore_quiz_data(context, context.bot_data['questions_directory']):
+        return
+    quiz_data = context.user_data['quiz_data']
+
+    config = context.bot_data['config']
+    current_question = quiz_data[entry.question_index]
+    option_ids = poll_answer.option_ids
+    answer = current_question['answers'][option_ids[0]] if option_ids else ""
+    if entry.correct_option_id in option_ids:
+        context.user_data['correct_count'] += 1
+    log_quiz_response(context.bot_data['events'], poll_answer.user.id, entry.question_index,
+                      current_question, answer)
+
+    if entry.question_index >= len(quiz_data) - 1:
+        await stop_timer(context)
+        await send_results(update, context, config)
+    else:
+        context.user_data['current_index'] += 1
+        await send_question(update, context, config)
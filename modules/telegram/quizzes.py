@@ -15,13 +15,20 @@ timer-based quiz control.
 import os
 import json
 import random
+import time
 import asyncio
+import secrets
 import datetime as dt
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Sequence
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
+from utils.question_store import QuestionStore, QuizQuestions
+from utils.tracing import span
+from .polls import DELIVERY_POLL, get_delivery_mode, build_poll_payloads, send_quiz_poll
 
 MAX_BUTTON_LENGTH = 64
+ANSWER_CALLBACK = "ans"
+NEXT_CALLBACK = "nxt"
 
 
 def get_questions_directory(config: dict) -> Optional[str]:
@@ -50,16 +57,45 @@ def get_quiz_files(category_directory, logger):
 
     logger.info(f"Checking files in category directory: {category_directory}")
     quiz_files = []
-    for f in os.listdir(category_directory):
-        if f.endswith('.json'):
-            file_path = os.path.join(category_directory, f)
-            with open(file_path, 'r', encoding='utf-8') as file:
-                questions = json.load(file)
-                question_count = len(questions)
-            quiz_files.append((f[:-5], question_count))
+    with span("file.list_quizzes", directory=os.path.basename(category_directory)):
+        for f in os.listdir(category_directory):
+            if f.endswith('.json'):
+                file_path = os.path.join(category_directory, f)
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    questions = json.load(file)
+                    question_count = len(questions)
+                quiz_files.append((f[:-5], question_count))
     return quiz_files
 
 
+def read_questions(file_path):
+    """
+    Reads all questions from a quiz file.
+    Args:
+        file_path (str): The path to the quiz file.
+    Returns:
+        list: All quiz questions in file order.
+    """
+    with span("file.read_questions", file=os.path.basename(file_path)), \
+            open(file_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def select_question_indices(total, questions_count, random_enabled) -> List[int]:
+    """
+    Picks which questions of a quiz file make up a session.
+    Args:
+        total (int): Number of questions in the quiz file.
+        questions_count (int): The number of questions to pick.
+        random_enabled (bool): Flag to determine if questions should be randomized.
+    Returns:
+        List[int]: Indices into the quiz file, in session order.
+    """
+    if random_enabled:
+        return random.sample(range(total), min(questions_count, total))
+    return list(range(min(questions_count, total)))
+
+
 def load_random_questions(file_path, questions_count, random_enabled):
     """
     Loads questions from a file, either randomly or sequentially based on settings.
@@ -70,11 +106,128 @@ def load_random_questions(file_path, questions_count, random_enabled):
     Returns:
         list: A list of quiz questions.
     """
-    with open(file_path, 'r', encoding='utf-8') as file:
-        questions = json.load(file)
-    if random_enabled:
-        return random.sample(questions, min(questions_count, len(questions)))
-    return questions[:questions_count]
+    questions = read_questions(file_path)
+    return [questions[i] for i in select_question_indices(len(questions), questions_count,
+                                                          random_enabled)]
+
+
+def get_question_store(context: CallbackContext) -> Optional[QuestionStore]:
+    """
+    Returns the shared compiled question store, if enabled.
+    Args:
+        context (CallbackContext): The context object from Telegram.
+    Returns:
+        Optional[QuestionStore]: The attached store, or None to read JSON files directly.
+    """
+    manager = context.bot_data.get('question_store')
+    return manager.current() if manager else None
+
+
+def load_quiz_questions(context: CallbackContext, questions_directory, category: str,
+                        quiz_name: str) -> Optional[Sequence[dict]]:
+    """
+    Returns all questions of a quiz, from the question store or its JSON file.
+    Args:
+        context (CallbackContext): The context object from Telegram.
+        questions_directory (str): Path to the questions directory.
+        category (str): Quiz category.
+        quiz_name (str): Quiz name.
+    Returns:
+        Optional[Sequence[dict]]: The questions, or None if the quiz does not exist.
+    """
+    manager = context.bot_data.get('question_store')
+    if manager:
+        # Quizzes missing from the store are not refreshed here: the menus list
+        # the store's quizzes, and QuestionStoreManager.run() picks up new ones
+        # off the event loop
+        with span("store.questions"):
+            return manager.current().questions(category, quiz_name)
+    quiz_file_path = os.path.join(questions_directory, category, quiz_name + '.json')
+    return read_questions(quiz_file_path) if os.path.exists(quiz_file_path) else None
+
+
+def pick_questions(questions: Sequence[dict], question_ids: List[int]) -> Sequence[dict]:
+    """
+    Selects session questions without copying them out of the question store.
+    Args:
+        questions (Sequence[dict]): All questions of a quiz.
+        question_ids (List[int]): Indices of the session questions.
+    Returns:
+        Sequence[dict]: The session questions in order.
+    """
+    if isinstance(questions, QuizQuestions):
+        return questions.subset(question_ids)
+    return [questions[i] for i in question_ids]
+
+
+def restore_quiz_data(context: CallbackContext, questions_directory) -> bool:
+    """
+    Reloads the questions of a running quiz whose session state was evicted.
+    Args:
+        context (CallbackContext): The context object from Telegram.
+        questions_directory (str): Path to the questions directory.
+    Returns:
+        bool: True if quiz data is available afterwards.
+    """
+    if 'quiz_data' in context.user_data:
+        return True
+    question_ids = context.user_data.get('question_ids')
+    quiz_name = context.user_data.get('last_quiz')
+    category = context.user_data.get('last_category')
+    if not question_ids or not quiz_name or not category:
+        return False
+    try:
+        questions = load_quiz_questions(context, questions_directory, category, quiz_name)
+        if questions is None or max(question_ids) >= len(questions):
+            raise IndexError("question ids do not match the quiz")
+        quiz_data = pick_questions(questions, question_ids)
+    except (OSError, ValueError, IndexError) as e:
+        context.bot_data['logger'].error(f"Failed to restore quiz {category}/{quiz_name}: {e}")
+        return False
+    context.user_data['quiz_data'] = quiz_data
+    if get_delivery_mode(context.bot_data['config']) == DELIVERY_POLL:
+        context.user_data['poll_payloads'] = build_poll_payloads(quiz_data)
+    return True
+
+
+def session_callback(context: CallbackContext, kind: str, value: str = "") -> str:
+    """
+    Builds callback data bound to the running quiz session and current question.
+    Args:
+        context (CallbackContext): The context object from Telegram.
+        kind (str): Callback kind (ANSWER_CALLBACK or NEXT_CALLBACK).
+        value (str): Optional payload, e.g. the answer key.
+    Returns:
+        str: Callback data of the form "<kind>_<nonce>_<index>[_<value>]".
+    """
+    data = f"{kind}_{context.user_data.get('quiz_nonce', '')}_{context.user_data.get('current_index', 0)}"
+    return f"{data}_{value}"[:MAX_BUTTON_LENGTH] if value else data
+
+
+def claim_session_callback(context: CallbackContext, data: str) -> Optional[str]:
+    """
+    Accepts a session-bound callback at most once.
+
+    Callbacks from another session, for a question other than the current one,
+    or already handled for the current question return None so the caller can
+    drop them without touching the database or the Bot API.
+    Args:
+        context (CallbackContext): The context object from Telegram.
+        data (str): Callback data built by session_callback.
+    Returns:
+        Optional[str]: The callback payload, or None for duplicate/stale callbacks.
+    """
+    parts = data.split('_', 3)
+    if len(parts) < 3 or not parts[2].isdigit():
+        return None
+    kind, nonce, index = parts[0], parts[1], int(parts[2])
+    if nonce != context.user_data.get('quiz_nonce') or index != context.user_data.get('current_index'):
+        return None
+    handled = context.user_data.setdefault('handled_callbacks', {})
+    if handled.get(kind) == index:
+        return None
+    handled[kind] = index
+    return parts[3] if len(parts) > 3 else ""
 
 
 async def delete_last_message(context: CallbackContext):
@@ -108,38 +261,49 @@ async def send_question(update: Update, context: CallbackContext,
     total_questions = len(context.user_data.get('quiz_data', []))
     current_question = context.user_data['quiz_data'][current_index]
     query = update.callback_query
+    chat_id = context.user_data.get('chat_id') or update.effective_chat.id
+
+    # A new question closes the previous poll; send_quiz_poll records the next one
+    context.user_data.pop('poll_id', None)
+    poll_payloads = context.user_data.get('poll_payloads')
+    if poll_payloads and poll_payloads[current_index]:
+        await send_quiz_poll(update, context, config, poll_payloads[current_index])
+        return
 
     timer_enabled = context.user_data.get('timer_enabled',
                                           config['base_settings']['timer_enabled'])
     remaining_time_text = ""
 
-    if timer_enabled:
-        remaining_seconds = context.user_data.get('remaining_time', 0)
-        remaining_minutes = remaining_seconds // 60
-        remaining_seconds %= 60
-        remaining_time_text = f"{emoji['timer_limit']} " + localization.get(
-            "time_remaining",
-            minutes=remaining_minutes,
-            seconds=remaining_seconds) + "\n\n"
-
-    question_text = f"{emoji['test']} Q{current_index + 1}. {current_question['question']}\n\n"
-    options = current_question['answers']
-
-    message_text = f"{remaining_time_text}{question_text}\n"
-    for option in options:
-        message_text += f"{option}\n\n"
-
-    keyboard = [[InlineKeyboardButton(
-        option.split(':')[0].strip() if ':' in option else option.split('.')[0].strip(),
-        callback_data=option.split(':')[0].strip() if ':' in option else
-        option.split('.')[0].strip()[:MAX_BUTTON_LENGTH])] for option in options]
-    keyboard.append([InlineKeyboardButton(
-        f"{emoji['back_button']} {localization.get('back_button')}",
-        callback_data="list_tests")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    with span("render.question"):
+        if timer_enabled:
+            remaining_minutes, remaining_seconds = divmod(remaining_time(context), 60)
+            remaining_time_text = f"{emoji['timer_limit']} " + localization.get(
+                "time_remaining",
+                minutes=remaining_minutes,
+                seconds=remaining_seconds) + "\n\n"
+
+        question_text = f"{emoji['test']} Q{current_index + 1}. {current_question['question']}\n\n"
+        options = current_question['answers']
 
-    context.bot_data['logger'].info(
-        f"Sending message: '{message_text}' in mode: {parse_mode}")
+        message_text = f"{remaining_time_text}{question_text}\n"
+        for option in options:
+            message_text += f"{option}\n\n"
+
+        keyboard = [[InlineKeyboardButton(
+            option.split(':')[0].strip() if ':' in option else option.split('.')[0].strip(),
+            callback_data=session_callback(
+                context, ANSWER_CALLBACK,
+                option.split(':')[0].strip() if ':' in option else option.split('.')[0].strip()))]
+            for option in options]
+        keyboard.append([InlineKeyboardButton(
+            f"{emoji['back_button']} {localization.get('back_button')}",
+            callback_data="list_tests")])
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+    context.bot_data['events'].emit(
+        "question_sent", "Sending question {question}/{total} in mode: {parse_mode}",
+        level="DEBUG", question=current_index + 1, total=total_questions,
+        parse_mode=parse_mode, text=message_text)
 
     try:
         if query:
@@ -148,14 +312,14 @@ async def send_question(update: Update, context: CallbackContext,
                                                          parse_mode=parse_mode)
         else:
             sent_message = await context.bot.send_message(
-                chat_id=update.effective_chat.id, text=message_text,
+                chat_id=chat_id, text=message_text,
                 reply_markup=reply_markup, parse_mode=parse_mode)
         context.user_data['last_message'] = sent_message
     except Exception as e:
         logger = context.bot_data['logger']
         logger.error(f"Error sending question message: {e}")
         try:
-            sent_message = await context.bot.send_message(chat_id=update.effective_chat.id,
+            sent_message = await context.bot.send_message(chat_id=chat_id,
                                                           text=message_text,
                                                           reply_markup=reply_markup,
                                                           parse_mode=parse_mode)
@@ -215,13 +379,20 @@ async def send_results(update, context, config):
             callback_data="list_tests")]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
+    chat_id = context.user_data.get('chat_id') or update.effective_chat.id
+    finish_quiz_session(context)
+    if not update.callback_query:
+        # Poll answers carry no message to edit
+        await context.bot.send_message(chat_id=chat_id, text=result_text,
+                                       reply_markup=reply_markup)
+        return
     try:
         await update.callback_query.edit_message_text(text=result_text,
                                                       reply_markup=reply_markup)
     except Exception as e:
         logger = context.bot_data['logger']
         logger.error(f"Error editing the results message: {e}")
-        await context.bot.send_message(chat_id=update.effective_chat.id,
+        await context.bot.send_message(chat_id=chat_id,
                                        text=result_text, reply_markup=reply_markup)
 
 
@@ -240,8 +411,11 @@ async def handle_category_selection(update: Update, context: CallbackContext, qu
     config = context.bot_data['config']
     emoji = config['emoji']
     category = query.data.split('_', 1)[1]
-    category_directory = os.path.join(questions_directory, category)
-    quiz_files = get_quiz_files(category_directory, logger)
+    store = get_question_store(context)
+    if store is not None:
+        quiz_files = store.quizzes(category)
+    else:
+        quiz_files = get_quiz_files(os.path.join(questions_directory, category), logger)
     if quiz_files:
         keyboard = [
             [InlineKeyboardButton(
@@ -282,21 +456,29 @@ async def handle_quiz_selection(update: Update, context: CallbackContext, query,
     logger.info(f"Selected questions count: {questions_count}")
 
     _, quiz_name, category = query.data.split('_', 2)
-    category_directory = os.path.join(questions_directory, category)
-    quiz_file_path = os.path.join(category_directory, quiz_name + '.json')
-    logger.info(f"Trying to open file: {quiz_file_path}")
+    logger.info(f"Loading quiz {category}/{quiz_name}")
+    questions = load_quiz_questions(context, questions_directory, category, quiz_name)
 
-    if os.path.exists(quiz_file_path):
+    if questions is not None:
         config = context.bot_data['config']
-        quiz_data = load_random_questions(quiz_file_path, questions_count,
-                                          questions_random_enabled)
+        question_ids = select_question_indices(len(questions), questions_count,
+                                               questions_random_enabled)
+        quiz_data = pick_questions(questions, question_ids)
         context.user_data['quiz_data'] = quiz_data
+        context.user_data['question_ids'] = question_ids
         context.user_data['current_index'] = 0
         context.user_data['correct_count'] = 0
         context.user_data['last_quiz'] = quiz_name
         context.user_data['last_category'] = category  # Saving the last category
         context.user_data['quiz_started_at'] = dt.datetime.utcnow().replace(microsecond=0).isoformat() + 'Z'
         context.user_data['query'] = query
+        context.user_data['chat_id'] = update.effective_chat.id
+        context.user_data['telegram_id'] = update.effective_user.id
+        context.user_data['quiz_nonce'] = secrets.token_hex(4)
+        context.user_data['handled_callbacks'] = {}
+        context.user_data['poll_payloads'] = (
+            build_poll_payloads(quiz_data)
+            if get_delivery_mode(config) == DELIVERY_POLL else None)
 
         # Persist last quiz/category in DB
         db = context.application.bot_data.get('db')
@@ -307,8 +489,18 @@ async def handle_quiz_selection(update: Update, context: CallbackContext, query,
         # Start the timer if enabled (use per-user setting)
         if context.user_data.get('timer_enabled', config['base_settings']['timer_enabled']):
             timer_limit = context.user_data.get('timer_limit', config['base_settings']['timer_limit'][0])
-            context.user_data['remaining_time'] = timer_limit * 60  # Convert minutes to seconds
-            context.user_data['timer_task'] = asyncio.create_task(start_timer(update, context, timer_limit))
+            # Absolute deadline, so a restarted bot can resume the timer
+            context.user_data['quiz_deadline'] = time.time() + timer_limit * 60
+            if context.bot_data['tasks'].spawn(
+                    start_timer(update, context, context.user_data['quiz_deadline']),
+                    owner=update.effective_user.id, kind="quiz_timer", replace=True) is None:
+                # A task cap was reached; a timed quiz without its timer would never end
+                finish_quiz_session(context)
+                await query.message.edit_text(localization.get("quiz_timer_unavailable"))
+                return
+        else:
+            context.user_data.pop('quiz_deadline', None)
+            await stop_timer(context)
 
         await send_question(update, context, config)
     else:
@@ -335,32 +527,30 @@ async def handle_quiz_response(update: Update, context: CallbackContext, answer:
         quiz_data = context.user_data['quiz_data']
         current_question = quiz_data[current_index]
 
-        message_text = format_question_message(current_question, answer, emoji,
-                                               localization)
+        with span("render.answer"):
+            message_text = format_question_message(current_question, answer, emoji,
+                                                   localization)
 
         if extract_key(answer) == extract_key(current_question['correct_answer']):
             context.user_data['correct_count'] += 1
 
-        log_quiz_response(logger, update.effective_user.id, current_question, answer)
+        log_quiz_response(context.bot_data['events'], update.effective_user.id, current_index,
+                          current_question, answer)
 
         query = update.callback_query
 
         if current_index >= len(quiz_data) - 1:
             # Cancel the timer task if the quiz is completed
-            if 'timer_task' in context.user_data:
-                context.user_data['timer_task'].cancel()
+            await stop_timer(context)
             await query.edit_message_text(text=message_text, reply_markup=None)
             await send_results(update, context, config)
         else:
             context.user_data['current_index'] += 1
             next_question_index = context.user_data['current_index'] + 1
-            remaining_seconds = context.user_data.get('remaining_time', 0)
-            remaining_minutes = remaining_seconds // 60
-            remaining_seconds %= 60
             keyboard = [
                 [InlineKeyboardButton(
                     f"{emoji['next_button']} {localization.get('next_question_button', next_question_index=next_question_index, total_questions=len(quiz_data))}",
-                    callback_data='next_question')],
+                    callback_data=session_callback(context, NEXT_CALLBACK))],
                 [InlineKeyboardButton(
                     f"{emoji['back_button']} {localization.get('back_button')}",
                     callback_data="list_tests")]
@@ -379,20 +569,28 @@ async def handle_quiz_response(update: Update, context: CallbackContext, answer:
             localization.get("unexpected_error"))
 
 
-async def start_timer(update: Update, context: CallbackContext, timer_limit):
+def remaining_time(context: CallbackContext) -> int:
     """
-    Starts a timer for the quiz duration.
+    Returns the whole seconds left before the quiz deadline.
     Args:
-        update (Update): The update object from Telegram.
         context (CallbackContext): The context object from Telegram.
-        timer_limit (int): The time limit for the quiz in minutes.
+    Returns:
+        int: Remaining seconds, 0 if there is no deadline or it has passed.
+    """
+    deadline = context.user_data.get('quiz_deadline')
+    return max(0, int(deadline - time.time())) if deadline else 0
+
+
+async def start_timer(update: Optional[Update], context: CallbackContext, deadline: float):
+    """
+    Ends the quiz once its deadline is reached.
+    Args:
+        update (Optional[Update]): The update object from Telegram, None for resumed timers.
+        context (CallbackContext): The context object from Telegram.
+        deadline (float): Unix timestamp at which the quiz ends.
     """
-    total_seconds = timer_limit * 60
     try:
-        while total_seconds > 0:
-            await asyncio.sleep(1)  # 1 second
-            total_seconds -= 1
-            context.user_data['remaining_time'] = total_seconds
+        await asyncio.sleep(max(0.0, deadline - time.time()))
         await end_quiz_due_to_time_limit(update, context)
     except asyncio.CancelledError:
         # Timer was cancelled
@@ -410,7 +608,7 @@ async def end_quiz_due_to_time_limit(update: Update, context: CallbackContext):
     config = context.bot_data['config']
     emoji = config['emoji']
     correct_count = context.user_data.get('correct_count', 0)
-    total_questions = len(context.user_data['quiz_data'])
+    total_questions = len(context.user_data.get('question_ids') or context.user_data['quiz_data'])
     success_rate = (correct_count / total_questions) * 100
     required_success_rate = config['base_settings']['success_rate']
 
@@ -449,8 +647,10 @@ async def end_quiz_due_to_time_limit(update: Update, context: CallbackContext):
             callback_data="list_tests")]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await context.bot.send_message(chat_id=update.effective_chat.id, text=result_text,
-                                   reply_markup=reply_markup)
+    chat_id = context.user_data.get('chat_id') or update.effective_chat.id
+    # Buttons of the expired session must no longer be graded
+    finish_quiz_session(context)
+    await context.bot.send_message(chat_id=chat_id, text=result_text, reply_markup=reply_markup)
 
 
 def format_question_message(current_question: dict, answer: str, emoji: dict,
@@ -500,20 +700,24 @@ def extract_key(option: str) -> str:
     return option.strip()
 
 
-def log_quiz_response(logger, user_id: int, current_question: dict, answer: str) -> None:
+def log_quiz_response(events, user_id: int, question_index: int, current_question: dict,
+                      answer: str) -> None:
     """
-    Logs the user's response to a quiz question.
+    Logs the user's response to a quiz question as one "quiz_answer" event.
     Args:
-        logger (Logger): Logger for logging errors and info messages.
+        events (EventLogger): Sampled, rate-limited event log (bot_data['events']).
         user_id (int): The user's Telegram ID.
+        question_index (int): Index of the question in the session.
         current_question (dict): The current quiz question.
         answer (str): The user's selected answer.
     """
-    logger.info(f"Question: {current_question['question']}")
-    logger.info(f"Given Answer: {answer}")
-    logger.info(f"Correct Answer: {current_question['correct_answer']}")
-    logger.info(
-        f"Is Correct: {extract_key(answer) == extract_key(current_question['correct_answer'])}")
+    correct_answer = current_question['correct_answer']
+    events.emit("quiz_answer", "User {user_id} answered question {question}: {answer} "
+                               "(correct: {correct_answer})",
+                user_id=user_id, question=question_index + 1, answer=answer,
+                correct_answer=correct_answer,
+                is_correct=extract_key(answer) == extract_key(correct_answer),
+                text=current_question['question'])
 
 
 async def stop_timer(context: CallbackContext) -> None:
@@ -522,5 +726,43 @@ async def stop_timer(context: CallbackContext) -> None:
     Args:
         context (CallbackContext): The context object from Telegram.
     """
-    if 'timer_task' in context.user_data:
-        context.user_data['timer_task'].cancel()
+    telegram_id = context.user_data.get('telegram_id')
+    if telegram_id is not None:
+        context.bot_data['tasks'].cancel_owner(telegram_id, "quiz_timer")
+
+
+def finish_quiz_session(context: CallbackContext) -> None:
+    """
+    Marks the running quiz as finished so its persisted session row is dropped.
+    Args:
+        context (CallbackContext): The context object from Telegram.
+    """
+    for key in ('question_ids', 'quiz_nonce', 'quiz_deadline', 'poll_id',
+                'poll_correct_option_id'):
+        context.user_data.pop(key, None)
+    telegram_id = context.user_data.get('telegram_id')
+    if telegram_id is not None:
+        # Timers finish without an update, so persistence would not notice otherwise
+        context.application.mark_data_for_update_persistence(user_ids=telegram_id)
+
+
+def resume_quiz_timers(application) -> int:
+    """
+    Restarts the timers of quiz sessions restored from persistence.
+    Args:
+        application (Application): The Telegram application.
+    Returns:
+        int: The number of timers started.
+    """
+    resumed = 0
+    for telegram_id, user_data in application.user_data.items():
+        deadline = user_data.get('quiz_deadline')
+        if not deadline or not user_data.get('question_ids'):
+            continue
+        context = CallbackContext(application, chat_id=user_data.get('chat_id'),
+                                  user_id=telegram_id)
+        if application.bot_data['tasks'].spawn(start_timer(None, context, deadline),
+                                               owner=telegram_id, kind="quiz_timer",
+                                               replace=True):
+            resumed += 1
+    return resumed
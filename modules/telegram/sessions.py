@@ -0,0 +1,134 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: modules/telegram/sessions.py
+
+Description:
+This module evicts heavy per-user session state from context.user_data once a
+user has been idle for a configurable time. Loaded questions, poll payloads and
+the Telegram Message/CallbackQuery objects are dropped; a small stub with the
+user's settings, language and quiz position is kept so a running quiz can be
+resumed by reloading its questions from disk.
+"""
+
+import asyncio
+import gc
+import sys
+import time
+from types import FunctionType, ModuleType
+from typing import Any, Dict, Iterable, Mapping, Optional, Set, Tuple
+from telegram.ext import Application
+
+# 'localization' stays: translations are cached per language, so the user's
+# instance is small, and the poll answer path never rebuilds it
+HEAVY_SESSION_KEYS = ('quiz_data', 'poll_payloads', 'last_message', 'query')
+
+
+def touch_session(user_data: Dict[str, Any]) -> None:
+    """
+    Records user activity for idle eviction.
+
+    Args:
+        user_data (Dict[str, Any]): The user's context.user_data.
+    """
+    user_data['last_active'] = time.time()
+
+
+def estimate_size(obj: Any, exclude: Optional[Set[int]] = None) -> int:
+    """
+    Approximates the memory retained by an object graph.
+
+    Objects whose ids are in exclude (the shared Bot instance, bot_data and
+    the like) are not followed, so only state private to the session counts.
+
+    Args:
+        obj (Any): Root object.
+        exclude (Optional[Set[int]]): Ids of shared objects to skip.
+
+    Returns:
+        int: Approximate size in bytes.
+    """
+    seen = set(exclude or ())
+    pending = [obj]
+    size = 0
+    while pending:
+        current = pending.pop()
+        if id(current) in seen or isinstance(current, (type, ModuleType, FunctionType)):
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        pending.extend(gc.get_referents(current))
+    return size
+
+
+class SessionSweeper:
+    """
+    Periodically strips idle sessions in Application.user_data down to a stub.
+    """
+
+    def __init__(self, logger, idle_ttl: float = 1800, interval: float = 60):
+        """
+        Initializes the sweeper.
+
+        Args:
+            logger: Logger instance for reporting sweeps.
+            idle_ttl (float): Seconds of inactivity after which a session is stripped.
+            interval (float): Seconds between sweeps.
+        """
+        self.logger = logger
+        self.idle_ttl = idle_ttl
+        self.interval = interval
+        self.evicted_total = 0
+        self.bytes_reclaimed_total = 0
+
+    def sweep(self, sessions: Mapping[int, Dict[str, Any]], now: Optional[float] = None,
+              shared: Iterable[Any] = ()) -> Tuple[int, int]:
+        """
+        Strips heavy state from every idle session.
+
+        Sessions with a running quiz timer are left alone, since the timer task
+        still needs their questions when the deadline passes.
+
+        Args:
+            sessions (Mapping[int, Dict[str, Any]]): Application.user_data.
+            now (Optional[float]): Wall-clock timestamp, defaults to the current time.
+            shared (Iterable[Any]): Objects shared across sessions, excluded from sizing.
+
+        Returns:
+            Tuple[int, int]: Number of sessions stripped and estimated bytes reclaimed.
+        """
+        now = time.time() if now is None else now
+        exclude = {id(obj) for obj in shared}
+        evicted = reclaimed = 0
+        for user_data in list(sessions.values()):
+            if now - user_data.get('last_active', now) < self.idle_ttl:
+                continue
+            if user_data.get('quiz_deadline', 0) > now:
+                continue
+            heavy = {key: user_data[key] for key in HEAVY_SESSION_KEYS if key in user_data}
+            if not heavy:
+                continue
+            reclaimed += estimate_size(heavy, exclude)
+            for key in heavy:
+                del user_data[key]
+            evicted += 1
+        self.evicted_total += evicted
+        self.bytes_reclaimed_total += reclaimed
+        return evicted, reclaimed
+
+    async def run(self, application: Application) -> None:
+        """
+        Sweeps Application.user_data until cancelled.
+
+        Args:
+            application (Application): The running Telegram application.
+        """
+        shared = (application.bot, application.bot_data)
+        while True:
+            await asyncio.sleep(self.interval)
+            evicted, reclaimed = self.sweep(application.user_data, shared=shared)
+            if evicted:
+                self.logger.info(
+                    f"Evicted {evicted} idle sessions, reclaimed ~{reclaimed} bytes")
@@ -0,0 +1,244 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: modules/telegram/throttling.py
+
+Description:
+This module protects the bot from inbound floods. FloodGuard runs ahead of the
+regular handlers and applies a per-user token bucket to button presses and
+commands, dropping excess updates with only a cheap query.answer().
+AdmissionControlProcessor caps the number of updates processed concurrently,
+keeps each user's updates in order and sheds new updates once the backlog
+grows past a threshold; on shutdown it can abandon the updates it still holds.
+Rejections are counted per reason.
+"""
+
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Awaitable, Dict, List, Optional, Set
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, BaseUpdateProcessor, CallbackContext
+
+REJECT_USER_RATE = "user_rate"
+REJECT_BACKLOG = "backlog"
+REJECT_SHUTDOWN = "shutdown"
+
+
+async def _acknowledge(update: object) -> None:
+    """
+    Answers a callback query so the client stops its spinner; nothing else is done.
+    """
+    query = update.callback_query if isinstance(update, Update) else None
+    if query:
+        try:
+            await query.answer()
+        except Exception:
+            pass
+
+
+class FloodGuard:
+    """
+    Per-user token buckets for callback queries and commands.
+    """
+
+    _SWEEP_EVERY = 1024
+
+    def __init__(self, rate: float, burst: int, rejections: Optional[Counter] = None):
+        """
+        Initializes the guard.
+
+        Args:
+            rate (float): Tokens refilled per second for each user.
+            burst (int): Bucket capacity, i.e. the largest allowed burst.
+            rejections (Optional[Counter]): Shared counter of rejections per reason.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.rejections = rejections if rejections is not None else Counter()
+        self._buckets: Dict[int, List[float]] = {}
+        self._checks = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def allow(self, user_id: int, now: Optional[float] = None) -> bool:
+        """
+        Takes one token from the user's bucket.
+
+        Args:
+            user_id (int): Telegram user ID.
+            now (Optional[float]): Monotonic timestamp, defaults to the current time.
+
+        Returns:
+            bool: True if the update may proceed.
+        """
+        now = time.monotonic() if now is None else now
+        self._checks += 1
+        if self._checks % self._SWEEP_EVERY == 0:
+            self._sweep(now)
+
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            self._buckets[user_id] = [self.burst - 1, now]
+            return True
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+    def _sweep(self, now: float) -> None:
+        # Buckets that would be full again carry no state worth keeping
+        refill = self.burst / self.rate if self.rate > 0 else float('inf')
+        idle = [uid for uid, (_, last) in self._buckets.items() if now - last >= refill]
+        for uid in idle:
+            del self._buckets[uid]
+
+    async def check(self, update: Update, context: CallbackContext) -> None:
+        """
+        Handler callback registered in a group ahead of the regular handlers.
+
+        Args:
+            update (Update): The update object from Telegram.
+            context (CallbackContext): The context object from Telegram.
+
+        Raises:
+            ApplicationHandlerStop: If the user exceeded their rate.
+        """
+        if not (update.callback_query or update.message) or not update.effective_user:
+            return
+        if self.allow(update.effective_user.id):
+            return
+        self.rejections[REJECT_USER_RATE] += 1
+        await _acknowledge(update)
+        raise ApplicationHandlerStop
+
+
+class _UserLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class AdmissionControlProcessor(BaseUpdateProcessor):
+    """
+    Update processor with a global concurrency cap, per-user ordering and load
+    shedding once too many updates are waiting.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_backlog: int,
+                 rejections: Optional[Counter] = None):
+        """
+        Initializes the processor.
+
+        Args:
+            max_concurrent_updates (int): Updates processed at the same time.
+            max_backlog (int): Waiting updates above which new ones are shed.
+            rejections (Optional[Counter]): Shared counter of rejections per reason.
+        """
+        # The base semaphore only has to admit enough updates for the backlog
+        # check below to see them; the real cap is self._slots.
+        super().__init__(max_concurrent_updates + max_backlog + 1)
+        self.max_concurrent = max_concurrent_updates
+        self.max_backlog = max_backlog
+        self.rejections = rejections if rejections is not None else Counter()
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._user_locks: Dict[int, _UserLock] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.closed = False
+        self.waiting = 0
+        self.in_flight = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """
+        Processes an update unless the backlog is over its threshold.
+
+        Args:
+            update (object): The update to be processed.
+            coroutine (Awaitable[Any]): The coroutine that processes the update.
+        """
+        if self.closed:
+            self.rejections[REJECT_SHUTDOWN] += 1
+            close = getattr(coroutine, 'close', None)
+            if close:
+                close()
+            return
+        if self.waiting >= self.max_backlog:
+            self.rejections[REJECT_BACKLOG] += 1
+            close = getattr(coroutine, 'close', None)
+            if close:
+                close()
+            await _acknowledge(update)
+            return
+
+        user = update.effective_user if isinstance(update, Update) else None
+        user_lock = None
+        if user:
+            user_lock = self._user_locks.get(user.id)
+            if user_lock is None:
+                user_lock = self._user_locks[user.id] = _UserLock()
+            user_lock.users += 1
+
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        self.waiting += 1
+        waiting = True
+        try:
+            if user_lock:
+                await user_lock.lock.acquire()
+            try:
+                async with self._slots:
+                    self.waiting -= 1
+                    waiting = False
+                    self.in_flight += 1
+                    try:
+                        await coroutine
+                    finally:
+                        self.in_flight -= 1
+            finally:
+                if user_lock:
+                    user_lock.lock.release()
+        except asyncio.CancelledError:
+            if not self.closed:
+                raise
+            # Abandoned on shutdown: return normally so PTB counts the update
+            # as done and Application.stop() does not wait for it forever
+            self.rejections[REJECT_SHUTDOWN] += 1
+            close = getattr(coroutine, 'close', None)
+            if close:
+                close()
+        finally:
+            self._tasks.discard(task)
+            if waiting:
+                self.waiting -= 1
+            if user_lock:
+                user_lock.users -= 1
+                if not user_lock.users:
+                    self._user_locks.pop(user.id, None)
+
+    def abandon(self) -> List[asyncio.Task]:
+        """
+        Cancels the updates being processed or waiting and drops any that
+        arrive later. Used when a shutdown runs out of time.
+
+        Returns:
+            List[asyncio.Task]: The cancelled tasks.
+        """
+        self.closed = True
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        return tasks
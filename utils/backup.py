@@ -0,0 +1,374 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: utils/backup.py
+
+Description:
+Online backups of the bot's SQLite files while the bot keeps running. Each file
+(the single database, or the metadata database and every shard) is copied with
+SQLite's online backup API a few pages per step, pausing between steps, from a
+worker thread. The source connection holds one read transaction for the whole
+copy: in WAL mode that gives a consistent snapshot without blocking writers,
+and the backup never restarts because of concurrent writes.
+
+A backup set is a timestamped directory holding the copied (optionally
+gzip-compressed) files and a manifest with checksums and row counts. Sets
+beyond the configured count are deleted oldest first.
+
+Usage:
+    python -m utils.backup run
+    python -m utils.backup verify data/db/backups/qbb-20240101-030000
+    python -m utils.backup restore data/db/backups/qbb-20240101-030000
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils.configs import ConfigLoader
+from utils.database import shard_layout_paths
+
+MANIFEST = "manifest.json"
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _row_counts(conn: sqlite3.Connection) -> Dict[str, int]:
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+        "ORDER BY name")]
+    return {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            for table in tables}
+
+
+def copy_database(source: Path, target: Path, pages_per_step: int = 256,
+                  step_pause: float = 0.01) -> Dict[str, Any]:
+    """
+    Copies a live database file with the online backup API. Blocking; run it in a thread.
+
+    Args:
+        source (Path): Database file to back up.
+        target (Path): New file to write.
+        pages_per_step (int): Pages copied per backup step.
+        step_pause (float): Seconds to sleep between steps.
+
+    Returns:
+        Dict[str, Any]: Page count, duration, steps and row counts of the copy.
+    """
+    started = time.perf_counter()
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        # sqlite3 only sleeps between steps when the source is busy; pause after
+        # every step so the bot's own writes and the event loop get the GIL
+        if remaining and step_pause:
+            time.sleep(step_pause)
+
+    src = sqlite3.connect(f"file:{source.as_posix()}?mode=ro", uri=True, isolation_level=None,
+                          timeout=5)
+    dst = sqlite3.connect(target)
+    try:
+        # Pin a read snapshot so writes by the bot do not restart the copy
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=pages_per_step, progress=progress)
+        src.execute("COMMIT")
+        pages = dst.execute("PRAGMA page_count").fetchone()[0]
+        # Backups are standalone files; no -wal/-shm next to them
+        dst.execute("PRAGMA journal_mode=DELETE")
+        tables = _row_counts(dst)
+    finally:
+        dst.close()
+        src.close()
+    return {'pages': pages, 'steps': steps, 'seconds': round(time.perf_counter() - started, 3),
+            'tables': tables}
+
+
+def _compress(path: Path) -> Path:
+    target = path.with_name(path.name + ".gz")
+    with open(path, 'rb') as raw, gzip.open(target, 'wb', compresslevel=6) as packed:
+        shutil.copyfileobj(raw, packed, 1 << 20)
+    path.unlink()
+    return target
+
+
+def _extract(entry: Dict[str, Any], backup_dir: Path, target: Path) -> None:
+    source = backup_dir / entry['file']
+    if entry['file'].endswith(".gz"):
+        with gzip.open(source, 'rb') as packed, open(target, 'wb') as raw:
+            shutil.copyfileobj(packed, raw, 1 << 20)
+    else:
+        shutil.copyfile(source, target)
+
+
+def verify_backup(backup_dir) -> List[str]:
+    """
+    Checks a backup set by restoring it into a temporary directory.
+
+    Every file must match its checksum, pass PRAGMA integrity_check and hold the
+    row counts recorded in the manifest.
+
+    Args:
+        backup_dir (str): Backup set directory.
+
+    Returns:
+        List[str]: Problems found; empty if the set can be restored.
+    """
+    backup_dir = Path(backup_dir)
+    try:
+        with open(backup_dir / MANIFEST, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError) as e:
+        return [f"Unreadable manifest: {e}"]
+
+    problems = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for entry in manifest['files']:
+            name = entry['source']
+            if not (backup_dir / entry['file']).exists():
+                problems.append(f"{name}: missing {entry['file']}")
+                continue
+            if _sha256(backup_dir / entry['file']) != entry['sha256']:
+                problems.append(f"{name}: checksum mismatch")
+                continue
+            restored = Path(tmp) / name
+            try:
+                _extract(entry, backup_dir, restored)
+                with sqlite3.connect(restored) as conn:
+                    check = conn.execute("PRAGMA integrity_check").fetchone()[0]
+                    if check != "ok":
+                        problems.append(f"{name}: integrity_check: {check}")
+                    elif _row_counts(conn) != entry['tables']:
+                        problems.append(f"{name}: row counts differ from the manifest")
+            except (OSError, EOFError, sqlite3.DatabaseError) as e:
+                problems.append(f"{name}: {e}")
+    return problems
+
+
+def restore_backup(backup_dir, db_path: str) -> Path:
+    """
+    Replaces the database files with a verified backup set. Stop the bot first.
+
+    Args:
+        backup_dir (str): Backup set directory.
+        db_path (str): Configured db_source path.
+
+    Returns:
+        Path: Directory the replaced files were moved to.
+
+    Raises:
+        RuntimeError: If the backup set does not verify.
+    """
+    backup_dir = Path(backup_dir)
+    problems = verify_backup(backup_dir)
+    if problems:
+        raise RuntimeError("Backup does not verify: " + "; ".join(problems))
+    with open(backup_dir / MANIFEST, 'r', encoding='utf-8') as file:
+        manifest = json.load(file)
+
+    root = Path(db_path).parent
+    root.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    staging = Path(tempfile.mkdtemp(prefix=f"restore-{stamp}-", dir=root))
+    try:
+        for entry in manifest['files']:
+            _extract(entry, backup_dir, staging / entry['source'])
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    replaced = Path(tempfile.mkdtemp(prefix=f"pre-restore-{stamp}-", dir=root))
+    stem = Path(db_path).stem
+    for path in root.glob(f"{stem}.*"):
+        if path.is_file():
+            path.rename(replaced / path.name)
+    for entry in manifest['files']:
+        (staging / entry['source']).rename(root / entry['source'])
+    shutil.rmtree(staging, ignore_errors=True)
+    return replaced
+
+
+class DatabaseBackup:
+    """
+    Takes rotated online backups of the bot database on a schedule.
+    """
+
+    def __init__(self, db_path: str, shards: int, directory, logger, interval: float = 21600,
+                 keep: int = 7, compress: bool = True, pages_per_step: int = 256,
+                 step_pause: float = 0.01):
+        """
+        Initializes the backup job.
+
+        Args:
+            db_path (str): Configured db_source path.
+            shards (int): Configured shard count.
+            directory (str): Directory receiving backup sets.
+            logger: Logger instance.
+            interval (float): Seconds between scheduled backups.
+            keep (int): Backup sets to keep.
+            compress (bool): Gzip the copied files (in the worker thread).
+            pages_per_step (int): Pages copied per backup step.
+            step_pause (float): Seconds to pause between steps.
+        """
+        self.db_path = db_path
+        self.shards = int(shards)
+        self.directory = Path(directory)
+        self.logger = logger
+        self.interval = interval
+        self.keep = max(1, int(keep))
+        self.compress = compress
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.last_backup: Optional[Path] = None
+        self.last_backup_time = 0.0
+        self.backups_total = 0
+        self.failures_total = 0
+
+    def sources(self) -> List[Path]:
+        meta, shards = shard_layout_paths(self.db_path, self.shards)
+        return ([meta] if meta else []) + shards
+
+    def backup(self) -> Path:
+        """
+        Writes one backup set and rotates old ones. Blocking; run it in a thread.
+
+        Returns:
+            Path: The new backup set directory.
+        """
+        started = time.perf_counter()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        name = f"{Path(self.db_path).stem}-{stamp}"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Written under a temporary name, so rotation and restore never see a partial set
+        partial = self.directory / f".{name}.partial"
+        partial.mkdir()
+        try:
+            files = []
+            for source in self.sources():
+                target = partial / source.name
+                stats = copy_database(source, target, self.pages_per_step, self.step_pause)
+                if self.compress:
+                    target = _compress(target)
+                files.append({'source': source.name, 'file': target.name,
+                              'bytes': target.stat().st_size, 'sha256': _sha256(target),
+                              **stats})
+            manifest = {'created': stamp, 'shards': self.shards, 'files': files}
+            with open(partial / MANIFEST, 'w', encoding='utf-8') as file:
+                json.dump(manifest, file, indent=2)
+            final = self.directory / name
+            partial.rename(final)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+        self.last_backup = final
+        self.last_backup_time = time.time()
+        self.backups_total += 1
+        self._rotate()
+        self.logger.info(
+            f"Database backup {final.name}: {len(files)} file(s), "
+            f"{sum(entry['pages'] for entry in files)} pages, "
+            f"{sum(entry['bytes'] for entry in files) / 2**20:.1f} MiB in "
+            f"{time.perf_counter() - started:.1f}s")
+        return final
+
+    def _rotate(self) -> None:
+        stem = Path(self.db_path).stem
+        sets = sorted(path for path in self.directory.glob(f"{stem}-*")
+                      if (path / MANIFEST).exists())
+        for path in sets[:-self.keep]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    async def run(self) -> None:
+        """
+        Takes a backup every interval until cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.backup)
+            except (OSError, sqlite3.Error) as e:
+                self.failures_total += 1
+                self.logger.error(f"Database backup failed: {e}")
+
+
+def backup_from_config(config: Dict[str, Any], logger) -> DatabaseBackup:
+    """
+    Builds the backup job from the database section of the configuration.
+    """
+    db_cfg = config.get('database', {})
+    backup_cfg = db_cfg.get('backup', {})
+    return DatabaseBackup(
+        db_cfg.get('db_source', 'data/db/qbb.db'),
+        db_cfg.get('shards', 1),
+        backup_cfg.get('directory', 'data/db/backups'),
+        logger,
+        interval=backup_cfg.get('interval', 21600),
+        keep=backup_cfg.get('keep', 7),
+        compress=backup_cfg.get('compress', True),
+        pages_per_step=backup_cfg.get('pages_per_step', 256),
+        step_pause=backup_cfg.get('step_pause', 0.01),
+    )
+
+
+class _PrintLogger:
+    def info(self, message, *args, **kwargs) -> None:
+        print(message)
+
+    error = info
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Back up, verify or restore the bot database.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('run', help="Take a backup now (safe while the bot runs)")
+    verify = commands.add_parser('verify', help="Check that a backup set restores cleanly")
+    verify.add_argument('backup_dir')
+    restore = commands.add_parser('restore', help="Restore a verified backup set (bot stopped)")
+    restore.add_argument('backup_dir')
+    args = parser.parse_args()
+
+    config = ConfigLoader(Path("configs")).load_config()
+    if args.command == 'run':
+        backup_from_config(config, _PrintLogger()).backup()
+    elif args.command == 'verify':
+        problems = verify_backup(args.backup_dir)
+        for problem in problems:
+            print(f"FAIL {problem}")
+        if problems:
+            sys.exit(1)
+        print(f"OK {args.backup_dir} restores cleanly")
+    else:
+        db_cfg = config.get('database', {})
+        try:
+            replaced = restore_backup(args.backup_dir, db_cfg.get('db_source', 'data/db/qbb.db'))
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        print(f"Restored {args.backup_dir}; previous files moved to {replaced}")
+        with open(Path(args.backup_dir) / MANIFEST, 'r', encoding='utf-8') as file:
+            shards = json.load(file)['shards']
+        if shards != db_cfg.get('shards', 1):
+            print(f"Set database.shards to {shards} before starting the bot.")
+
+
+if __name__ == "__main__":
+    main()
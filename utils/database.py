@@ -6,16 +6,26 @@
 utils/database.py
 
 Lightweight async SQLite persistence for per-user settings and stats.
-- aiosqlite connection with WAL, foreign keys, busy timeout.
+- aiosqlite connection with WAL, foreign keys, busy timeout and a PRAGMA tuning
+  profile (durable / balanced / throughput).
 - Simple in-code migrations table with versioning.
 - Minimal repository-style methods used by Telegram handlers.
+- BatchedWriter coalescing concurrent writes into single transactions.
+- ShardedBotDatabase spreading users over N files routed by Telegram id, with a
+  small metadata database allocating globally unique user ids.
+- migrate_database() applying the schema in a start-up thread, ahead of the bot.
 
 NOTE: Keep comments and identifiers in English only.
 """
 
 import aiosqlite
+import asyncio
+import itertools
+import json
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Sequence, Tuple, Callable, Awaitable, AsyncIterator
 import datetime as dt
 
 
@@ -28,6 +38,116 @@ _ALLOWED_SETTINGS_KEYS = {
     "last_category",
 }
 
+# Connection PRAGMAs per database.tuning_profile, applied in this order
+TUNING_PROFILES: Dict[str, Dict[str, Any]] = {
+    # fsync on every commit: nothing committed is lost on power failure
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+        "cache_size": -8000,
+        "temp_store": "DEFAULT",
+        "mmap_size": 0,
+        "wal_autocheckpoint": 1000,
+    },
+    # fsync at checkpoints only: power failure may drop the last commits, never corrupts
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -16000,
+        "temp_store": "MEMORY",
+        "mmap_size": 64 * 1024 * 1024,
+        "wal_autocheckpoint": 1000,
+    },
+    # balanced durability with larger caches and less frequent checkpoints
+    "throughput": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -64000,
+        "temp_store": "MEMORY",
+        "mmap_size": 256 * 1024 * 1024,
+        "wal_autocheckpoint": 10000,
+    },
+}
+
+
+def tuning_pragmas(profile: str = "balanced", overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Return the PRAGMAs of a tuning profile with per-PRAGMA overrides applied."""
+    if profile not in TUNING_PROFILES:
+        raise ValueError(
+            f"Unknown database tuning profile '{profile}'; choose one of {', '.join(TUNING_PROFILES)}"
+        )
+    pragmas = dict(TUNING_PROFILES[profile])
+    for name, value in (overrides or {}).items():
+        # Names and values end up in SQL text; only known tunables are accepted
+        if name not in pragmas or not str(value).lstrip("-").isalnum():
+            raise ValueError(f"Unsupported database PRAGMA override {name}={value!r}")
+        pragmas[name] = value
+    return pragmas
+
+
+async def _apply_pragmas(conn: aiosqlite.Connection, pragmas: Dict[str, Any]) -> None:
+    for name, value in pragmas.items():
+        await conn.execute(f"PRAGMA {name}={value}")
+
+
+class BatchedWriter:
+    """Queue of write statements flushed together in one transaction.
+
+    Writes submitted in the same event-loop tick (e.g. many coroutines gathered
+    by the persistence layer) share a single commit; consecutive statements with
+    the same SQL are sent with executemany. A batch holds `lock`, the write lock
+    of the connection, from its first statement to its commit or rollback.
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, lock: asyncio.Lock,
+                 max_batch: int = 1000) -> None:
+        self.conn = conn
+        self.lock = lock
+        self.max_batch = max_batch
+        self._queue: List[Tuple[str, Sequence[Any], asyncio.Future]] = []
+        self._drain_task: Optional[asyncio.Task] = None
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> None:
+        """Queue a statement and wait until its batch is committed."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((sql, params, future))
+        if self._drain_task is None:
+            self._drain_task = loop.create_task(self._drain())
+        await future
+
+    async def flush(self) -> None:
+        """Wait until every queued statement has been written."""
+        while self._drain_task is not None:
+            await asyncio.shield(self._drain_task)
+
+    async def _drain(self) -> None:
+        # Let every coroutine scheduled in this tick enqueue before writing
+        await asyncio.sleep(0)
+        try:
+            while self._queue:
+                batch = self._queue[:self.max_batch]
+                del self._queue[:self.max_batch]
+                async with self.lock:
+                    try:
+                        for sql, group in itertools.groupby(batch, key=lambda item: item[0]):
+                            await self.conn.executemany(sql, [params for _, params, _ in group])
+                        await self.conn.commit()
+                    except Exception as e:
+                        await self.conn.rollback()
+                        for _, _, future in batch:
+                            if not future.done():
+                                future.set_exception(e)
+                        continue
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+        finally:
+            self._drain_task = None
+
 
 class BotDatabase:
     def __init__(
@@ -35,33 +155,74 @@ class BotDatabase:
         db_path: str = "data/db/qbb.db",
         success_rate: int = 80,
         default_settings: Optional[Dict[str, Any]] = None,
+        user_id_allocator: Optional[Callable[[int], Awaitable[int]]] = None,
+        pragmas: Optional[Dict[str, Any]] = None,
     ) -> None:
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         self.conn: Optional[aiosqlite.Connection] = None
+        self.writer: Optional[BatchedWriter] = None
+        # Held by every write transaction on self.conn, so none commits or rolls back another
+        self._write_lock = asyncio.Lock()
         self.success_rate = int(success_rate)
         self.default_settings = default_settings or {}
+        # Shards get user ids from the metadata database instead of AUTOINCREMENT
+        self.user_id_allocator = user_id_allocator
+        self.pragmas = pragmas or tuning_pragmas()
 
     async def init(self) -> None:
         """Initialize database and run migrations."""
+        if self.conn is not None:
+            return
         # Use a small timeout and busy_timeout to reduce 'database is locked' errors
         self.conn = await aiosqlite.connect(self.db_path.as_posix(), timeout=5)
         self.conn.row_factory = aiosqlite.Row
 
-        # Pragmas for better reliability
-        await self.conn.execute("PRAGMA journal_mode=WAL")
+        # Pragmas for reliability, then the configured tuning profile
         await self.conn.execute("PRAGMA foreign_keys=ON")
-        await self.conn.execute("PRAGMA busy_timeout=5000")
-        await self.conn.execute("PRAGMA synchronous=NORMAL")
+        await _apply_pragmas(self.conn, self.pragmas)
         await self.conn.commit()
 
         await self._run_migrations()
+        # Recommended for long-lived connections: analyze what needs it, bounded in time
+        await self.conn.execute("PRAGMA optimize=0x10002")
+        self.writer = BatchedWriter(self.conn, self._write_lock)
 
     async def close(self) -> None:
         if self.conn:
+            if self.writer:
+                await self.writer.flush()
+                self.writer = None
             await self.conn.close()
             self.conn = None
 
+    async def flush(self) -> None:
+        """Wait until every batched write has been committed."""
+        if self.writer:
+            await self.writer.flush()
+
+    def data_paths(self, include_meta: bool = False) -> List[Path]:
+        """Return the database files (there is no metadata file without sharding)."""
+        return [self.db_path]
+
+    async def optimize(self) -> None:
+        """Run PRAGMA optimize, refreshing planner statistics this connection's queries need."""
+        assert self.conn is not None
+        async with self._write_lock:
+            await self.conn.execute("PRAGMA optimize")
+
+    @asynccontextmanager
+    async def _transaction(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Hold the write lock for one transaction: commit on success, roll back on error."""
+        assert self.conn is not None
+        async with self._write_lock:
+            try:
+                yield self.conn
+            except BaseException:
+                await self.conn.rollback()
+                raise
+            await self.conn.commit()
+
     async def _run_migrations(self) -> None:
         assert self.conn is not None
         # Migrations table
@@ -83,13 +244,18 @@ class BotDatabase:
         # Available migrations
         migrations = {
             1: self._migration_001_init,
+            2: self._migration_002_quiz_sessions,
+            3: self._migration_003_attempt_retention,
+            4: self._migration_004_drop_duplicate_index,
+            5: self._migration_005_session_poll,
         }
 
         for version, mig in sorted(migrations.items()):
             if version > current:
                 await mig()
+                # Cluster workers may migrate concurrently; migrations are idempotent
                 await self.conn.execute(
-                    "INSERT INTO migrations (version) VALUES (?)", (version,)
+                    "INSERT OR IGNORE INTO migrations (version) VALUES (?)", (version,)
                 )
                 await self.conn.commit()
 
@@ -143,6 +309,86 @@ class BotDatabase:
         )
         await self.conn.commit()
 
+    async def _migration_002_quiz_sessions(self) -> None:
+        assert self.conn is not None
+        await self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS quiz_sessions (
+                telegram_id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                chat_id INTEGER,
+                category TEXT,
+                quiz_name TEXT,
+                question_ids TEXT NOT NULL,
+                current_index INTEGER NOT NULL DEFAULT 0,
+                correct_count INTEGER NOT NULL DEFAULT 0,
+                quiz_nonce TEXT,
+                started_at TIMESTAMP,
+                deadline REAL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            """
+        )
+        await self.conn.commit()
+
+    async def _migration_003_attempt_retention(self) -> None:
+        assert self.conn is not None
+        await self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS quiz_attempt_rollups (
+                user_id INTEGER NOT NULL,
+                category TEXT NOT NULL DEFAULT '',
+                quiz_name TEXT NOT NULL DEFAULT '',
+                month TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                passed_count INTEGER NOT NULL,
+                correct_count INTEGER NOT NULL,
+                total_questions INTEGER NOT NULL,
+                success_rate_sum REAL NOT NULL,
+                duration_seconds INTEGER NOT NULL,
+                PRIMARY KEY (user_id, category, quiz_name, month),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            );
+
+            CREATE INDEX IF NOT EXISTS ix_quiz_attempts_finished ON quiz_attempts(finished_at);
+            """
+        )
+        await self.conn.commit()
+        if await self._auto_vacuum() != 2:
+            # Switching an existing file to incremental auto_vacuum takes a one-off VACUUM
+            await self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            try:
+                await self.conn.execute("VACUUM")
+            except aiosqlite.OperationalError:
+                # Another cluster worker may be running the same VACUUM
+                if await self._auto_vacuum() != 2:
+                    raise
+
+    async def _migration_004_drop_duplicate_index(self) -> None:
+        assert self.conn is not None
+        # users.telegram_id is UNIQUE, which already comes with an index
+        await self.conn.execute("DROP INDEX IF EXISTS ix_users_telegram_id")
+        await self.conn.commit()
+
+    async def _migration_005_session_poll(self) -> None:
+        assert self.conn is not None
+        # The open quiz poll lets answers be graded after a restart
+        cur = await self.conn.execute("PRAGMA table_info(quiz_sessions)")
+        columns = {row[1] for row in await cur.fetchall()}
+        if "poll_id" not in columns:
+            await self.conn.execute("ALTER TABLE quiz_sessions ADD COLUMN poll_id TEXT")
+        if "poll_correct_option_id" not in columns:
+            await self.conn.execute(
+                "ALTER TABLE quiz_sessions ADD COLUMN poll_correct_option_id INTEGER"
+            )
+        await self.conn.commit()
+
+    async def _auto_vacuum(self) -> int:
+        assert self.conn is not None
+        cur = await self.conn.execute("PRAGMA auto_vacuum")
+        row = await cur.fetchone()
+        return int(row[0])
+
     # Utilities
     @staticmethod
     def _to_bool_int(val: Any) -> int:
@@ -163,11 +409,11 @@ class BotDatabase:
         row = await cur.fetchone()
         if row:
             user_id = int(row[0])
-            await self.conn.execute(
-                "UPDATE users SET updated_at = CURRENT_TIMESTAMP, last_seen_at = ? WHERE id = ?",
-                (self._now_utc(), user_id),
-            )
-            await self.conn.commit()
+            async with self._transaction() as conn:
+                await conn.execute(
+                    "UPDATE users SET updated_at = CURRENT_TIMESTAMP, last_seen_at = ? WHERE id = ?",
+                    (self._now_utc(), user_id),
+                )
             return user_id
 
         # Determine initial language
@@ -175,38 +421,41 @@ class BotDatabase:
         if lang == "uk":  # normalize
             lang = "ua"
 
-        cur = await self.conn.execute(
-            """
-            INSERT INTO users(telegram_id, username, first_name, last_name, language, last_seen_at)
-            VALUES(?, ?, ?, ?, ?, ?)
-            """,
-            (
-                tg_user.id,
-                getattr(tg_user, "username", None),
-                getattr(tg_user, "first_name", None),
-                getattr(tg_user, "last_name", None),
-                lang,
-                self._now_utc(),
-            ),
-        )
-        await self.conn.commit()
-        user_id = int(cur.lastrowid)
-
-        # Create default settings based on defaults passed in constructor
-        await self.conn.execute(
-            """
-            INSERT INTO user_settings(user_id, questions_count, timer_enabled, timer_limit, questions_random_enabled)
-            VALUES(?, ?, ?, ?, ?)
-            """,
-            (
-                user_id,
-                int(self.default_settings.get("questions_count", 5)),
-                self._to_bool_int(self.default_settings.get("timer_enabled", True)),
-                int(self.default_settings.get("timer_limit", 5)),
-                self._to_bool_int(self.default_settings.get("questions_random_enabled", True)),
-            ),
-        )
-        await self.conn.commit()
+        # NULL lets SQLite assign the next AUTOINCREMENT id
+        allocated = await self.user_id_allocator(tg_user.id) if self.user_id_allocator else None
+        # The user and their default settings are committed together
+        async with self._transaction() as conn:
+            cur = await conn.execute(
+                """
+                INSERT INTO users(id, telegram_id, username, first_name, last_name, language, last_seen_at)
+                VALUES(?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    allocated,
+                    tg_user.id,
+                    getattr(tg_user, "username", None),
+                    getattr(tg_user, "first_name", None),
+                    getattr(tg_user, "last_name", None),
+                    lang,
+                    self._now_utc(),
+                ),
+            )
+            user_id = int(cur.lastrowid)
+
+            # Create default settings based on defaults passed in constructor
+            await conn.execute(
+                """
+                INSERT INTO user_settings(user_id, questions_count, timer_enabled, timer_limit, questions_random_enabled)
+                VALUES(?, ?, ?, ?, ?)
+                """,
+                (
+                    user_id,
+                    int(self.default_settings.get("questions_count", 5)),
+                    self._to_bool_int(self.default_settings.get("timer_enabled", True)),
+                    int(self.default_settings.get("timer_limit", 5)),
+                    self._to_bool_int(self.default_settings.get("questions_random_enabled", True)),
+                ),
+            )
         return user_id
 
     async def get_user_language(self, user_id: int) -> str:
@@ -216,12 +465,11 @@ class BotDatabase:
         return (row[0] if row and row[0] else "en")
 
     async def update_user_language(self, user_id: int, language: str) -> None:
-        assert self.conn is not None
-        await self.conn.execute(
-            "UPDATE users SET language = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-            (language, user_id),
-        )
-        await self.conn.commit()
+        async with self._transaction() as conn:
+            await conn.execute(
+                "UPDATE users SET language = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (language, user_id),
+            )
 
     # Settings
     async def get_user_settings(self, user_id: int) -> Dict[str, Any]:
@@ -256,11 +504,11 @@ class BotDatabase:
         values = list(updates.values())
         values.append(user_id)
 
-        await self.conn.execute(
-            f"UPDATE user_settings SET {', '.join(set_parts)}, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?",
-            values,
-        )
-        await self.conn.commit()
+        async with self._transaction() as conn:
+            await conn.execute(
+                f"UPDATE user_settings SET {', '.join(set_parts)}, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?",
+                values,
+            )
 
     # Stats
     async def save_quiz_attempt(
@@ -289,41 +537,403 @@ class BotDatabase:
         rate = (correct_count / total_questions * 100.0) if total_questions > 0 else 0.0
         passed = 1 if rate >= float(self.success_rate) else 0
 
-        await self.conn.execute(
-            """
-            INSERT INTO quiz_attempts(user_id, category, quiz_name, total_questions, correct_count, success_rate, passed, started_at, finished_at, duration_seconds)
-            VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                user_id,
-                category,
-                quiz_name,
-                int(total_questions),
-                int(correct_count),
-                float(rate),
-                int(passed),
-                start,
-                finished,
-                int(duration),
-            ),
-        )
-        await self.conn.commit()
+        async with self._transaction() as conn:
+            await conn.execute(
+                """
+                INSERT INTO quiz_attempts(user_id, category, quiz_name, total_questions, correct_count, success_rate, passed, started_at, finished_at, duration_seconds)
+                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    user_id,
+                    category,
+                    quiz_name,
+                    int(total_questions),
+                    int(correct_count),
+                    float(rate),
+                    int(passed),
+                    start,
+                    finished,
+                    int(duration),
+                ),
+            )
 
     async def get_user_stats(self, user_id: int) -> Dict[str, Any]:
         assert self.conn is not None
+        # Attempts past the retention period only exist as monthly rollups
         cur = await self.conn.execute(
             """
-            SELECT 
-                COUNT(*) as total_attempts,
-                SUM(CASE WHEN passed = 1 THEN 1 ELSE 0 END) as passed_count,
-                AVG(success_rate) as avg_success_rate
-            FROM quiz_attempts WHERE user_id = ?
+            SELECT SUM(attempts), SUM(passed_count), SUM(success_rate_sum) FROM (
+                SELECT
+                    COUNT(*) as attempts,
+                    SUM(CASE WHEN passed = 1 THEN 1 ELSE 0 END) as passed_count,
+                    SUM(success_rate) as success_rate_sum
+                FROM quiz_attempts WHERE user_id = ?
+                UNION ALL
+                SELECT SUM(attempts), SUM(passed_count), SUM(success_rate_sum)
+                FROM quiz_attempt_rollups WHERE user_id = ?
+            )
             """,
-            (user_id,),
+            (user_id, user_id),
         )
         row = await cur.fetchone()
+        total = int(row[0] or 0)
         return {
-            "total_attempts": int(row[0] or 0),
+            "total_attempts": total,
             "passed_count": int(row[1] or 0),
-            "avg_success_rate": round(float(row[2] or 0.0), 2),
+            "avg_success_rate": round(float(row[2] or 0.0) / total, 2) if total else 0.0,
         }
+
+    async def get_attempt_history(
+        self,
+        user_id: int,
+        limit: int = 5,
+        cursor: Optional[Tuple[str, int]] = None,
+        newer: bool = False,
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """Return one page of a user's attempts, newest first, and whether more exist.
+
+        Keyset pagination on (finished_at DESC, id), the order of ix_quiz_attempts_user
+        (which ends in the rowid): every page is an index seek plus `limit` steps,
+        however deep it is. `cursor` is the (finished_at, id) of the row next to the
+        page; the page holds the attempts after it, or before it when `newer` is set.
+        The flag tells whether further attempts exist beyond the page in that direction.
+        """
+        assert self.conn is not None
+        columns = "id, category, quiz_name, total_questions, correct_count, success_rate, passed, finished_at"
+        order = "finished_at, id DESC" if newer else "finished_at DESC, id"
+        if cursor is None:
+            where, params = "user_id = ?", (user_id,)
+        elif newer:
+            where = "user_id = ? AND finished_at >= ? AND (finished_at > ? OR id < ?)"
+            params = (user_id, cursor[0], cursor[0], cursor[1])
+        else:
+            where = "user_id = ? AND finished_at <= ? AND (finished_at < ? OR id > ?)"
+            params = (user_id, cursor[0], cursor[0], cursor[1])
+        cur = await self.conn.execute(
+            f"SELECT {columns} FROM quiz_attempts WHERE {where} ORDER BY {order} LIMIT ?",
+            (*params, int(limit) + 1),
+        )
+        rows = await cur.fetchall()
+        keys = [c.strip() for c in columns.split(",")]
+        page = [dict(zip(keys, row)) for row in rows[:limit]]
+        if newer:
+            page.reverse()
+        return page, len(rows) > limit
+
+    # In-flight quiz sessions
+    async def upsert_quiz_session(self, telegram_id: int, session: Dict[str, Any]) -> None:
+        """Insert or update one running quiz session through the batched writer."""
+        assert self.writer is not None
+        await self.writer.execute(
+            """
+            INSERT INTO quiz_sessions(telegram_id, user_id, chat_id, category, quiz_name, question_ids,
+                                      current_index, correct_count, quiz_nonce, started_at, deadline,
+                                      poll_id, poll_correct_option_id)
+            VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(telegram_id) DO UPDATE SET
+                user_id = excluded.user_id,
+                chat_id = excluded.chat_id,
+                category = excluded.category,
+                quiz_name = excluded.quiz_name,
+                question_ids = excluded.question_ids,
+                current_index = excluded.current_index,
+                correct_count = excluded.correct_count,
+                quiz_nonce = excluded.quiz_nonce,
+                started_at = excluded.started_at,
+                deadline = excluded.deadline,
+                poll_id = excluded.poll_id,
+                poll_correct_option_id = excluded.poll_correct_option_id,
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            (
+                telegram_id,
+                session.get("user_id"),
+                session.get("chat_id"),
+                session.get("category"),
+                session.get("quiz_name"),
+                json.dumps(session["question_ids"], separators=(",", ":")),
+                int(session.get("current_index", 0)),
+                int(session.get("correct_count", 0)),
+                session.get("quiz_nonce"),
+                session.get("started_at"),
+                session.get("deadline"),
+                session.get("poll_id"),
+                session.get("poll_correct_option_id"),
+            ),
+        )
+
+    async def delete_quiz_session(self, telegram_id: int) -> None:
+        """Remove a finished or abandoned quiz session through the batched writer."""
+        assert self.writer is not None
+        await self.writer.execute("DELETE FROM quiz_sessions WHERE telegram_id = ?", (telegram_id,))
+
+    async def load_quiz_sessions(self) -> Dict[int, Dict[str, Any]]:
+        """Return all persisted quiz sessions keyed by Telegram user id."""
+        assert self.conn is not None
+        cur = await self.conn.execute(
+            """
+            SELECT telegram_id, user_id, chat_id, category, quiz_name, question_ids,
+                   current_index, correct_count, quiz_nonce, started_at, deadline,
+                   poll_id, poll_correct_option_id
+            FROM quiz_sessions
+            """
+        )
+        sessions = {}
+        for row in await cur.fetchall():
+            sessions[int(row[0])] = {
+                "user_id": row[1],
+                "chat_id": row[2],
+                "category": row[3],
+                "quiz_name": row[4],
+                "question_ids": json.loads(row[5]),
+                "current_index": int(row[6]),
+                "correct_count": int(row[7]),
+                "quiz_nonce": row[8],
+                "started_at": row[9],
+                "deadline": row[10],
+                "poll_id": row[11],
+                "poll_correct_option_id": row[12],
+            }
+        return sessions
+
+
+def shard_index(telegram_id: int, shards: int) -> int:
+    """Return the shard holding a Telegram user; matches cluster worker routing."""
+    return telegram_id % shards if shards > 1 else 0
+
+
+def shard_layout_paths(db_path: str, shards: int) -> Tuple[Optional[Path], List[Path]]:
+    """Return (metadata path, shard paths) for a layout; one shard uses db_path alone."""
+    path = Path(db_path)
+    if shards <= 1:
+        return None, [path]
+    meta = path.with_name(f"{path.stem}.meta{path.suffix}")
+    return meta, [path.with_name(f"{path.stem}.shard{i}{path.suffix}") for i in range(shards)]
+
+
+class ShardedBotDatabase:
+    """BotDatabase API over N shard files.
+
+    Users, settings, attempts and sessions live in the shard picked by the
+    Telegram id. A metadata database records the layout and hands out user ids,
+    so internal ids stay unique across shards and methods taking a user_id can
+    find the shard without signature changes.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "data/db/qbb.db",
+        shards: int = 2,
+        success_rate: int = 80,
+        default_settings: Optional[Dict[str, Any]] = None,
+        user_cache_size: int = 100000,
+        pragmas: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.db_path = Path(db_path)
+        self.shard_count = int(shards)
+        self.pragmas = pragmas or tuning_pragmas()
+        meta_path, shard_paths = shard_layout_paths(db_path, self.shard_count)
+        self.meta_path = meta_path
+        self.meta_path.parent.mkdir(parents=True, exist_ok=True)
+        self.meta: Optional[aiosqlite.Connection] = None
+        self.success_rate = int(success_rate)
+        self.default_settings = default_settings or {}
+        self.shards = [
+            BotDatabase(str(path), success_rate, default_settings, self._allocate_user_id,
+                        pragmas=self.pragmas)
+            for path in shard_paths
+        ]
+        # Bounded user_id -> shard cache; misses are resolved from the directory
+        self._user_shards: "OrderedDict[int, int]" = OrderedDict()
+        self._user_cache_size = user_cache_size
+
+    async def init(self) -> None:
+        """Open the metadata database, check the layout and migrate shards in parallel."""
+        if self.meta is not None:
+            return
+        self.meta = await aiosqlite.connect(self.meta_path.as_posix(), timeout=5)
+        await _apply_pragmas(self.meta, self.pragmas)
+        await self.meta.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS layout (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS user_directory (
+                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                telegram_id INTEGER UNIQUE NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            """
+        )
+        await self.meta.commit()
+        try:
+            await self._check_layout()
+            await asyncio.gather(*(shard.init() for shard in self.shards))
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _check_layout(self) -> None:
+        assert self.meta is not None
+        cur = await self.meta.execute("SELECT value FROM layout WHERE key = 'shards'")
+        row = await cur.fetchone()
+        if row is None:
+            if self.db_path.exists() and self.db_path.stat().st_size > 0:
+                raise RuntimeError(
+                    f"{self.db_path} holds unsharded data; run "
+                    f"'python -m utils.reshard --shards {self.shard_count}' first"
+                )
+            # Cluster workers may create the layout concurrently; first one wins
+            await self.meta.execute(
+                "INSERT OR IGNORE INTO layout (key, value) VALUES ('shards', ?)",
+                (str(self.shard_count),),
+            )
+            await self.meta.commit()
+            cur = await self.meta.execute("SELECT value FROM layout WHERE key = 'shards'")
+            row = await cur.fetchone()
+        if int(row[0]) != self.shard_count:
+            raise RuntimeError(
+                f"{self.meta_path} describes {row[0]} shards but {self.shard_count} are "
+                f"configured; run 'python -m utils.reshard --shards {self.shard_count}'"
+            )
+
+    async def close(self) -> None:
+        await asyncio.gather(*(shard.close() for shard in self.shards))
+        if self.meta:
+            await self.meta.close()
+            self.meta = None
+
+    async def flush(self) -> None:
+        """Wait until every shard's batched writes have been committed."""
+        await asyncio.gather(*(shard.flush() for shard in self.shards))
+
+    def data_paths(self, include_meta: bool = False) -> List[Path]:
+        """Return the shard files holding user data, optionally with the metadata file."""
+        return ([self.meta_path] if include_meta else []) + [shard.db_path for shard in self.shards]
+
+    async def optimize(self) -> None:
+        """Run PRAGMA optimize on every shard and the metadata database."""
+        assert self.meta is not None
+        await asyncio.gather(*(shard.optimize() for shard in self.shards))
+        await self.meta.execute("PRAGMA optimize")
+
+    # Routing
+    def _remember(self, user_id: int, index: int) -> None:
+        self._user_shards[user_id] = index
+        self._user_shards.move_to_end(user_id)
+        if len(self._user_shards) > self._user_cache_size:
+            self._user_shards.popitem(last=False)
+
+    async def _allocate_user_id(self, telegram_id: int) -> int:
+        assert self.meta is not None
+        await self.meta.execute(
+            "INSERT OR IGNORE INTO user_directory (telegram_id) VALUES (?)", (telegram_id,)
+        )
+        await self.meta.commit()
+        cur = await self.meta.execute(
+            "SELECT user_id FROM user_directory WHERE telegram_id = ?", (telegram_id,)
+        )
+        row = await cur.fetchone()
+        return int(row[0])
+
+    async def _shard_for_user(self, user_id: int) -> BotDatabase:
+        index = self._user_shards.get(user_id)
+        if index is None:
+            assert self.meta is not None
+            cur = await self.meta.execute(
+                "SELECT telegram_id FROM user_directory WHERE user_id = ?", (user_id,)
+            )
+            row = await cur.fetchone()
+            # Unknown ids behave like a missing user on any shard
+            index = shard_index(int(row[0]), self.shard_count) if row else 0
+            if row:
+                self._remember(user_id, index)
+        else:
+            self._user_shards.move_to_end(user_id)
+        return self.shards[index]
+
+    def _shard_for_telegram(self, telegram_id: int) -> BotDatabase:
+        return self.shards[shard_index(telegram_id, self.shard_count)]
+
+    # Users
+    async def get_or_create_user(self, tg_user, default_language: str) -> int:
+        """Return internal user_id for given Telegram user, creating as needed."""
+        index = shard_index(tg_user.id, self.shard_count)
+        user_id = await self.shards[index].get_or_create_user(tg_user, default_language)
+        self._remember(user_id, index)
+        return user_id
+
+    async def get_user_language(self, user_id: int) -> str:
+        return await (await self._shard_for_user(user_id)).get_user_language(user_id)
+
+    async def update_user_language(self, user_id: int, language: str) -> None:
+        await (await self._shard_for_user(user_id)).update_user_language(user_id, language)
+
+    # Settings
+    async def get_user_settings(self, user_id: int) -> Dict[str, Any]:
+        return await (await self._shard_for_user(user_id)).get_user_settings(user_id)
+
+    async def update_user_settings(self, user_id: int, **kwargs: Any) -> None:
+        await (await self._shard_for_user(user_id)).update_user_settings(user_id, **kwargs)
+
+    # Stats
+    async def save_quiz_attempt(self, user_id: int, *args: Any, **kwargs: Any) -> None:
+        await (await self._shard_for_user(user_id)).save_quiz_attempt(user_id, *args, **kwargs)
+
+    async def get_user_stats(self, user_id: int) -> Dict[str, Any]:
+        return await (await self._shard_for_user(user_id)).get_user_stats(user_id)
+
+    async def get_attempt_history(
+        self, user_id: int, *args: Any, **kwargs: Any
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        return await (await self._shard_for_user(user_id)).get_attempt_history(user_id, *args, **kwargs)
+
+    # In-flight quiz sessions
+    async def upsert_quiz_session(self, telegram_id: int, session: Dict[str, Any]) -> None:
+        await self._shard_for_telegram(telegram_id).upsert_quiz_session(telegram_id, session)
+
+    async def delete_quiz_session(self, telegram_id: int) -> None:
+        await self._shard_for_telegram(telegram_id).delete_quiz_session(telegram_id)
+
+    async def load_quiz_sessions(self) -> Dict[int, Dict[str, Any]]:
+        """Return persisted quiz sessions of all shards keyed by Telegram user id."""
+        sessions: Dict[int, Dict[str, Any]] = {}
+        for part in await asyncio.gather(*(shard.load_quiz_sessions() for shard in self.shards)):
+            sessions.update(part)
+        return sessions
+
+
+def open_database(
+    db_path: str = "data/db/qbb.db",
+    shards: int = 1,
+    success_rate: int = 80,
+    default_settings: Optional[Dict[str, Any]] = None,
+    pragmas: Optional[Dict[str, Any]] = None,
+):
+    """Return a BotDatabase, or a ShardedBotDatabase when more than one shard is configured."""
+    if int(shards) > 1:
+        return ShardedBotDatabase(db_path, shards, success_rate, default_settings, pragmas=pragmas)
+    return BotDatabase(db_path, success_rate, default_settings, pragmas=pragmas)
+
+
+def migrate_database(
+    db_path: str = "data/db/qbb.db",
+    shards: int = 1,
+    pragmas: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Create or upgrade the schema on a connection of its own and close it.
+
+    Runs its own event loop, so start-up can migrate in a thread while the bot
+    is still being built; the bot's init() then finds the schema current.
+    """
+    db = open_database(db_path, shards, pragmas=pragmas)
+
+    async def _migrate() -> None:
+        try:
+            await db.init()
+        finally:
+            await db.close()
+
+    asyncio.run(_migrate())
@@ -10,16 +10,23 @@ This module provides the main application initializer. It handles loading
 configuration, setting up logging, proxy settings, localization, and
 necessary directories. It also includes functionality for watching
 configuration file changes and reloading the configuration dynamically.
+
+After the directories exist, the independent start-up stages run concurrently
+in threads: the proxy probe, loading every translation file, compiling the
+question store and migrating the database schema. Their timings are kept in a
+StartupProfile (utils/startup.py).
 """
 
 from pathlib import Path
-from typing import Tuple, Any, Dict, Optional
+from typing import Tuple, Any, Callable, Dict, Optional
 from utils.configs import ConfigLoader, ConfigFileHandler
+from utils.database import migrate_database, tuning_pragmas
 from utils.logger import LoggerFactory
 from utils.directories import initialize_directories
 from utils.proxy import ProxyHandler
 from utils.localization import Localization
-from watchdog.observers import Observer
+from utils.question_store import build_question_store
+from utils.startup import StartupProfile, run_concurrently
 import os
 
 
@@ -28,14 +35,27 @@ class Loader:
     Class to initialize the application by loading configuration, setting up logging, proxy, and directories.
     """
 
-    def __init__(self):
-        config_directory = Path(__file__).parent.parent / 'configs'
-        self.config_loader = ConfigLoader(config_directory)
-        self.config = self.config_loader.load_config()
-        self.environment = self.config['base_settings']['env']
-        self.logger = self.setup_logging()
-        self.proxy_handler = self.setup_proxy()
-        self.localization = Localization(self.config['telegram']['language'])
+    def __init__(self, config_directory: Optional[Path] = None,
+                 profile: Optional[StartupProfile] = None):
+        """
+        Loads the configuration and sets up logging.
+
+        Args:
+            config_directory (Optional[Path]): Directory holding config.yml;
+                the project's `configs` directory when None.
+            profile (Optional[StartupProfile]): Profile the start-up stages are
+                timed in; a new one starting now when None.
+        """
+        self.profile = profile or StartupProfile()
+        with self.profile.stage('config'):
+            config_directory = config_directory or Path(__file__).parent.parent / 'configs'
+            self.config_loader = ConfigLoader(config_directory)
+            self.config = self.config_loader.load_config()
+            self.environment = self.config['base_settings']['env']
+            self.logger = self.setup_logging()
+        # Set up by initialize()
+        self.proxy_handler: Optional[ProxyHandler] = None
+        self.localization: Optional[Localization] = None
         self.telegram_token = self.config['telegram']['token']
         self.telegram_chat_id = self.config['telegram']['chat_id']
         self.parse_mode = self.config['telegram'].get('parse_mode', 'HTML')
@@ -100,10 +120,53 @@ class Loader:
             self.logger.info("Proxy is disabled in configuration.")
             return None
 
+    def load_locales(self) -> Localization:
+        """
+        Load every translation file into the cache.
+
+        Returns:
+            Localization instance for the configured default language.
+        """
+        count = Localization.preload()
+        self.logger.debug(f"Loaded translations for {count} languages.")
+        return Localization(self.config['telegram']['language'])
+
+    def startup_stages(self, questions_directory: Optional[Path]) -> Dict[str, Callable[[], Any]]:
+        """
+        Returns the start-up stages that do not depend on each other.
+
+        Args:
+            questions_directory (Optional[Path]): Path to the questions directory.
+
+        Returns:
+            Stage name to callable, for run_concurrently().
+        """
+        stages: Dict[str, Callable[[], Any]] = {
+            'proxy': self.setup_proxy,
+            'locales': self.load_locales,
+        }
+        store_cfg = self.config.get('question_store', {})
+        if store_cfg.get('enabled', True) and questions_directory:
+            # Compiled once here; the bot (or every cluster worker) attaches to the file
+            stages['catalog'] = lambda: build_question_store(
+                questions_directory, store_cfg.get('cache_directory', 'data/cache'),
+                logger=self.logger)
+        db_cfg = self.config.get('database', {})
+        if db_cfg.get('db_enabled', True):
+            stages['migrations'] = lambda: migrate_database(
+                db_path=db_cfg.get('db_source', 'data/db/qbb.db'),
+                shards=db_cfg.get('shards', 1),
+                pragmas=tuning_pragmas(db_cfg.get('tuning_profile', 'balanced'),
+                                       db_cfg.get('pragmas')))
+        return stages
+
     def start_config_watcher(self) -> None:
         """
         Start the configuration file watcher if auto-reload is enabled in the configuration.
         """
+        # Imported on use: the watcher is off by default
+        from watchdog.observers import Observer
+
         event_handler = ConfigFileHandler(self.config_loader, self.on_config_change)
         self.config_observer = Observer()
         self.config_observer.schedule(event_handler,
@@ -138,19 +201,25 @@ class Loader:
         """
         Initialize the application by setting up directories, proxy, and other necessary components.
 
+        The proxy probe, translations, question store and database schema are
+        set up concurrently once the directories exist.
+
         Returns:
             A tuple containing the configuration, logger, proxy handler, localization, telegram token, telegram chat id, questions directory path, and parse mode.
         """
         self.logger.info(
             f"Starting app initialization for {self.environment} environment")
-        self.create_directories()
-        self.setup_proxy()
-        self.logger.info(
-            f"App initialization complete for {self.environment} environment")
+        with self.profile.stage('directories'):
+            self.create_directories()
         questions_directory = next(
             (Path(d) for d in self.config['directories_to_create'] if
              'questions' in d),
             None)
+        results = run_concurrently(self.startup_stages(questions_directory), self.profile)
+        self.proxy_handler = results['proxy']
+        self.localization = results['locales']
+        self.logger.info(
+            f"App initialization complete for {self.environment} environment")
         return self.config, self.logger, self.proxy_handler, self.localization, self.telegram_token, self.telegram_chat_id, questions_directory, self.parse_mode
 
 # Example usage
@@ -9,13 +9,26 @@ Description:
 This module provides a localization handler that manages the loading and
 retrieval of translated strings from YAML files. It allows for language-specific
 translation of strings, with support for dynamic formatting.
+
+Parsed translation files are cached per language: the per-user Localization
+built for every update shares them, and start-up preloads every language.
 """
 
+import threading
 import yaml
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Optional
 from dataclasses import dataclass
 from pathlib import Path
 
+LOCALES_DIRECTORY = Path('locales')
+
+# libyaml's parser when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Parsed translations per language, shared by every Localization instance
+_translations: Dict[str, Dict[str, str]] = {}
+_translations_lock = threading.Lock()
+
 
 @dataclass
 class Localization:
@@ -34,7 +47,8 @@ class Localization:
     @staticmethod
     def load_translations(language: str) -> Dict[str, str]:
         """
-        Load translations from a YAML file for the specified language.
+        Load translations from a YAML file for the specified language, once;
+        later calls return the cached dictionary, which must not be modified.
 
         Args:
             language (str): The language code for which to load translations.
@@ -46,14 +60,36 @@ class Localization:
             FileNotFoundError: If the translation file is not found.
             ValueError: If there is an error reading the translation file.
         """
-        path = Path(f'locales/{language}.yml')
+        translations = _translations.get(language)
+        if translations is not None:
+            return translations
+        path = LOCALES_DIRECTORY / f'{language}.yml'
         try:
             with path.open('r', encoding='utf-8') as file:
-                return yaml.safe_load(file)
+                translations = yaml.load(file, Loader=_YAML_LOADER)
         except FileNotFoundError:
             raise FileNotFoundError(f"Translation file for language '{language}' not found.")
         except yaml.YAMLError as e:
             raise ValueError(f"Error reading translation file for language '{language}': {e}")
+        with _translations_lock:
+            return _translations.setdefault(language, translations)
+
+    @staticmethod
+    def preload(languages: Optional[Iterable[str]] = None) -> int:
+        """
+        Load the translations of the given languages, or of every file in the
+        locales directory, into the cache.
+
+        Returns:
+            int: Number of languages loaded.
+        """
+        if languages is None:
+            languages = sorted(path.stem for path in LOCALES_DIRECTORY.glob('*.yml'))
+        count = 0
+        for language in languages:
+            Localization.load_translations(language)
+            count += 1
+        return count
 
     def get(self, key: str, **kwargs: Any) -> str:
         """
@@ -10,18 +10,38 @@ This module provides a logging factory that supports two logging frameworks:
 the standard Python logging module and the Loguru library. It allows for
 dynamic selection of the logging framework and configuration of logging levels,
 formats, and output destinations (console and file).
+
+With `log_async` the console (and, for the standard logger, the file) lines are
+serialized and written by a background thread, so a slow stderr consumer never
+blocks the event loop. EventLogger puts per-event sampling, rate limits and
+lazy formatting in front of the logger for messages emitted on hot paths.
 """
 
-from typing import Dict
+from typing import Any, Dict, Optional
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+import atexit
 import json
+import queue
+import random
 import sys
+import threading
+import time
 import logging
 from loguru import logger as loguru_logger
 from pathlib import Path
 
+# Keys of structured data bound to a record, copied into its JSON line
+STRUCTURED_KEYS = ("event", "fields", "trace")
+
+LEVELS = {"TRACE": 5, "DEBUG": 10, "INFO": 20, "SUCCESS": 25, "WARNING": 30,
+          "ERROR": 40, "CRITICAL": 50}
+
 
 class LoggerFactory:
     _logger = None
+    # Background writer of the logger (QueuedWriter or QueuedHandler), if log_async
+    writer = None
 
     @classmethod
     def get_logger(cls, config: Dict):
@@ -36,11 +56,203 @@ class LoggerFactory:
         # Determine which logging framework to use based on config
         log_framework = config.get('log_framework', 'loguru')
         if log_framework == 'default':
-            return StandardLogger(config).get_logger()
+            setup = StandardLogger(config)
         elif log_framework == 'loguru':
-            return LoguruLogger(config).get_logger()
+            setup = LoguruLogger(config)
         else:
             raise ValueError(f"Unsupported log framework: {log_framework}")
+        LoggerFactory.writer = setup.writer
+        return setup.get_logger()
+
+
+class QueuedWriter:
+    """
+    Stream-like Loguru sink handing records to a writer thread.
+
+    The calling thread only enqueues the record; serializing it and writing to
+    the stream happen on the writer thread, in batches. When the queue is full
+    the record is dropped and counted instead of blocking the caller.
+    """
+
+    _BATCH = 256
+
+    def __init__(self, stream, serialize, max_queue: int = 10000):
+        """
+        Args:
+            stream: Text stream written to (sys.stderr).
+            serialize (Callable): Turns a Loguru record into one JSON line.
+            max_queue (int): Records buffered before new ones are dropped.
+        """
+        self.stream = stream
+        self.serialize = serialize
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def write(self, message) -> None:
+        try:
+            self._queue.put_nowait(message.record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self._BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = [self.serialize(record) + "\n" for record in batch if record is not None]
+            try:
+                self.stream.write("".join(lines))
+                self.stream.flush()
+            except (OSError, ValueError):
+                pass
+            if None in batch:
+                return
+
+    def stop(self) -> None:
+        """
+        Writes out the queued records and ends the thread; called when the sink
+        is removed and at interpreter exit.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+
+class QueuedHandler(QueueHandler):
+    """
+    QueueHandler feeding the real handlers through a QueueListener thread.
+
+    Only the message is merged with its arguments in the calling thread; JSON
+    formatting and I/O happen on the listener thread. Records are dropped and
+    counted when the queue is full.
+    """
+
+    def __init__(self, handlers, max_queue: int = 10000):
+        super().__init__(queue.Queue(max_queue))
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        # logging.shutdown() closes handlers at exit, which drains the queue
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
+
+
+def log_structured(logger, level: str, message: str, depth: int = 0, **data) -> None:
+    """
+    Logs a message with structured data (see STRUCTURED_KEYS) attached to the
+    record, for either logging framework.
+
+    Args:
+        logger: Logger instance from LoggerFactory.
+        level (str): Level name, e.g. "INFO".
+        message (str): The message.
+        depth (int): Stack frames between the reported caller and this function.
+        **data: Structured values, serialized next to "msg" in the JSON line.
+    """
+    if isinstance(logger, type(loguru_logger)):
+        logger.opt(depth=depth + 1).bind(**data).log(level, message)
+    elif isinstance(logger, logging.Logger):
+        logger.log(LEVELS[level], message, extra=data, stacklevel=depth + 2)
+    else:
+        getattr(logger, level.lower())(message)
+
+
+class EventLogger:
+    """
+    Sampled, rate-limited emission of named log events.
+
+    Each event type has its own policy in the `events` section of the logging
+    config: `sample_rate` (fraction of events logged) and `rate_limit` (events
+    per second, with a burst of the same size; 0 for no limit). Checks happen
+    before any message is built: the message is a str.format template filled
+    with the event's fields only when the event is actually logged. Events
+    held back by the rate limit are reported in the `suppressed` field of the
+    next one logged.
+    """
+
+    def __init__(self, logger, config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            logger: Logger instance from LoggerFactory.
+            config (Optional[Dict[str, Any]]): The `logging` config section.
+        """
+        config = config or {}
+        self.logger = logger
+        self.min_level = LEVELS.get(str(config.get("log_level", "DEBUG")).upper(), 0)
+        self.policies: Dict[str, Dict[str, float]] = {
+            name: {"sample_rate": float(policy.get("sample_rate", 1.0)),
+                   "rate_limit": float(policy.get("rate_limit", 0))}
+            for name, policy in (config.get("events") or {}).items()
+        }
+        # Per event: [tokens, last refill, suppressed since the last logged one]
+        self._buckets: Dict[str, list] = {}
+        self.dropped = Counter()
+
+    def enabled(self, event: str, level: str = "INFO") -> bool:
+        """
+        Decides whether the next `event` is logged, taking a rate-limit token.
+        """
+        if LEVELS[level] < self.min_level:
+            return False
+        policy = self.policies.get(event)
+        if policy is None:
+            return True
+        if policy["sample_rate"] < 1.0 and random.random() >= policy["sample_rate"]:
+            self.dropped[(event, "sampled")] += 1
+            return False
+        rate = policy["rate_limit"]
+        if rate > 0:
+            now = time.monotonic()
+            bucket = self._buckets.get(event)
+            if bucket is None:
+                bucket = self._buckets[event] = [rate, now, 0]
+            tokens = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                self.dropped[(event, "rate_limited")] += 1
+                return False
+            bucket[0] = tokens - 1
+        return True
+
+    def emit(self, event: str, message: str, level: str = "INFO", **fields) -> bool:
+        """
+        Logs one event if its level, sample and rate limit allow it.
+
+        Args:
+            event (str): Event type, the key of its policy.
+            message (str): str.format template, filled with `fields`.
+            level (str): Level name.
+            **fields: Values of the event, also serialized as "fields".
+
+        Returns:
+            bool: True if the event was logged.
+        """
+        if not self.enabled(event, level):
+            return False
+        bucket = self._buckets.get(event)
+        if bucket is not None and bucket[2]:
+            fields["suppressed"], bucket[2] = bucket[2], 0
+        log_structured(self.logger, level, message.format(**fields), depth=1,
+                       event=event, fields=fields)
+        return True
 
 
 class StandardLogger:
@@ -63,6 +275,11 @@ class StandardLogger:
                     "function": f"{record.funcName}: {record.lineno}",
                     "msg": record.getMessage()
                 }
+                # Structured data attached by log_structured()
+                for key in STRUCTURED_KEYS:
+                    value = getattr(record, key, None)
+                    if value is not None:
+                        log_record[key] = value
                 return json.dumps(log_record)
 
         log_level = self.config.get("log_level", "DEBUG").upper()
@@ -74,7 +291,7 @@ class StandardLogger:
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setFormatter(CustomFormatter())
         console_handler.setLevel(getattr(logging, log_level))
-        self.std_logger.addHandler(console_handler)
+        handlers = [console_handler]
 
         # Set up file handler if configured
         if self.config.get("log_to_file"):
@@ -84,7 +301,15 @@ class StandardLogger:
             file_handler = logging.FileHandler(file_name)
             file_handler.setFormatter(CustomFormatter())
             file_handler.setLevel(getattr(logging, log_level))
-            self.std_logger.addHandler(file_handler)
+            handlers.append(file_handler)
+
+        # Hand records to a listener thread, or write them in the calling thread
+        self.writer = None
+        if self.config.get("log_async", False):
+            self.writer = QueuedHandler(handlers, self.config.get("log_queue_size", 10000))
+            handlers = [self.writer]
+        for handler in handlers:
+            self.std_logger.addHandler(handler)
 
         # Log initialization message
         self.std_logger.info("Default logger started",
@@ -118,6 +343,10 @@ class LoguruLogger:
                 "function": function_name,
                 "msg": message
             }
+            # Structured data bound by log_structured()
+            for key in STRUCTURED_KEYS:
+                if key in record["extra"]:
+                    subset[key] = record["extra"][key]
             return json.dumps(subset)
 
         def patching(record):
@@ -128,8 +357,15 @@ class LoguruLogger:
         # Configure Loguru logger
         loguru_logger.remove()
         format_string = "{extra[serialized]}"
-        loguru_logger.add(sys.stderr, format=format_string, filter=patching,
-                          level=log_level)
+        self.writer = None
+        if self.logging_config.get("log_async", False):
+            # Serialized on the writer thread instead of in a filter
+            self.writer = QueuedWriter(sys.stderr, serialize,
+                                       self.logging_config.get("log_queue_size", 10000))
+            loguru_logger.add(self.writer, format="{message}", level=log_level)
+        else:
+            loguru_logger.add(sys.stderr, format=format_string, filter=patching,
+                              level=log_level)
 
         # Add file handler if configured
         if self.logging_config.get("log_to_file"):
@@ -0,0 +1,193 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: utils/loop_monitor.py
+
+Description:
+This module provides a watchdog for the asyncio event loop. A background
+coroutine sleeps `interval` seconds at a time and records how late it wakes up:
+that lag is the time every other coroutine also had to wait. Recent samples are
+kept for percentiles (exported as metrics).
+
+A synchronous call inside a coroutine (a JSON load, YAML parsing, a blocking
+HTTP request) freezes the loop, so the loop itself cannot report what it is
+stuck on. A helper thread therefore watches the coroutine's heartbeat; when the
+loop has not come back `threshold` seconds after it should have, the thread
+reads the loop thread's current stack (sys._current_frames) and logs it with
+the innermost frame of the bot's own code - the offending call.
+
+In debug mode asyncio's own slow-callback detection is enabled as well
+(loop.set_debug, slow_callback_duration = threshold) and its warnings are
+forwarded to the bot's logger.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils.logger import log_structured
+
+# Frames under this directory (and outside site-packages) are the bot's own code
+_PROJECT_ROOT = str(Path(__file__).resolve().parents[1])
+
+QUANTILES = (0.5, 0.9, 0.99, 1.0)
+
+
+class _ForwardHandler(logging.Handler):
+    """
+    Standard logging handler passing asyncio's warnings to the bot's logger.
+    """
+
+    def __init__(self, logger):
+        super().__init__(logging.WARNING)
+        self.logger = logger
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            log_structured(self.logger, record.levelname, record.getMessage(),
+                           event="slow_callback")
+        except Exception:
+            self.handleError(record)
+
+
+class LoopMonitor:
+    """
+    Measures event loop lag and logs the stack of the call blocking the loop.
+    """
+
+    def __init__(self, logger, interval: float = 0.1, threshold: float = 0.25,
+                 window: int = 600, debug: bool = False):
+        """
+        Args:
+            logger: Logger instance.
+            interval (float): Seconds between lag probes.
+            threshold (float): Lag in seconds at which the loop counts as
+                blocked and its stack is captured.
+            window (int): Number of recent samples kept for percentiles.
+            debug (bool): Enable asyncio debug mode and slow-callback warnings.
+        """
+        self.logger = logger
+        self.interval = interval
+        self.threshold = threshold
+        self.debug = debug
+        self.samples = deque(maxlen=window)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.last_stall: Optional[Dict] = None
+        self._heartbeat = 0.0
+        self._captured = 0.0
+        self._loop_thread: Optional[int] = None
+        self._stopped = threading.Event()
+
+    def quantiles(self) -> Dict[Tuple[str], float]:
+        """
+        Returns lag percentiles of the recent samples, keyed by quantile label.
+        """
+        samples = sorted(self.samples)
+        if not samples:
+            return {}
+        last = len(samples) - 1
+        return {(f"{q:g}", ): samples[min(last, int(q * len(samples)))] for q in QUANTILES}
+
+    def enable_debug(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Turns on asyncio debug mode and routes its warnings to the logger.
+        """
+        loop.set_debug(True)
+        loop.slow_callback_duration = self.threshold
+        asyncio_logger = logging.getLogger("asyncio")
+        asyncio_logger.addHandler(_ForwardHandler(self.logger))
+        asyncio_logger.propagate = False
+        self.logger.info(f"asyncio debug mode on, callbacks over "
+                         f"{self.threshold * 1000:.0f} ms are logged")
+
+    async def run(self) -> None:
+        """
+        Probes the loop until cancelled, with the watchdog thread alongside.
+        """
+        loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        if self.debug:
+            self.enable_debug(loop)
+        self._stopped.clear()
+        self._heartbeat = time.monotonic()
+        watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                self._heartbeat = time.monotonic()
+                expected = loop.time() + self.interval
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, loop.time() - expected)
+                self.samples.append(lag)
+                if lag > self.max_lag:
+                    self.max_lag = lag
+        finally:
+            self._stopped.set()
+            watchdog.join(timeout=1)
+
+    def _watch(self) -> None:
+        # Wakes twice per threshold; one capture per stall
+        period = self.threshold / 2
+        while not self._stopped.wait(period):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked >= self.threshold and self._captured != heartbeat:
+                self._captured = heartbeat
+                self._capture(blocked)
+
+    def _capture(self, blocked: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        del frame
+        culprit = self.offending_frame(stack)
+        self.stalls += 1
+        self.last_stall = {
+            'blocked_ms': round(blocked * 1000),
+            'frame': f"{culprit.filename}:{culprit.lineno} in {culprit.name}",
+            'stack': [f"{entry.filename}:{entry.lineno} in {entry.name}"
+                      for entry in stack[-20:]],
+        }
+        source = f": {culprit.line}" if culprit.line else ""
+        log_structured(self.logger, "WARNING",
+                       f"Event loop blocked for {blocked * 1000:.0f} ms at "
+                       f"{self.last_stall['frame']}{source}",
+                       event="loop_blocked", fields=self.last_stall)
+
+    @staticmethod
+    def offending_frame(stack: List[traceback.FrameSummary]) -> traceback.FrameSummary:
+        """
+        Returns the innermost frame of the bot's own code, or the innermost
+        frame if the stack has none (e.g. blocked inside a library callback).
+        """
+        for entry in reversed(stack):
+            if entry.filename.startswith(_PROJECT_ROOT) and 'site-packages' not in entry.filename:
+                return entry
+        return stack[-1]
+
+
+def loop_monitor_from_config(config: Dict, logger) -> Optional[LoopMonitor]:
+    """
+    Creates the monitor described by the `loop_monitor` config section.
+
+    Returns:
+        Optional[LoopMonitor]: The monitor, or None when disabled.
+    """
+    monitor_cfg = config.get('loop_monitor', {})
+    if not monitor_cfg.get('enabled', True):
+        return None
+    return LoopMonitor(logger,
+                       interval=float(monitor_cfg.get('interval', 0.1)),
+                       threshold=float(monitor_cfg.get('threshold', 0.25)),
+                       window=int(monitor_cfg.get('window', 600)),
+                       debug=bool(monitor_cfg.get('debug', False)))
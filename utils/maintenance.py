@@ -0,0 +1,231 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: utils/maintenance.py
+
+Description:
+This module provides the DatabaseMaintenance class, a background job that
+periodically:
+
+- rolls quiz attempts older than the retention period up into per-user,
+  per-quiz monthly summaries (quiz_attempt_rollups) and deletes them, a small
+  batch per transaction so bot writes are never held up for long. This is
+  opt-in (database.maintenance.retention_days, 0 by default): rolled-up
+  attempts still count in the statistics but no longer appear in /history;
+- returns free pages to the file system with PRAGMA incremental_vacuum;
+- runs PRAGMA optimize (refreshing query planner statistics where they went
+  stale) and a WAL checkpoint, so the WAL file does not keep growing between
+  automatic checkpoints.
+
+Retention batches, vacuum steps and checkpoints run in a worker thread on a
+connection of their own: each batch is one atomic transaction, and a checkpoint
+never collides with a write transaction open on the bot's connection.
+"""
+
+import asyncio
+import datetime as dt
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+CHECKPOINT_MODES = ("PASSIVE", "FULL", "RESTART", "TRUNCATE")
+
+_ROLL_UP = """
+    INSERT INTO quiz_attempt_rollups (user_id, category, quiz_name, month, attempts, passed_count,
+                                      correct_count, total_questions, success_rate_sum,
+                                      duration_seconds)
+    SELECT user_id, IFNULL(category, ''), IFNULL(quiz_name, ''), substr(finished_at, 1, 7),
+           COUNT(*), SUM(CASE WHEN passed = 1 THEN 1 ELSE 0 END), SUM(IFNULL(correct_count, 0)),
+           SUM(IFNULL(total_questions, 0)), SUM(IFNULL(success_rate, 0)),
+           SUM(IFNULL(duration_seconds, 0))
+    FROM quiz_attempts WHERE id IN (SELECT id FROM retention_batch)
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (user_id, category, quiz_name, month) DO UPDATE SET
+        attempts = attempts + excluded.attempts,
+        passed_count = passed_count + excluded.passed_count,
+        correct_count = correct_count + excluded.correct_count,
+        total_questions = total_questions + excluded.total_questions,
+        success_rate_sum = success_rate_sum + excluded.success_rate_sum,
+        duration_seconds = duration_seconds + excluded.duration_seconds
+"""
+
+
+def roll_up_attempts(conn: sqlite3.Connection, cutoff: str, batch_size: int) -> int:
+    """
+    Rolls up and deletes one batch of attempts finished before the cutoff.
+
+    Args:
+        conn (sqlite3.Connection): Connection in autocommit mode.
+        cutoff (str): ISO timestamp; older attempts are rolled up.
+        batch_size (int): Maximum attempts per transaction.
+
+    Returns:
+        int: Number of attempts rolled up.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS retention_batch (id INTEGER PRIMARY KEY)")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM retention_batch")
+        rows = conn.execute(
+            "INSERT INTO retention_batch (id) SELECT id FROM quiz_attempts "
+            "WHERE finished_at < ? ORDER BY finished_at LIMIT ?", (cutoff, batch_size)).rowcount
+        if rows:
+            conn.execute(_ROLL_UP)
+            conn.execute("DELETE FROM quiz_attempts WHERE id IN (SELECT id FROM retention_batch)")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+
+def incremental_vacuum(conn: sqlite3.Connection, pages: int) -> int:
+    """
+    Releases up to `pages` free pages of an auto_vacuum=INCREMENTAL database.
+
+    Returns:
+        int: Number of pages returned to the file system.
+    """
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if before:
+        # The pragma frees one page per step; execute() stops after the first one
+        # for column-less statements, executescript() steps to the end
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def wal_checkpoint(conn: sqlite3.Connection, mode: str) -> Tuple[int, int]:
+    """
+    Checkpoints the WAL of the connection's database.
+
+    Returns:
+        Tuple[int, int]: WAL frames and frames checkpointed.
+    """
+    _, frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    # -1 when the database is not in WAL mode
+    return max(frames, 0), max(checkpointed, 0)
+
+
+class DatabaseMaintenance:
+    """
+    Periodic retention, incremental vacuum, PRAGMA optimize and WAL checkpoint
+    for BotDatabase / ShardedBotDatabase.
+    """
+
+    def __init__(self, db, logger, interval: float = 3600, checkpoint: str = "PASSIVE",
+                 retention_days: float = 0, batch_size: int = 500, batch_pause: float = 0.05,
+                 vacuum_pages: int = 2000):
+        """
+        Initializes the job.
+
+        Args:
+            db: BotDatabase or ShardedBotDatabase.
+            logger: Logger instance.
+            interval (float): Seconds between runs.
+            checkpoint (str): wal_checkpoint mode; PASSIVE never waits for readers or writers.
+            retention_days (float): Days raw attempts are kept; 0 keeps them forever
+                and also disables the vacuum step.
+            batch_size (int): Attempts rolled up per transaction.
+            batch_pause (float): Seconds between retention batches.
+            vacuum_pages (int): Maximum pages released per file and run.
+        """
+        if checkpoint.upper() not in CHECKPOINT_MODES:
+            raise ValueError(f"Unknown WAL checkpoint mode '{checkpoint}'")
+        self.db = db
+        self.logger = logger
+        self.interval = interval
+        self.checkpoint = checkpoint.upper()
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.vacuum_pages = vacuum_pages
+        self.runs = 0
+        self.frames_checkpointed = 0
+        self.rows_rolled_up_total = 0
+        self.pages_freed_total = 0
+
+    def _connect(self, path: Path) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    async def apply_retention(self, now: Optional[dt.datetime] = None) -> Dict[str, int]:
+        """
+        Rolls up attempts past the retention period and vacuums the freed pages.
+
+        Args:
+            now (Optional[dt.datetime]): Current UTC time, defaults to now.
+
+        Returns:
+            Dict[str, int]: Attempts rolled up and pages freed.
+        """
+        now = now or dt.datetime.utcnow()
+        cutoff = (now - dt.timedelta(days=self.retention_days)).replace(
+            microsecond=0).isoformat() + "Z"
+        rolled = freed = 0
+        for path in self.db.data_paths():
+            conn = await asyncio.to_thread(self._connect, path)
+            try:
+                while True:
+                    rows = await asyncio.to_thread(roll_up_attempts, conn, cutoff,
+                                                   self.batch_size)
+                    rolled += rows
+                    if rows < self.batch_size:
+                        break
+                    await asyncio.sleep(self.batch_pause)
+                freed += await asyncio.to_thread(incremental_vacuum, conn, self.vacuum_pages)
+            finally:
+                await asyncio.to_thread(conn.close)
+        self.rows_rolled_up_total += rolled
+        self.pages_freed_total += freed
+        return {'rolled_up': rolled, 'pages_freed': freed}
+
+    async def run_once(self) -> Dict[str, Any]:
+        """
+        Runs retention (if enabled), then optimizes and checkpoints the database once.
+
+        Returns:
+            Dict[str, Any]: Attempts rolled up, pages freed, WAL frames, frames
+                checkpointed and seconds taken.
+        """
+        started = time.perf_counter()
+        result: Dict[str, Any] = {'rolled_up': 0, 'pages_freed': 0}
+        if self.retention_days > 0:
+            result.update(await self.apply_retention())
+        await self.db.optimize()
+        frames = checkpointed = 0
+        for path in self.db.data_paths(include_meta=True):
+            conn = await asyncio.to_thread(self._connect, path)
+            try:
+                wal, done = await asyncio.to_thread(wal_checkpoint, conn, self.checkpoint)
+            finally:
+                await asyncio.to_thread(conn.close)
+            frames += wal
+            checkpointed += done
+        self.runs += 1
+        self.frames_checkpointed += checkpointed
+        result.update({'wal_frames': frames, 'checkpointed': checkpointed,
+                       'seconds': time.perf_counter() - started})
+        return result
+
+    async def run(self) -> None:
+        """
+        Runs maintenance every interval until cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                result = await self.run_once()
+            except sqlite3.Error as e:
+                self.logger.error(f"Database maintenance failed: {e}")
+                continue
+            if result['rolled_up'] or result['pages_freed']:
+                self.logger.info(
+                    f"Attempt retention: rolled up {result['rolled_up']} attempts older than "
+                    f"{self.retention_days:g} days, freed {result['pages_freed']} pages")
+            self.logger.debug(
+                f"Database maintenance: checkpointed {result['checkpointed']}/"
+                f"{result['wal_frames']} WAL frames in {result['seconds'] * 1000:.0f} ms")
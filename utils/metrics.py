@@ -0,0 +1,489 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: utils/metrics.py
+
+Description:
+This module provides a small in-process metrics registry (counters, gauges and
+histograms) rendered in the Prometheus text exposition format, and an HTTP
+server exposing it on a local port (GET /metrics).
+
+Recording is meant to stay on in production: a histogram observation is a
+bisect over the bucket bounds and three additions on a per-label list, with no
+locks (everything runs on the event loop) and no allocation once a label
+combination has been seen. Gauges and counters owned by other components
+(task counts, session sweeper and database maintenance totals, ...) are read by
+callbacks only when /metrics is scraped.
+
+BotMetrics bundles the bot's own metrics; instrument_database() and
+InstrumentedRequest time every BotDatabase method and Bot API call.
+"""
+
+import asyncio
+import time
+from bisect import bisect_left
+from functools import wraps
+from inspect import iscoroutinefunction
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from telegram.request import BaseRequest
+
+from utils.logger import LoggerFactory
+
+# Seconds; handler, database and Bot API latencies all fall in this range
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base of all metric types: a name, help text and label names.
+
+    A metric either stores its own values or, when `collect` is given, asks the
+    callback for them at render time. The callback returns a number, or a
+    mapping of label value tuples to numbers.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 collect: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.collect = collect
+        self._values: Dict[Labels, float] = {}
+
+    def samples(self) -> Iterable[Tuple[str, Labels, str, float]]:
+        values = self._values
+        if self.collect is not None:
+            collected = self.collect()
+            values = collected if isinstance(collected, dict) else {(): collected}
+        for labels, value in values.items():
+            yield "", labels, "", value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_label_text(self.labels, labels, extra)} "
+                         f"{_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing total.
+    """
+
+    kind = "counter"
+
+    def inc(self, *labels: str, value: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + value
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down.
+    """
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values over fixed buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> per-bucket counts (last one is +Inf), then sum and count
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def snapshot(self, *labels: str) -> Optional[Tuple[List[int], float, int]]:
+        """
+        Returns the cumulative bucket counts, sum and count of one label set.
+        """
+        series = self._series.get(labels)
+        if series is None:
+            return None
+        cumulative, total = [], 0
+        for count in series[:-2]:
+            total += count
+            cumulative.append(total)
+        return cumulative, series[-2], int(series[-1])
+
+    def samples(self) -> Iterable[Tuple[str, Labels, str, float]]:
+        bounds = [_number(bound) for bound in self.buckets] + ["+Inf"]
+        for labels in list(self._series):
+            cumulative, total, count = self.snapshot(*labels)
+            for bound, value in zip(bounds, cumulative):
+                yield "_bucket", labels, f'le="{bound}"', value
+            yield "_sum", labels, "", total
+            yield "_count", labels, "", count
+
+
+class MetricsRegistry:
+    """
+    Named collection of metrics rendered together.
+    """
+
+    def __init__(self, prefix: str = ""):
+        """
+        Initializes an empty registry.
+
+        Args:
+            prefix (str): Prepended to every metric name, e.g. "qbb_".
+        """
+        self.prefix = prefix
+        self._metrics: Dict[str, Metric] = {}
+
+    def _add(self, metric: Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = (),
+                collect: Optional[Callable[[], Any]] = None) -> Counter:
+        return self._add(Counter(self.prefix + name, documentation, labels, collect))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = (),
+              collect: Optional[Callable[[], Any]] = None) -> Gauge:
+        return self._add(Gauge(self.prefix + name, documentation, labels, collect))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(self.prefix + name, documentation, labels, buckets))
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(self.prefix + name)
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text format (version 0.0.4).
+        """
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # One failing callback must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {type(e).__name__}")
+        return "\n".join(lines) + "\n"
+
+
+class BotMetrics:
+    """
+    The bot's metrics: update rate, handler, database and Bot API latency.
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        """
+        Registers the metrics every process records.
+
+        Args:
+            registry (Optional[MetricsRegistry]): Registry to use; a new one with
+                the "qbb_" prefix by default.
+        """
+        self.registry = registry or MetricsRegistry("qbb_")
+        self.updates = self.registry.counter(
+            "updates_total", "Updates received, by type.", ["type"])
+        self.handler_seconds = self.registry.histogram(
+            "handler_seconds", "Time spent handling an update, by command or callback route.",
+            ["route"])
+        self.handler_errors = self.registry.counter(
+            "handler_errors_total", "Updates whose handler raised, by route.", ["route"])
+        self.db_seconds = self.registry.histogram(
+            "db_call_seconds", "Duration of BotDatabase calls, by method.", ["method"])
+        self.db_errors = self.registry.counter(
+            "db_errors_total", "BotDatabase calls that raised, by method.", ["method"])
+        self.api_seconds = self.registry.histogram(
+            "telegram_api_seconds", "Duration of Bot API requests, by method.", ["method"])
+        self.api_errors = self.registry.counter(
+            "telegram_api_errors_total",
+            "Bot API requests that failed, by method and HTTP status (or 'network').",
+            ["method", "status"])
+
+    def watch(self, application, maintenance=None, backup=None) -> None:
+        """
+        Registers gauges and counters read from the application at scrape time.
+
+        Args:
+            application (Application): The Telegram application; its bot_data
+                holds the task supervisor, session sweeper, poll index,
+                question store and rejection counter.
+            maintenance (Optional[DatabaseMaintenance]): Maintenance job to export.
+            backup (Optional[DatabaseBackup]): Backup job to export.
+        """
+        bot_data = application.bot_data
+        sessions = application.user_data
+        register = self.registry
+
+        register.gauge("quiz_sessions_active", "Users with a quiz in progress.",
+                       collect=lambda: sum(1 for data in list(sessions.values())
+                                           if data.get('question_ids')))
+        register.gauge("sessions_loaded", "User sessions held in memory.",
+                       collect=lambda: len(sessions))
+        register.gauge("sessions_with_questions",
+                       "Sessions holding loaded questions (released when idle).",
+                       collect=lambda: sum(1 for data in list(sessions.values())
+                                           if 'quiz_data' in data))
+        register.gauge("background_tasks", "Live background tasks by kind (quiz_timer, ...).",
+                       ["kind"], collect=lambda: {(kind, ): count for kind, count
+                                                  in bot_data['tasks'].counts().items()})
+        register.counter("tasks_rejected_total", "Background tasks refused by a cap.",
+                         collect=lambda: bot_data['tasks'].rejected)
+        register.counter("updates_rejected_total", "Updates rejected by flood protection.",
+                         ["reason"], collect=lambda: {(reason, ): count for reason, count
+                                                      in bot_data['rejections'].items()})
+        register.gauge("poll_index_entries", "Sent quiz polls awaiting an answer.",
+                       collect=lambda: len(bot_data['poll_index']))
+        loop_monitor = bot_data.get('loop_monitor')
+        if loop_monitor:
+            register.gauge("event_loop_lag_seconds",
+                           "Event loop lag percentiles over the recent probes.", ["quantile"],
+                           collect=loop_monitor.quantiles)
+            register.gauge("event_loop_lag_max_seconds", "Largest event loop lag since start.",
+                           collect=lambda: loop_monitor.max_lag)
+            register.counter("event_loop_stalls_total",
+                             "Times the event loop was blocked past the threshold.",
+                             collect=lambda: loop_monitor.stalls)
+        events = bot_data.get('events')
+        if events:
+            register.counter("log_events_dropped_total",
+                             "Log events not written, by event and reason (sampled, rate_limited).",
+                             ["event", "reason"], collect=lambda: dict(events.dropped))
+        writer = LoggerFactory.writer
+        if writer:
+            register.counter("log_lines_dropped_total",
+                             "Log lines dropped because the writer thread fell behind.",
+                             collect=lambda: writer.dropped)
+        sweeper = bot_data.get('session_sweeper')
+        if sweeper:
+            register.counter("sessions_evicted_total", "Idle sessions stripped of questions.",
+                             collect=lambda: sweeper.evicted_total)
+            register.counter("session_bytes_reclaimed_total",
+                             "Estimated bytes released by idle session eviction.",
+                             collect=lambda: sweeper.bytes_reclaimed_total)
+        question_store = bot_data.get('question_store')
+        if question_store:
+            register.gauge("question_store_bytes", "Size of the attached question store file.",
+                           collect=lambda: question_store.current().path.stat().st_size)
+        if maintenance:
+            register.counter("db_maintenance_runs_total", "Database maintenance runs.",
+                             collect=lambda: maintenance.runs)
+            register.counter("db_attempts_rolled_up_total",
+                             "Quiz attempts rolled up by attempt retention.",
+                             collect=lambda: maintenance.rows_rolled_up_total)
+            register.counter("db_pages_freed_total", "Pages released by incremental vacuum.",
+                             collect=lambda: maintenance.pages_freed_total)
+            register.counter("db_wal_frames_checkpointed_total", "WAL frames checkpointed.",
+                             collect=lambda: maintenance.frames_checkpointed)
+        if backup:
+            register.counter("db_backups_total", "Database backup sets written.",
+                             collect=lambda: backup.backups_total)
+            register.counter("db_backup_failures_total", "Database backups that failed.",
+                             collect=lambda: backup.failures_total)
+            register.gauge("db_last_backup_timestamp_seconds",
+                           "Unix time of the last successful backup (0 if none yet).",
+                           collect=lambda: backup.last_backup_time)
+
+    async def count_update(self, update, context) -> None:
+        """
+        Counts an incoming update by its type; registered as a TypeHandler ahead
+        of flood protection, so rejected updates are counted too.
+        """
+        if update.callback_query:
+            kind = "callback_query"
+        elif update.message:
+            kind = "command" if (update.message.text or "").startswith("/") else "message"
+        elif update.poll_answer:
+            kind = "poll_answer"
+        else:
+            kind = "other"
+        self.updates.inc(kind)
+
+    def observe_handler(self, route: str, started: float, failed: bool = False) -> None:
+        """
+        Records one handled update.
+
+        Args:
+            route (str): Command or callback route, e.g. "/start" or "set_timer_".
+            started (float): time.perf_counter() when handling began.
+            failed (bool): The handler raised.
+        """
+        self.handler_seconds.observe(time.perf_counter() - started, route)
+        if failed:
+            self.handler_errors.inc(route)
+
+
+def instrument_database(db, metrics: BotMetrics):
+    """
+    Times every public coroutine method of a BotDatabase / ShardedBotDatabase.
+
+    Methods are wrapped on the instance, so the class and other instances are
+    untouched. Calls made by the sharded database to its shards are not counted
+    twice: only the object passed here is wrapped.
+
+    Returns:
+        The same database object.
+    """
+    for name in dir(type(db)):
+        if name.startswith('_') or not iscoroutinefunction(getattr(type(db), name)):
+            continue
+        setattr(db, name, _timed(getattr(db, name), name, metrics))
+    return db
+
+
+def _timed(method: Callable, name: str, metrics: BotMetrics) -> Callable:
+    histogram, errors = metrics.db_seconds, metrics.db_errors
+
+    @wraps(method)
+    async def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        except Exception:
+            errors.inc(name)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started, name)
+
+    return timed
+
+
+class InstrumentedRequest(BaseRequest):
+    """
+    Bot API transport wrapper timing each request and counting failures.
+    """
+
+    def __init__(self, request: BaseRequest, metrics: BotMetrics):
+        """
+        Args:
+            request (BaseRequest): The transport doing the actual requests.
+            metrics (BotMetrics): Metrics to record into.
+        """
+        self.request = request
+        self.metrics = metrics
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.request.read_timeout
+
+    async def initialize(self) -> None:
+        await self.request.initialize()
+
+    async def shutdown(self) -> None:
+        await self.request.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await self.request.do_request(
+                url, method, request_data=request_data, read_timeout=read_timeout,
+                write_timeout=write_timeout, connect_timeout=connect_timeout,
+                pool_timeout=pool_timeout)
+        except Exception:
+            self.metrics.api_errors.inc(api_method, "network")
+            raise
+        finally:
+            self.metrics.api_seconds.observe(time.perf_counter() - started, api_method)
+        if code != 200:
+            self.metrics.api_errors.inc(api_method, str(code))
+        return code, payload
+
+
+class MetricsServer:
+    """
+    Minimal HTTP server answering GET /metrics with the registry's text.
+    """
+
+    def __init__(self, registry: MetricsRegistry, logger, host: str = "127.0.0.1",
+                 port: int = 9464):
+        """
+        Args:
+            registry (MetricsRegistry): Metrics to expose.
+            logger: Logger instance.
+            host (str): Interface to listen on; keep it local and scrape through
+                a sidecar or SSH tunnel.
+            port (int): TCP port.
+        """
+        self.registry = registry
+        self.logger = logger
+        self.host = host
+        self.port = port
+        self.scrapes = 0
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            while await reader.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) < 2 or parts[0] != "GET":
+                status, body = "405 Method Not Allowed", b""
+            elif parts[1].split('?', 1)[0] not in ("/metrics", "/"):
+                status, body = "404 Not Found", b""
+            else:
+                status, body = "200 OK", self.registry.render().encode('utf-8')
+                self.scrapes += 1
+            writer.write(f"HTTP/1.1 {status}\r\n"
+                         f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\n"
+                         f"Connection: close\r\n\r\n".encode('ascii') + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def run(self) -> None:
+        """
+        Serves until cancelled.
+        """
+        server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.logger.info(f"Metrics available at http://{self.host}:{self.port}/metrics")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            server.close()
+            await server.wait_closed()
@@ -0,0 +1,319 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: utils/profiler.py
+
+Description:
+This module provides on-demand profiling of the running bot. A session lasts a
+given number of seconds and is started by the admin /profile command or by
+SIGUSR2; only one session runs at a time. Three modes are available:
+
+- sample: a helper thread reads the event loop thread's stack every
+  `interval` seconds (sys._current_frames). Cheap enough for production.
+- cprofile: cProfile traces every call on the event loop thread for exact
+  call counts, with the sampler alongside for the flamegraph. Slows the bot
+  down noticeably while it runs.
+- memory: tracemalloc records allocations for the session; the allocation
+  sites that grew most are written as a top-N list.
+
+CPU sessions write two files to the output directory:
+
+- <name>.collapsed - one "frame;frame;frame count" line per distinct stack,
+  root first, the input format of flamegraph.pl, speedscope and inferno;
+- <name>.pstats - a marshal dump readable by pstats / snakeviz. In sample
+  mode it is built from the samples: times are sample counts times the
+  interval, call counts are sample counts.
+"""
+
+import asyncio
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from types import CodeType
+from typing import Dict, List, Optional, Tuple
+
+MODES = ("sample", "cprofile", "memory")
+
+_PROJECT_ROOT = str(Path(__file__).resolve().parents[1])
+
+
+def frame_label(code: CodeType) -> str:
+    """
+    Returns the flamegraph label of a code object, e.g.
+    "send_question (modules/telegram/quizzes.py:120)".
+    """
+    filename = code.co_filename
+    if filename.startswith(_PROJECT_ROOT + os.sep):
+        filename = filename[len(_PROJECT_ROOT) + 1:]
+    elif 'site-packages' + os.sep in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    else:
+        filename = os.path.join(*Path(filename).parts[-2:])
+    # Semicolons separate frames in the collapsed format
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+
+
+class StackSampler:
+    """
+    Counts the stacks of one thread, sampled from a helper thread.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.01):
+        """
+        Args:
+            thread_id (int): threading.get_ident() of the sampled thread.
+            interval (float): Seconds between samples.
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self.stacks[tuple(stack)] += 1
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def collapsed(self) -> List[str]:
+        """
+        Returns the stacks in the collapsed format, hottest first.
+        """
+        labels: Dict[CodeType, str] = {}
+        lines = []
+        for stack, count in self.stacks.most_common():
+            names = [labels.get(code) or labels.setdefault(code, frame_label(code))
+                     for code in stack]
+            lines.append(f"{';'.join(names)} {count}")
+        return lines
+
+    def pstats(self) -> Dict:
+        """
+        Returns the samples as a pstats dictionary
+        {func: (cc, nc, tt, ct, {caller: (nc, cc, tt, ct)})}.
+        """
+        def key(code: CodeType) -> Tuple[str, int, str]:
+            return code.co_filename, code.co_firstlineno, code.co_name
+
+        stats: Dict = {}
+        for stack, count in self.stacks.items():
+            seconds = count * self.interval
+            seen = set()
+            for depth, code in enumerate(stack):
+                func = key(code)
+                own = seconds if depth == len(stack) - 1 else 0.0
+                cc, nc, tt, ct, callers = stats.get(func, (0, 0, 0.0, 0.0, {}))
+                # Recursive frames count once towards the cumulative time
+                total = 0.0 if func in seen else seconds
+                seen.add(func)
+                stats[func] = (cc + count, nc + count, tt + own, ct + total, callers)
+                if depth:
+                    caller = key(stack[depth - 1])
+                    c_nc, c_cc, c_tt, c_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                    callers[caller] = (c_nc + count, c_cc + count, c_tt + own, c_ct + total)
+        return stats
+
+    def top(self, limit: int = 10) -> List[str]:
+        """
+        Returns the functions with the most samples on top of the stack.
+        """
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack[-1]] += count
+        samples = max(self.samples, 1)
+        return [f"{count / samples * 100:5.1f}% {frame_label(code)}"
+                for code, count in leaves.most_common(limit)]
+
+
+class Profiler:
+    """
+    Runs profiling sessions on the event loop thread and writes their results.
+    """
+
+    def __init__(self, logger, directory: str = 'data/logs', seconds: float = 30.0,
+                 max_seconds: float = 300.0, mode: str = "sample", interval: float = 0.01,
+                 tracemalloc_top: int = 25, tracemalloc_frames: int = 1):
+        """
+        Args:
+            logger: Logger instance.
+            directory (str): Directory the result files are written to.
+            seconds (float): Default session length.
+            max_seconds (float): Longest session allowed.
+            mode (str): Default mode: "sample", "cprofile" or "memory".
+            interval (float): Seconds between stack samples.
+            tracemalloc_top (int): Allocation sites listed by a memory session.
+            tracemalloc_frames (int): Frames stored per allocation; more frames
+                group allocations by call path at a higher cost.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        self.logger = logger
+        self.directory = Path(directory)
+        self.seconds = seconds
+        self.max_seconds = max_seconds
+        self.mode = mode
+        self.interval = interval
+        self.tracemalloc_top = tracemalloc_top
+        self.tracemalloc_frames = tracemalloc_frames
+        self.running: Optional[str] = None
+        self.sessions = 0
+
+    async def profile(self, seconds: Optional[float] = None,
+                      mode: Optional[str] = None) -> Tuple[List[Path], List[str]]:
+        """
+        Profiles the running bot for `seconds` and writes the result files.
+
+        Args:
+            seconds (Optional[float]): Session length, capped at max_seconds;
+                None uses the default.
+            mode (Optional[str]): "sample", "cprofile" or "memory"; None uses
+                the default.
+
+        Returns:
+            Tuple[List[Path], List[str]]: The files written and a short summary
+                (hottest functions or largest allocation sites).
+
+        Raises:
+            RuntimeError: A session is already running.
+            ValueError: Unknown mode.
+        """
+        mode = mode or self.mode
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        if self.running:
+            raise RuntimeError(f"A {self.running} profiling session is already running")
+        seconds = min(float(seconds or self.seconds), self.max_seconds)
+        self.running = mode
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            base = self.directory / f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+            self.logger.info(f"Profiling ({mode}) for {seconds:g} s")
+            if mode == "memory":
+                files, summary = await self._memory(seconds, base)
+            else:
+                files, summary = await self._cpu(seconds, base, mode == "cprofile")
+            self.sessions += 1
+        finally:
+            self.running = None
+        self.logger.info(f"Profile written to {', '.join(str(path) for path in files)}; "
+                         + "; ".join(line.strip() for line in summary[:5]))
+        return files, summary
+
+    async def _cpu(self, seconds: float, base: Path,
+                   trace_calls: bool) -> Tuple[List[Path], List[str]]:
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        profile = cProfile.Profile() if trace_calls else None
+        sampler.start()
+        if profile is not None:
+            profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            if profile is not None:
+                profile.disable()
+            sampler.stop()
+        files = [base.with_suffix('.collapsed'), base.with_suffix('.pstats')]
+        await asyncio.to_thread(self._write_cpu, sampler, profile, files)
+        summary = [f"{sampler.samples} samples over {seconds:g} s"] + sampler.top()
+        return files, summary
+
+    @staticmethod
+    def _write_cpu(sampler: StackSampler, profile: Optional[cProfile.Profile],
+                   files: List[Path]) -> None:
+        collapsed, pstats_file = files
+        with open(collapsed, 'w', encoding='utf-8') as file:
+            for line in sampler.collapsed():
+                file.write(line + "\n")
+        if profile is not None:
+            profile.dump_stats(str(pstats_file))
+        else:
+            with open(pstats_file, 'wb') as file:
+                marshal.dump(sampler.pstats(), file)
+
+    async def _memory(self, seconds: float, base: Path) -> Tuple[List[Path], List[str]]:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(self.tracemalloc_frames)
+        try:
+            before = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            after = await asyncio.to_thread(tracemalloc.take_snapshot)
+        finally:
+            if started:
+                tracemalloc.stop()
+        path = base.with_name(base.name + '.tracemalloc.txt')
+        summary = await asyncio.to_thread(self._write_memory, before, after, path, seconds)
+        return [path], summary
+
+    def _write_memory(self, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot,
+                      path: Path, seconds: float) -> List[str]:
+        ignored = (tracemalloc.Filter(False, tracemalloc.__file__),
+                   tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                   tracemalloc.Filter(False, "<unknown>"))
+        before, after = before.filter_traces(ignored), after.filter_traces(ignored)
+        group = 'traceback' if self.tracemalloc_frames > 1 else 'lineno'
+        growth = after.compare_to(before, group)[:self.tracemalloc_top]
+        largest = after.statistics(group)[:self.tracemalloc_top]
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(f"# Allocation sites that grew most during {seconds:g} s\n")
+            for stat in growth:
+                file.write(f"{stat}\n")
+                if group == 'traceback':
+                    file.writelines(f"    {line}\n" for line in stat.traceback.format())
+            file.write("\n# Largest allocation sites traced at the end of the session\n")
+            for stat in largest:
+                file.write(f"{stat}\n")
+        total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        return [f"{total / 1024:+.0f} KiB traced over {seconds:g} s"] + [
+            f"{stat.size_diff / 1024:+.0f} KiB "
+            f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}"
+            for stat in growth[:10]]
+
+
+def profiler_from_config(config: Dict, logger) -> Optional[Profiler]:
+    """
+    Creates the profiler described by the `profiling` config section.
+
+    Returns:
+        Optional[Profiler]: The profiler, or None when disabled.
+    """
+    profiling_cfg = config.get('profiling', {})
+    if not profiling_cfg.get('enabled', True):
+        return None
+    return Profiler(logger,
+                    directory=profiling_cfg.get('directory', 'data/logs'),
+                    seconds=float(profiling_cfg.get('seconds', 30)),
+                    max_seconds=float(profiling_cfg.get('max_seconds', 300)),
+                    mode=profiling_cfg.get('mode', 'sample'),
+                    interval=float(profiling_cfg.get('sample_interval', 0.01)),
+                    tracemalloc_top=int(profiling_cfg.get('tracemalloc_top', 25)),
+                    tracemalloc_frames=int(profiling_cfg.get('tracemalloc_frames', 1)))
@@ -13,7 +13,6 @@ requests through the configured proxy.
 """
 
 from typing import Optional, Dict
-import requests
 from .logger import LoggerFactory
 
 
@@ -62,6 +61,8 @@ class ProxyHandler:
     def test_proxy_access(self):
         # Test proxy access by making a request to a test endpoint
         try:
+            # Imported on use: requests is only needed with a proxy configured
+            import requests
             self.set_proxy()
             response = requests.get("http://httpbin.org/ip", proxies=self.proxy,
                                     timeout=10)
@@ -80,6 +81,7 @@ class ProxyHandler:
     def make_request_through_proxy(self, url: str):
         # Make an HTTP request through the configured proxy
         try:
+            import requests
             self.set_proxy()
             response = requests.get(url, proxies=self.proxy, timeout=20)
             if response.status_code == 200:
@@ -0,0 +1,343 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: utils/question_store.py
+
+Description:
+This module compiles the JSON question banks into a single read-only file per
+content version and maps it into memory. The file holds a small JSON index, a
+table of record offsets and one compact JSON record per question, so processes
+that attach to it share the page cache instead of each parsing and holding
+every bank. Questions are decoded on access; quiz sessions keep lightweight
+QuizQuestions views instead of copies of the question dicts.
+
+File layout:
+    header   magic, format, content version, index length, offsets count
+    index    JSON {category: {quiz: [first offset slot, question count]}}
+    offsets  uint64 file offsets; a quiz with n questions uses n + 1 slots
+    records  compact UTF-8 JSON, one per question
+"""
+
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+MAGIC = b"QBQS"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sI32sQQ")
+
+
+def content_version(questions_directory) -> str:
+    """
+    Fingerprints the question banks by file name, size and modification time.
+
+    Args:
+        questions_directory (str): Path to the questions directory.
+
+    Returns:
+        str: 32-character hex version string.
+    """
+    digest = hashlib.sha256()
+    root = Path(questions_directory)
+    for path in sorted(root.glob('*/*.json')):
+        stat = path.stat()
+        digest.update(f"{path.relative_to(root).as_posix()}\0{stat.st_size}\0"
+                      f"{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _write_store(questions_directory, target: Path, version: str, logger=None) -> None:
+    root = Path(questions_directory)
+    index: Dict[str, Dict[str, List[int]]] = {}
+    records: List[bytes] = []
+    slots: List[int] = []
+    for category_dir in sorted(p for p in root.iterdir() if p.is_dir()):
+        for quiz_path in sorted(category_dir.glob('*.json')):
+            try:
+                with open(quiz_path, 'r', encoding='utf-8') as file:
+                    questions = json.load(file)
+            except (OSError, ValueError) as e:
+                if logger:
+                    logger.error(f"Skipping unreadable quiz file {quiz_path}: {e}")
+                continue
+            index.setdefault(category_dir.name, {})[quiz_path.stem] = [len(slots), len(questions)]
+            slots.append(len(records))
+            for question in questions:
+                records.append(json.dumps(question, ensure_ascii=False,
+                                          separators=(',', ':')).encode('utf-8'))
+                slots.append(len(records))
+
+    index_bytes = json.dumps(index, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    table_start = _align(HEADER.size + len(index_bytes))
+    record_offsets = [table_start + 8 * len(slots)]
+    for record in records:
+        record_offsets.append(record_offsets[-1] + len(record))
+    offsets = array('Q', (record_offsets[slot] for slot in slots))
+
+    tmp_path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, version.encode('ascii'),
+                               len(index_bytes), len(offsets)))
+        file.write(index_bytes)
+        file.write(b"\0" * (table_start - HEADER.size - len(index_bytes)))
+        offsets.tofile(file)
+        for record in records:
+            file.write(record)
+        file.flush()
+        os.fsync(file.fileno())
+    # Atomic swap: readers see either no file or a complete one
+    os.replace(tmp_path, target)
+
+
+def build_question_store(questions_directory, cache_directory, version: Optional[str] = None,
+                         logger=None) -> Path:
+    """
+    Compiles the question banks for the current content version if not done yet.
+
+    Concurrent callers (e.g. cluster workers) serialize on a lock file, so each
+    version is built once.
+
+    Args:
+        questions_directory (str): Path to the questions directory.
+        cache_directory (str): Directory holding compiled store files.
+        version (Optional[str]): Precomputed content version.
+        logger: Optional logger for skipped files.
+
+    Returns:
+        Path: Path of the compiled store file.
+    """
+    version = version or content_version(questions_directory)
+    cache = Path(cache_directory)
+    cache.mkdir(parents=True, exist_ok=True)
+    target = cache / f"questions-{version}.qbs"
+    if target.exists():
+        return target
+    with open(cache / "questions.lock", 'w') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        if not target.exists():
+            _write_store(questions_directory, target, version, logger)
+    return target
+
+
+class QuizQuestions(Sequence):
+    """
+    Lazy, immutable view of selected questions of one quiz in a QuestionStore.
+    """
+
+    __slots__ = ('store', 'category', 'quiz_name', 'question_ids')
+
+    def __init__(self, store: 'QuestionStore', category: str, quiz_name: str,
+                 question_ids: Sequence[int]):
+        self.store = store
+        self.category = category
+        self.quiz_name = quiz_name
+        self.question_ids = question_ids
+
+    def __len__(self) -> int:
+        return len(self.question_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self.store.question(self.category, self.quiz_name, self.question_ids[index])
+
+    def subset(self, positions: Iterable[int]) -> 'QuizQuestions':
+        """
+        Returns a view of the questions at the given positions of this view.
+        """
+        return QuizQuestions(self.store, self.category, self.quiz_name,
+                             [self.question_ids[i] for i in positions])
+
+    # Views are immutable and backed by a shared mapping; copies share them
+    def __copy__(self) -> 'QuizQuestions':
+        return self
+
+    def __deepcopy__(self, memo) -> 'QuizQuestions':
+        return self
+
+
+class QuestionStore:
+    """
+    Read-only, memory-mapped compiled question banks.
+    """
+
+    def __init__(self, path):
+        """
+        Maps a compiled store file.
+
+        Args:
+            path (str): Path of the store file.
+
+        Raises:
+            ValueError: If the file is not a compatible store.
+        """
+        self.path = Path(path)
+        with open(self.path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, version, index_length, offsets_count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{self.path} is not a compatible question store")
+        self.version = version.decode('ascii')
+        self._index: Dict[str, Dict[str, List[int]]] = json.loads(
+            self._mmap[HEADER.size:HEADER.size + index_length])
+        table_start = _align(HEADER.size + index_length)
+        self._offsets = memoryview(self._mmap)[table_start:table_start + 8 * offsets_count].cast('Q')
+
+    def categories(self) -> List[str]:
+        return list(self._index)
+
+    def quizzes(self, category: str) -> List[Tuple[str, int]]:
+        """
+        Lists the quizzes of a category.
+
+        Args:
+            category (str): Category name.
+
+        Returns:
+            List[Tuple[str, int]]: Quiz names with their question counts.
+        """
+        return [(name, count) for name, (_, count) in self._index.get(category, {}).items()]
+
+    def count(self, category: str, quiz_name: str) -> Optional[int]:
+        entry = self._index.get(category, {}).get(quiz_name)
+        return entry[1] if entry else None
+
+    def question(self, category: str, quiz_name: str, question_id: int) -> Dict[str, Any]:
+        """
+        Decodes one question.
+
+        Args:
+            category (str): Category name.
+            quiz_name (str): Quiz name.
+            question_id (int): Index of the question in its quiz file.
+
+        Returns:
+            Dict[str, Any]: The question record.
+        """
+        slot, count = self._index[category][quiz_name]
+        if not 0 <= question_id < count:
+            raise IndexError(f"Question {question_id} out of range for {category}/{quiz_name}")
+        start = self._offsets[slot + question_id]
+        end = self._offsets[slot + question_id + 1]
+        return json.loads(self._mmap[start:end])
+
+    def questions(self, category: str, quiz_name: str,
+                  question_ids: Optional[Sequence[int]] = None) -> Optional[QuizQuestions]:
+        """
+        Returns a lazy view of a quiz's questions.
+
+        Args:
+            category (str): Category name.
+            quiz_name (str): Quiz name.
+            question_ids (Optional[Sequence[int]]): Questions to include, all by default.
+
+        Returns:
+            Optional[QuizQuestions]: The view, or None if the quiz does not exist.
+        """
+        count = self.count(category, quiz_name)
+        if count is None:
+            return None
+        ids = range(count) if question_ids is None else question_ids
+        return QuizQuestions(self, category, quiz_name, ids)
+
+    def close(self) -> None:
+        self._offsets.release()
+        self._mmap.close()
+
+
+class QuestionStoreManager:
+    """
+    Keeps the current QuestionStore and swaps to a new version when the
+    question banks change on disk.
+    """
+
+    def __init__(self, questions_directory, cache_directory, logger, check_interval: float = 30):
+        """
+        Initializes the manager.
+
+        Args:
+            questions_directory (str): Path to the questions directory.
+            cache_directory (str): Directory holding compiled store files.
+            logger: Logger instance.
+            check_interval (float): Seconds between checks for changed banks.
+        """
+        self.questions_directory = questions_directory
+        self.cache_directory = Path(cache_directory)
+        self.logger = logger
+        self.check_interval = check_interval
+        self._store: Optional[QuestionStore] = None
+
+    def current(self) -> QuestionStore:
+        """
+        Returns the attached store, building and attaching it on first use.
+        """
+        if self._store is None:
+            self.refresh()
+        return self._store
+
+    def refresh(self) -> bool:
+        """
+        Attaches the store for the current content version if it changed.
+
+        Sessions that still hold views of the previous version keep it mapped
+        until they are gone.
+
+        Returns:
+            bool: True if a new version was attached.
+        """
+        version = content_version(self.questions_directory)
+        if self._store is not None and self._store.version == version:
+            return False
+        for attempt in range(2):
+            path = build_question_store(self.questions_directory, self.cache_directory,
+                                        version, self.logger)
+            try:
+                store = QuestionStore(path)
+                break
+            except FileNotFoundError:
+                # Pruned by another process between build and open; rebuild once
+                if attempt:
+                    raise
+        self._store = store
+        self.logger.info(f"Attached question store {path.name}")
+        self._prune(path)
+        return True
+
+    def _prune(self, keep: Path) -> None:
+        # Unlinking is safe for processes that still map an old file
+        for path in self.cache_directory.glob("questions-*.qbs"):
+            if path != keep:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    async def run(self) -> None:
+        """
+        Checks for changed question banks until cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except (OSError, ValueError) as e:
+                self.logger.error(f"Failed to refresh question store: {e}")
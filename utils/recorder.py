@@ -0,0 +1,220 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: utils/recorder.py
+
+Description:
+This module provides an optional recorder of incoming updates, used to replay
+real traffic against a test bot (benchmarks/replay.py). Every message,
+callback query and poll answer that reaches the handlers is written with its
+arrival time as one JSON line to a gzip-compressed file:
+
+    {"t": 1760832000.123, "update": {"message": {...}}}
+
+Updates are anonymized before they are written:
+
+- user and chat ids are replaced by a keyed hash (stable within a recording,
+  so one user's updates stay together), names and usernames are dropped;
+- message text is masked, except for a leading command token (`/start`
+  without its deep-link payload or other arguments);
+- only the fields the bot reads are kept: callback data, poll option ids,
+  message ids and dates, language codes.
+
+Each process writes its own file, `updates-<time>-<pid>.jsonl.gz`; recording
+stops when the file reaches `max_bytes`. The gzip stream is flushed every
+`flush_interval` seconds, by the next write or by run() when no update
+arrives, so a file cut short by a crash is readable up to the last flush.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import secrets
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from telegram import MaybeInaccessibleMessage, Message, MessageEntity, Update, User
+from telegram.ext import CallbackContext
+
+# Largest pseudonymous id; below 2^52 so JSON readers keep it exact
+_ID_RANGE = 2 ** 48
+
+
+class UpdateRecorder:
+    """
+    Writes anonymized incoming updates to a compressed JSONL file.
+    """
+
+    def __init__(self, logger, directory: str = 'data/recordings',
+                 max_bytes: int = 100 * 1024 * 1024, flush_interval: float = 5.0, salt: str = ""):
+        """
+        Args:
+            logger: Logger instance.
+            directory (str): Directory the recording is written to.
+            max_bytes (int): Compressed size at which recording stops.
+            flush_interval (float): Seconds between flushes of the gzip stream.
+            salt (str): Key of the id hash; empty for a random key per
+                process, so ids cannot be matched across recordings.
+        """
+        self.logger = logger
+        name = f"updates-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz"
+        self.path = Path(directory) / name
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.salt = (salt or secrets.token_hex(16)).encode()
+        self.recorded = 0
+        self.stopped = False
+        self._raw = None
+        self._file: Optional[gzip.GzipFile] = None
+        self._flushed = 0.0
+        self._unflushed = False
+
+    async def record(self, update: Update, context: CallbackContext) -> None:
+        """
+        Handler callback (TypeHandler) writing one update.
+        """
+        if self.stopped:
+            return
+        data = self.anonymize(update)
+        if data is None:
+            return
+        try:
+            self.write({'t': round(time.time(), 3), 'update': data})
+        except OSError as e:
+            self.logger.error(f"Error recording updates to {self.path}: {e}")
+            self.stop()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._raw = open(self.path, 'wb')
+            self._file = gzip.GzipFile(fileobj=self._raw, mode='wb')
+            self.logger.info(f"Recording updates to {self.path}")
+        self._file.write((json.dumps(record, separators=(',', ':')) + "\n").encode())
+        self.recorded += 1
+        self._unflushed = True
+        if time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Flushes written updates to the file and stops at max_bytes.
+        """
+        self._flushed = time.monotonic()
+        if self._file is None or not self._unflushed:
+            return
+        self._file.flush()
+        self._unflushed = False
+        if self._raw.tell() >= self.max_bytes:
+            self.logger.warning(f"Update recording stopped at {self.max_bytes} bytes: "
+                                f"{self.recorded} updates in {self.path}")
+            self.stop()
+
+    async def run(self) -> None:
+        """
+        Flushes updates written since the last flush every flush_interval
+        seconds, so a quiet period does not leave them in the gzip buffer.
+        Runs until cancelled or recording stops.
+        """
+        while not self.stopped:
+            await asyncio.sleep(self.flush_interval)
+            if time.monotonic() - self._flushed < self.flush_interval:
+                continue
+            try:
+                self.flush()
+            except OSError as e:
+                self.logger.error(f"Error recording updates to {self.path}: {e}")
+                self.stop()
+
+    def stop(self) -> None:
+        self.stopped = True
+        self.close()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._raw.close()
+            self._file = self._raw = None
+
+    def pseudonym(self, value: int) -> int:
+        """
+        Returns the stable pseudonymous id of a user or chat id.
+        """
+        digest = hashlib.blake2b(str(value).encode(), key=self.salt, digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % _ID_RANGE + 1
+
+    def anonymize(self, update: Update) -> Optional[Dict[str, Any]]:
+        """
+        Reduces an update to the anonymized fields the bot reads. Read from
+        the objects directly: Update.to_dict() costs several times as much.
+
+        Returns:
+            Optional[Dict[str, Any]]: The update in Bot API form without its
+                update_id, or None for update types the bot does not handle.
+        """
+        if update.message is not None:
+            return {'message': self._message(update.message)}
+        query = update.callback_query
+        if query is not None:
+            data = {'id': query.id, 'from': self._user(query.from_user),
+                    'chat_instance': query.chat_instance, 'data': query.data}
+            if query.message is not None:
+                data['message'] = self._message(query.message, text=False)
+            return {'callback_query': data}
+        answer = update.poll_answer
+        if answer is not None:
+            data = {'poll_id': answer.poll_id, 'option_ids': list(answer.option_ids)}
+            if answer.user is not None:
+                data['user'] = self._user(answer.user)
+            return {'poll_answer': data}
+        return None
+
+    def _user(self, user: User) -> Dict[str, Any]:
+        data = {'id': self.pseudonym(user.id), 'is_bot': user.is_bot, 'first_name': "User"}
+        if user.language_code:
+            data['language_code'] = user.language_code
+        return data
+
+    def _message(self, message: MaybeInaccessibleMessage, text: bool = True) -> Dict[str, Any]:
+        data = {'message_id': message.message_id,
+                'date': int(message.date.timestamp()) if message.date else 0,
+                'chat': {'id': self.pseudonym(message.chat.id), 'type': message.chat.type}}
+        if not isinstance(message, Message):
+            return data
+        if message.from_user is not None:
+            data['from'] = self._user(message.from_user)
+        if text and message.text:
+            command = next((entity for entity in message.entities
+                            if entity.type == MessageEntity.BOT_COMMAND and entity.offset == 0),
+                           None)
+            if command is not None:
+                # Arguments such as a /start deep-link payload can identify the user
+                data['text'] = message.text[:command.length] + "".join(
+                    char if char.isspace() else "x" for char in message.text[command.length:])
+                data['entities'] = [{'type': "bot_command", 'offset': 0,
+                                     'length': command.length}]
+            else:
+                data['text'] = "x" * len(message.text)
+        return data
+
+
+def recorder_from_config(config: Dict, logger) -> Optional[UpdateRecorder]:
+    """
+    Creates the recorder described by the `recording` config section.
+
+    Returns:
+        Optional[UpdateRecorder]: The recorder, or None when disabled.
+    """
+    recording_cfg = config.get('recording', {})
+    if not recording_cfg.get('enabled', False):
+        return None
+    return UpdateRecorder(logger,
+                          directory=recording_cfg.get('directory', 'data/recordings'),
+                          max_bytes=int(recording_cfg.get('max_bytes', 100 * 1024 * 1024)),
+                          flush_interval=float(recording_cfg.get('flush_interval', 5)),
+                          salt=str(recording_cfg.get('salt') or ""))
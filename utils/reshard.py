@@ -0,0 +1,224 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: utils/reshard.py
+
+Description:
+Offline tool that moves the bot's SQLite data to a different number of shard
+files (see ShardedBotDatabase). The current layout is detected from the
+metadata database, or is the single db_source file when there is none. The new
+layout is built in a staging directory, row counts are verified, and only then
+are the old files moved to a backup directory and the new ones put in place.
+Stop the bot before running it.
+
+Usage:
+    python -m utils.reshard --shards 4
+    python -m utils.reshard --shards 1 --db data/db/qbb.db
+"""
+
+import argparse
+import asyncio
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from utils.configs import ConfigLoader
+from utils.database import BotDatabase, ShardedBotDatabase, shard_index, shard_layout_paths
+
+TABLES = ('users', 'user_settings', 'quiz_attempts', 'quiz_attempt_rollups', 'quiz_sessions')
+
+# Rows of each table that belong to shard_of(...) = target index
+_SELECTORS = {
+    'users': "shard_of(telegram_id) = ?",
+    'user_settings': "user_id IN (SELECT id FROM src.users WHERE shard_of(telegram_id) = ?)",
+    'quiz_attempts': "user_id IN (SELECT id FROM src.users WHERE shard_of(telegram_id) = ?)",
+    'quiz_attempt_rollups': "user_id IN (SELECT id FROM src.users WHERE shard_of(telegram_id) = ?)",
+    'quiz_sessions': "shard_of(telegram_id) = ?",
+}
+
+
+def detect_shards(db_path: str) -> int:
+    """
+    Returns the shard count of the existing layout.
+
+    Args:
+        db_path (str): Configured db_source path.
+
+    Returns:
+        int: Number of shards, 1 for a single file, 0 if there is no data.
+    """
+    meta_path, _ = shard_layout_paths(db_path, 2)
+    if meta_path.exists():
+        with sqlite3.connect(meta_path) as conn:
+            row = conn.execute("SELECT value FROM layout WHERE key = 'shards'").fetchone()
+        if row:
+            return int(row[0])
+    return 1 if Path(db_path).exists() else 0
+
+
+def _files(db_path: str, shards: int) -> List[Path]:
+    meta, paths = shard_layout_paths(db_path, shards)
+    return ([meta] if meta else []) + paths
+
+
+async def _create_layout(db_path: str, shards: int) -> None:
+    # Reuse the application's migrations so the schema matches exactly
+    db = ShardedBotDatabase(db_path, shards) if shards > 1 else BotDatabase(db_path)
+    await db.init()
+    await db.close()
+
+
+def _checkpoint(path: Path) -> None:
+    # Fold the WAL into the main file so moving it does not lose writes
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _count(path: Path, table: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def copy_shard(sources: List[Path], target: Path, index: int, shards: int) -> None:
+    """
+    Copies the rows of one target shard from every source file.
+
+    Args:
+        sources (List[Path]): Source data files.
+        target (Path): Migrated, empty target shard file.
+        index (int): Index of the target shard.
+        shards (int): Target shard count.
+    """
+    conn = sqlite3.connect(target, isolation_level=None)
+    conn.create_function("shard_of", 1, lambda telegram_id: shard_index(telegram_id, shards),
+                         deterministic=True)
+    try:
+        for source in sources:
+            conn.execute("ATTACH DATABASE ? AS src", (str(source),))
+            conn.execute("BEGIN")
+            for table in TABLES:
+                columns = _columns(conn, table)
+                if table == 'quiz_attempts':
+                    # Attempt ids are per file; let the target assign new ones
+                    columns.remove('id')
+                names = ", ".join(columns)
+                conn.execute(f"INSERT INTO main.{table} ({names}) SELECT {names} FROM src.{table} "
+                             f"WHERE {_SELECTORS[table]}", (index,))
+            conn.execute("COMMIT")
+            conn.execute("DETACH DATABASE src")
+    finally:
+        conn.close()
+
+
+def fill_directory(sources: List[Path], meta: Path) -> None:
+    """
+    Registers every user in the metadata directory, keeping their ids.
+
+    Args:
+        sources (List[Path]): Source data files.
+        meta (Path): Metadata database of the new layout.
+    """
+    with sqlite3.connect(meta) as conn:
+        for source in sources:
+            conn.execute("ATTACH DATABASE ? AS src", (str(source),))
+            # Explicit ids also advance the AUTOINCREMENT sequence
+            conn.execute("INSERT INTO user_directory (user_id, telegram_id) "
+                         "SELECT id, telegram_id FROM src.users")
+            conn.commit()
+            conn.execute("DETACH DATABASE src")
+
+
+def reshard(db_path: str, shards: int) -> Dict[str, int]:
+    """
+    Moves the data at db_path to a layout with the given number of shards.
+
+    Args:
+        db_path (str): Configured db_source path.
+        shards (int): Target shard count.
+
+    Returns:
+        Dict[str, int]: Rows copied per table.
+
+    Raises:
+        RuntimeError: If there is nothing to do or the copy does not verify.
+    """
+    current = detect_shards(db_path)
+    if current == 0:
+        raise RuntimeError(f"No database found at {db_path}")
+    if current == shards:
+        raise RuntimeError(f"{db_path} already has {shards} shard(s)")
+
+    _, sources = shard_layout_paths(db_path, current)
+    old_files = _files(db_path, current)
+    for path in old_files:
+        _checkpoint(path)
+    expected = {table: sum(_count(path, table) for path in sources) for table in TABLES}
+
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    root = Path(db_path).parent
+    staging = Path(tempfile.mkdtemp(prefix=f"reshard-{stamp}-", dir=root))
+    staged_db = str(staging / Path(db_path).name)
+    try:
+        asyncio.run(_create_layout(staged_db, shards))
+        meta, targets = shard_layout_paths(staged_db, shards)
+        for index, target in enumerate(targets):
+            copy_shard(sources, target, index, shards)
+        if meta:
+            fill_directory(sources, meta)
+        copied = {table: sum(_count(path, table) for path in targets) for table in TABLES}
+        if copied != expected:
+            raise RuntimeError(f"Row counts differ after copy: expected {expected}, got {copied}")
+        for path in _files(staged_db, shards):
+            _checkpoint(path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    backup = Path(tempfile.mkdtemp(prefix=f"pre-reshard-{stamp}-", dir=root))
+    for path in old_files:
+        for suffix in ("", "-wal", "-shm"):
+            part = path.with_name(path.name + suffix)
+            if part.exists():
+                part.rename(backup / part.name)
+    for path in _files(staged_db, shards):
+        path.rename(root / path.name)
+    shutil.rmtree(staging, ignore_errors=True)
+    print(f"Previous files moved to {backup}")
+    return copied
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reshard the bot database offline.")
+    parser.add_argument('--shards', type=int, required=True, help="Target number of shard files")
+    parser.add_argument('--db', help="db_source path (default: from the configuration)")
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+
+    if args.db:
+        db_path = args.db
+    else:
+        config = ConfigLoader(Path("configs")).load_config()
+        db_path = config.get('database', {}).get('db_source', 'data/db/qbb.db')
+    try:
+        copied = reshard(db_path, args.shards)
+    except RuntimeError as e:
+        print(f"Reshard failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Resharded {db_path} into {args.shards} shard(s): "
+          + ", ".join(f"{table}={rows}" for table, rows in copied.items()))
+    print(f"Set database.shards to {args.shards} before starting the bot.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: utils/startup.py
+
+Description:
+This module times the stages of the bot's start-up and runs the independent
+ones concurrently. Start-up goes through:
+
+- imports: from the first line of app.py until main() runs
+- config, directories: configuration, logging and data directories
+- proxy, locales, catalog, migrations: independent of each other, run in
+  threads at the same time (proxy probe, translation files, compiled question
+  store, database schema)
+- build: the Telegram Application with its handlers and background jobs
+- initialize, post_init, polling: getMe and persisted sessions, database
+  connections and background jobs, the first getUpdates
+
+`python app.py --startup-profile` prints the timings of a real start-up and the
+slowest imports of a separate `python -X importtime -c "import app"` run, then
+shuts the bot down again.
+"""
+
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class StartupProfile:
+    """
+    Collects the start and duration of each start-up stage.
+    """
+
+    def __init__(self, started: Optional[float] = None):
+        """
+        Args:
+            started (Optional[float]): time.perf_counter() value the offsets are
+                relative to; now when None.
+        """
+        self.started = time.perf_counter() if started is None else started
+        # (name, offset, seconds, thread name)
+        self.stages: List[Tuple[str, float, float, str]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Times the enclosed block as a stage; safe to use from several threads.
+        """
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, begin, time.perf_counter())
+
+    def add(self, name: str, begin: float, end: float) -> None:
+        with self._lock:
+            self.stages.append((name, begin - self.started, end - begin,
+                                threading.current_thread().name))
+
+    def total(self) -> float:
+        """
+        Returns the seconds from the start until the last stage ended.
+        """
+        return max((offset + seconds for _, offset, seconds, _ in self.stages), default=0.0)
+
+    def summary(self) -> str:
+        """
+        Returns a one-line summary for the log.
+        """
+        return (f"Startup finished in {self.total():.2f}s ("
+                + ", ".join(f"{name} {seconds:.2f}s" for name, _, seconds, _ in self.stages)
+                + ")")
+
+    def report(self) -> List[str]:
+        """
+        Returns the stages as table lines, in order of their start.
+        """
+        lines = [f"{'stage':<12} {'start ms':>9} {'ms':>9}  thread"]
+        for name, offset, seconds, thread in sorted(self.stages, key=lambda stage: stage[1]):
+            lines.append(f"{name:<12} {offset * 1000:>9.1f} {seconds * 1000:>9.1f}  {thread}")
+        lines.append(f"{'total':<12} {'':>9} {self.total() * 1000:>9.1f}")
+        return lines
+
+
+def run_concurrently(stages: Dict[str, Callable[[], Any]],
+                     profile: Optional[StartupProfile] = None) -> Dict[str, Any]:
+    """
+    Runs independent start-up stages in threads and waits for all of them.
+
+    Stages are expected to spend their time in I/O (network, files, SQLite),
+    which releases the GIL; the first exception raised by a stage is re-raised
+    once every stage has finished.
+
+    Args:
+        stages (Dict[str, Callable[[], Any]]): Stage name to callable.
+        profile (Optional[StartupProfile]): Profile timing each stage.
+
+    Returns:
+        Dict[str, Any]: Stage name to the callable's result.
+    """
+    def timed(name: str, function: Callable[[], Any]) -> Any:
+        if profile is None:
+            return function()
+        with profile.stage(name):
+            return function()
+
+    if not stages:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix="startup") as pool:
+        futures = {name: pool.submit(timed, name, function) for name, function in stages.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def import_times(module: str = "app", top: int = 15,
+                 cwd: Optional[Path] = None) -> Tuple[float, List[Tuple[str, float, str]]]:
+    """
+    Imports a module in a fresh interpreter under `-X importtime`.
+
+    Args:
+        module (str): Module to import.
+        top (int): Number of imports returned.
+        cwd (Optional[Path]): Directory the interpreter runs in.
+
+    Returns:
+        Tuple[float, List[Tuple[str, float, str]]]: Milliseconds the import of
+            `module` took, and the slowest libraries imported by the project's
+            own modules: (library, cumulative milliseconds, importing module).
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=cwd, capture_output=True, text=True, check=False)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative) / 1000))
+
+    def is_project(name: str) -> bool:
+        return name.split('.')[0] in (module, "utils", "modules")
+
+    total = 0.0
+    imports = []
+    # Modules are listed after the modules they import, one level deeper; going
+    # backwards, the importer of a line is the last less indented line seen
+    importers: List[Tuple[int, str]] = []
+    for depth, name, milliseconds in reversed(rows):
+        while importers and importers[-1][0] >= depth:
+            importers.pop()
+        if name == module:
+            total = milliseconds
+        elif importers and is_project(importers[-1][1]) and not is_project(name):
+            imports.append((name, milliseconds, importers[-1][1]))
+        importers.append((depth, name))
+    imports.sort(key=lambda row: row[1], reverse=True)
+    return total, imports[:top]
+
+
+def print_profile(profile: StartupProfile, top: int = 15) -> None:
+    """
+    Prints the start-up stages, then the slowest imports of `import app`
+    measured in a fresh interpreter.
+    """
+    print("\n".join(profile.report()))
+    total, imports = import_times(top=top)
+    print(f"\nimport app: {total:.1f} ms (python -X importtime, fresh interpreter)")
+    print(f"{'module':<36} {'ms':>9}  imported by")
+    for name, milliseconds, importer in imports:
+        print(f"{name:<36} {milliseconds:>9.1f}  {importer}")
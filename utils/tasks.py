@@ -0,0 +1,135 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: utils/tasks.py
+
+Description:
+This module provides the TaskSupervisor class, which tracks background
+coroutines started by the bot (quiz timers and similar). Every task is
+registered with an owner and a kind, per-owner and global caps are enforced,
+unhandled exceptions are logged, and all tasks can be cancelled together on
+shutdown.
+"""
+
+import asyncio
+from collections import Counter
+from typing import Any, Coroutine, Dict, Hashable, Optional, Set
+
+
+class TaskSupervisor:
+    """
+    Registry of named background tasks grouped by owner.
+    """
+
+    def __init__(self, logger, max_per_owner: int = 4, max_total: int = 10000):
+        """
+        Initializes the supervisor.
+
+        Args:
+            logger: Logger instance for reporting task failures.
+            max_per_owner (int): Maximum live tasks per owner.
+            max_total (int): Maximum live tasks overall.
+        """
+        self.logger = logger
+        self.max_per_owner = max_per_owner
+        self.max_total = max_total
+        self._tasks: Dict[asyncio.Task, tuple] = {}
+        self._by_owner: Dict[Hashable, Set[asyncio.Task]] = {}
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def spawn(self, coro: Coroutine[Any, Any, Any], owner: Hashable, kind: str,
+              replace: bool = False) -> Optional[asyncio.Task]:
+        """
+        Starts a tracked background task.
+
+        Args:
+            coro (Coroutine): The coroutine to run.
+            owner (Hashable): Owner of the task, e.g. a Telegram user ID.
+            kind (str): Task type used for naming and counting, e.g. "quiz_timer".
+            replace (bool): Cancel the owner's running tasks of the same kind first.
+
+        Returns:
+            Optional[asyncio.Task]: The task, or None if a cap was reached.
+        """
+        if replace:
+            self.cancel_owner(owner, kind)
+        owned = self._by_owner.get(owner, ())
+        if len(owned) >= self.max_per_owner or len(self._tasks) >= self.max_total:
+            coro.close()
+            self.rejected += 1
+            self.logger.warning(f"Task cap reached, not starting {kind} for owner {owner}")
+            return None
+
+        task = asyncio.get_running_loop().create_task(coro, name=f"{kind}:{owner}")
+        self._tasks[task] = (owner, kind)
+        self._by_owner.setdefault(owner, set()).add(task)
+        task.add_done_callback(self._on_done)
+        return task
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        owner, kind = self._tasks.pop(task, (None, None))
+        owned = self._by_owner.get(owner)
+        if owned is not None:
+            owned.discard(task)
+            if not owned:
+                del self._by_owner[owner]
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            self.logger.error(f"Background task {task.get_name()} failed: {exc}",
+                              exc_info=(type(exc), exc, exc.__traceback__))
+
+    def cancel_owner(self, owner: Hashable, kind: Optional[str] = None) -> int:
+        """
+        Cancels an owner's tasks.
+
+        Args:
+            owner (Hashable): Owner whose tasks are cancelled.
+            kind (Optional[str]): Only cancel tasks of this kind.
+
+        Returns:
+            int: The number of tasks cancelled.
+        """
+        cancelled = 0
+        owned = self._by_owner.get(owner, set())
+        for task in list(owned):
+            if kind is None or self._tasks[task][1] == kind:
+                if task.cancel():
+                    cancelled += 1
+                # A cancelled task no longer counts against its owner's cap
+                owned.discard(task)
+        if not owned:
+            self._by_owner.pop(owner, None)
+        return cancelled
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Returns live task counts by kind.
+
+        Returns:
+            Dict[str, int]: Mapping of task kind to number of live tasks.
+        """
+        return dict(Counter(kind for _, kind in self._tasks.values()))
+
+    async def shutdown(self, timeout: float = 5.0) -> None:
+        """
+        Cancels every task and waits for them to finish.
+
+        Args:
+            timeout (float): Seconds to wait for cancelled tasks to exit.
+        """
+        tasks = list(self._tasks)
+        if not tasks:
+            return
+        for task in tasks:
+            task.cancel()
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            self.logger.warning(f"{len(pending)} background tasks did not exit on shutdown")
+        self.logger.info(f"Cancelled {len(tasks)} background tasks")
@@ -0,0 +1,384 @@
+# MIT License
+# Copyright (c) 2024 skysoulkeeper
+# See LICENSE file for more details.
+
+"""
+Module: utils/tracing.py
+
+Description:
+This module provides lightweight span tracing of update handling. Every update
+handled by BotHandler gets a trace: a root span with a random trace id, and
+nested spans around database calls, quiz file loads, message rendering and Bot
+API calls. The current span lives in a contextvars.ContextVar, so code deep in
+the call chain opens child spans with `with span("name"):` and no span object
+has to be passed around; asyncio copies the context into tasks and
+asyncio.to_thread, so work started by a handler is attributed to its update.
+
+Spans are always recorded (two perf_counter() calls and a small object each);
+only emitting is sampled. When the handler finishes, the trace is written as
+one record through the bot's logger - the LoggerFactory JSON line gains a
+"trace" object - and appended to a JSONL file for offline analysis:
+
+- a `sample_rate` fraction of all traces at INFO level;
+- every trace slower than `slow_ms` at WARNING level, whatever the sample.
+
+Spans opened after their trace finished (quiz timers and other tasks that
+inherited the handler's context) are not recorded.
+"""
+
+import json
+import os
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telegram.request import BaseRequest
+
+from utils.logger import log_structured
+
+# Upper bound of spans per trace; a runaway loop must not grow a trace without limit
+MAX_SPANS = 256
+
+
+class Trace:
+    """
+    The spans of one handled update.
+    """
+
+    __slots__ = ('trace_id', 'wall_time', 'spans', 'closed')
+
+    def __init__(self):
+        self.trace_id = f"{random.getrandbits(64):016x}"
+        self.wall_time = time.time()
+        self.spans: List[Span] = []
+        self.closed = False
+
+
+class Span:
+    """
+    A timed, named step of a trace.
+    """
+
+    __slots__ = ('name', 'trace', 'index', 'parent', 'started', 'ended', 'attrs', 'token')
+
+    def __init__(self, name: str, trace: Trace, parent: int, attrs: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.index = len(trace.spans)
+        self.parent = parent
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.ended = None
+        self.token = None
+        trace.spans.append(self)
+
+    def set(self, **attrs) -> None:
+        """
+        Adds attributes to the span.
+        """
+        self.attrs.update(attrs)
+
+
+_current: ContextVar[Optional[Span]] = ContextVar('quiz_bot_span', default=None)
+
+
+def current_span() -> Optional[Span]:
+    """
+    Returns the innermost open span of the running context, if any.
+    """
+    return _current.get()
+
+
+class span:
+    """
+    Context manager recording a child span of the current span.
+
+    Outside a trace, or once the trace has finished, it does nothing and
+    `with span(...) as s` binds None.
+    """
+
+    __slots__ = ('name', 'attrs', '_span')
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self._span = None
+
+    def __enter__(self) -> Optional[Span]:
+        parent = _current.get()
+        if parent is None or parent.trace.closed or len(parent.trace.spans) >= MAX_SPANS:
+            return None
+        child = self._span = Span(self.name, parent.trace, parent.index, self.attrs)
+        child.token = _current.set(child)
+        return child
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        child = self._span
+        if child is not None:
+            child.ended = time.perf_counter()
+            if exc_type is not None:
+                child.attrs['error'] = exc_type.__name__
+            _current.reset(child.token)
+            self._span = None
+        return False
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator recording each call of a function or coroutine function as a span.
+    """
+    def decorate(function: Callable) -> Callable:
+        if iscoroutinefunction(function):
+            @wraps(function)
+            async def traced_coroutine(*args, **kwargs):
+                with span(name):
+                    return await function(*args, **kwargs)
+            return traced_coroutine
+
+        @wraps(function)
+        def traced_function(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return traced_function
+
+    return decorate
+
+
+class JsonlExporter:
+    """
+    Appends finished traces to a JSON Lines file, one trace per line.
+
+    When the file grows past `max_bytes` it is renamed to `<name>.1`
+    (replacing the previous one) and a new file is started.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024):
+        """
+        Args:
+            path (str): Path of the JSONL file; parent directories are created.
+            max_bytes (int): Size at which the file is rotated.
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = None
+        self.exported = 0
+
+    def export(self, data: Dict[str, Any]) -> None:
+        """
+        Writes one trace.
+        """
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(data, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.exported += 1
+        if self._file.tell() >= self.max_bytes:
+            self._file.close()
+            self._file = None
+            os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Tracer:
+    """
+    Starts and finishes the trace of each update and emits the sampled ones.
+    """
+
+    def __init__(self, logger, sample_rate: float = 0.01, slow_ms: float = 1000.0,
+                 exporter: Optional[JsonlExporter] = None):
+        """
+        Args:
+            logger: Logger instance (LoggerFactory) the traces are emitted through.
+            sample_rate (float): Fraction of traces emitted, 0.0 to 1.0.
+            slow_ms (float): Traces at least this long are always emitted;
+                0 disables the rule.
+            exporter (Optional[JsonlExporter]): Also writes emitted traces to a file.
+        """
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.exporter = exporter
+        self.traces = 0
+        self.emitted = 0
+
+    def start(self, name: str = "update", **attrs) -> Span:
+        """
+        Opens the root span of a new trace and makes it current.
+
+        Args:
+            name (str): Provisional name of the trace; finish() may rename it.
+            **attrs: Attributes of the root span (update id, user id, ...).
+
+        Returns:
+            Span: The root span, to be passed to finish().
+        """
+        root = Span(name, Trace(), -1, attrs)
+        root.token = _current.set(root)
+        return root
+
+    def finish(self, root: Span, name: Optional[str] = None, failed: bool = False) -> None:
+        """
+        Closes a trace started by start() and emits it if sampled or slow.
+
+        Args:
+            root (Span): The root span returned by start().
+            name (Optional[str]): Final name of the trace, e.g. the handler route.
+            failed (bool): The handler raised.
+        """
+        root.ended = time.perf_counter()
+        trace = root.trace
+        trace.closed = True
+        try:
+            _current.reset(root.token)
+        except ValueError:
+            # Finished from another context than the one that started it
+            pass
+        if name:
+            root.name = name
+        if failed:
+            root.attrs['error'] = True
+        self.traces += 1
+
+        duration_ms = (root.ended - root.started) * 1000
+        slow = self.slow_ms and duration_ms >= self.slow_ms
+        if not slow and random.random() >= self.sample_rate:
+            return
+        data = self.serialize(root)
+        self.emitted += 1
+        message = f"Trace {root.name} {trace.trace_id} took {duration_ms:.1f} ms"
+        if slow:
+            log_structured(self.logger, "WARNING", f"Slow update: {message}", depth=1, trace=data)
+        else:
+            log_structured(self.logger, "INFO", message, depth=1, trace=data)
+        if self.exporter is not None:
+            try:
+                self.exporter.export(data)
+            except OSError as e:
+                self.logger.error(f"Error exporting trace: {e}")
+
+    @staticmethod
+    def serialize(root: Span) -> Dict[str, Any]:
+        """
+        Builds the JSON-ready form of a finished trace.
+
+        Spans are listed flat in start order; `parent` is the index of the
+        enclosing span (0 is the root), offsets and durations are milliseconds
+        from the start of the root span. Spans still open have no duration.
+        """
+        trace = root.trace
+        spans = []
+        for child in trace.spans[1:]:
+            entry = {
+                'name': child.name,
+                'parent': child.parent,
+                'offset_ms': round((child.started - root.started) * 1000, 3),
+                'ms': round((child.ended - child.started) * 1000, 3)
+                if child.ended is not None else None,
+            }
+            if child.attrs:
+                entry['attrs'] = child.attrs
+            spans.append(entry)
+        return {
+            'trace_id': trace.trace_id,
+            'name': root.name,
+            'time': round(trace.wall_time, 3),
+            'ms': round((root.ended - root.started) * 1000, 3),
+            'attrs': root.attrs,
+            'spans': spans,
+        }
+
+    def close(self) -> None:
+        if self.exporter is not None:
+            self.exporter.close()
+
+
+def trace_database(db):
+    """
+    Records every public coroutine method call of a BotDatabase /
+    ShardedBotDatabase as a "db.<method>" span.
+
+    Methods are wrapped on the instance, like instrument_database() does.
+
+    Returns:
+        The same database object.
+    """
+    for name in dir(type(db)):
+        if name.startswith('_') or not iscoroutinefunction(getattr(type(db), name)):
+            continue
+        setattr(db, name, traced(f"db.{name}")(getattr(db, name)))
+    return db
+
+
+class TracedRequest(BaseRequest):
+    """
+    Bot API transport wrapper recording each request as an "api.<method>" span.
+    """
+
+    def __init__(self, request: BaseRequest):
+        """
+        Args:
+            request (BaseRequest): The transport doing the actual requests.
+        """
+        self.request = request
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.request.read_timeout
+
+    async def initialize(self) -> None:
+        await self.request.initialize()
+
+    async def shutdown(self) -> None:
+        await self.request.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        with span(f"api.{url.rsplit('/', 1)[-1]}") as api_span:
+            code, payload = await self.request.do_request(
+                url, method, request_data=request_data, read_timeout=read_timeout,
+                write_timeout=write_timeout, connect_timeout=connect_timeout,
+                pool_timeout=pool_timeout)
+            if api_span is not None and code != 200:
+                api_span.set(status=code)
+            return code, payload
+
+
+def tracer_from_config(config: Dict[str, Any], logger,
+                       shard: Optional[Tuple[int, int]] = None) -> Optional[Tracer]:
+    """
+    Creates the tracer described by the `tracing` config section.
+
+    Args:
+        config (Dict[str, Any]): The bot's configuration dictionary.
+        logger: Logger instance.
+        shard (Optional[Tuple[int, int]]): (index, count) of a cluster worker;
+            each worker exports to its own file, e.g. traces.1.jsonl.
+
+    Returns:
+        Optional[Tracer]: The tracer, or None when tracing is disabled.
+    """
+    tracing_cfg = config.get('tracing', {})
+    if not tracing_cfg.get('enabled', True):
+        return None
+    exporter = None
+    if tracing_cfg.get('export_path'):
+        path = Path(tracing_cfg['export_path'])
+        if shard is not None:
+            path = path.with_name(f"{path.stem}.{shard[0]}{path.suffix}")
+        exporter = JsonlExporter(
+            str(path),
+            max_bytes=int(tracing_cfg.get('export_max_bytes', 50 * 1024 * 1024)))
+    return Tracer(logger,
+                  sample_rate=float(tracing_cfg.get('sample_rate', 0.01)),
+                  slow_ms=float(tracing_cfg.get('slow_ms', 1000)),
+                  exporter=exporter)